@@ -1,31 +1,198 @@
-from flask import Flask, request, jsonify, send_file
-from flask_socketio import SocketIO, emit
+import os
+# eventlet has to patch socket, select, threading and time before anything else imports them, so
+# the communication loop and recipes below run as greenlets on the server's hub. The recorders'
+# and the log's file writers stay on OS threads (recorder.py, auditlog.py).
+# EXFOLIATOR_ASYNC_MODE=threading runs the Werkzeug development server with OS threads instead.
+ASYNC_MODE = os.environ.get('EXFOLIATOR_ASYNC_MODE', 'eventlet')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    import eventlet.tpool
+    eventlet.monkey_patch()
+
+from flask import Flask, Response, request, jsonify, has_request_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
+import gzip
+import hashlib
+import signal
 import socket
+import selectors
 import threading
 import time
 import json
 import queue
 import logging
+import itertools
+from collections import deque
+from concurrent.futures import Future, wait as wait_futures
+from telemetry import TelemetryDiffer
+from broadcaster import TelemetryBroadcaster
+from history import TelemetryHistory, FIELDS as HISTORY_FIELDS, MOTOR_STATES, MOTOR_STATE_CODES
+from recorder import TelemetryRecorder
+from capture import LinkCapture, CapturePlayback, list_captures
+from recipes import RecipeStore, RecipeEngine
+from motion import MotionTracker
+from planner import ScanRunner, plan_scan
+from metrics import REGISTRY
+from auditlog import setup_logging
+import statusframe
+import commands
+import thermal
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'exfoliator-secure-key-2024'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
 
-# Configuration
+# Configuration (the EXFOLIATOR_* environment variables let simulator.py/bench.py run the bridge locally)
 ARDUINO_HOST = '192.168.4.100'  # Arduino IP
-TCP_SERVER_PORT = 1053          # TCP port to listen for Arduino
-HTTP_PORT = 80               # HTTP port for Flask
+# Stations as 'name=controller IP,...'; the first is the default for clients that don't pick one.
+DEVICES = os.environ.get('EXFOLIATOR_DEVICES', f"exfoliator={ARDUINO_HOST}")
+# Controllers from addresses DEVICES doesn't list are refused unless this is set; each then gets a
+# station named by its address (a history buffer and two writer threads) until its link goes away
+ALLOW_UNLISTED = os.environ.get('EXFOLIATOR_ALLOW_UNLISTED', '0') != '0'
+MAX_UNLISTED_STATIONS = 4
+TCP_SERVER_PORT = int(os.environ.get('EXFOLIATOR_TCP_PORT', 1053))  # TCP port to listen for Arduino
+HTTP_PORT = int(os.environ.get('EXFOLIATOR_HTTP_PORT', 80))         # HTTP port for Flask
 HTTP_HOST = '192.168.3.80'     # Flask server IP
-SERVER_HOST = '192.168.4.120'   # Raspberry Pi server IP for TCP
+SERVER_HOST = os.environ.get('EXFOLIATOR_TCP_HOST', '192.168.4.120')  # Raspberry Pi server IP for TCP
+LISTEN_BACKLOG = 16             # Pending controller connections the listener holds
+RECV_CHUNK_SIZE = 4096          # Bytes read from the controller socket per recv()
+MAX_LINE_LENGTH = 4096          # Drop a partial line that grows past this without a newline
+COMMAND_TIMEOUT = 5.0           # Seconds to wait for the controller to reply to a command
+SAFETY_COMMANDS = {'STOP'}      # Written immediately, ahead of (and flushing) queued commands
+# Commands written ahead of their replies; the rest wait on the Pi, where a STOP can still flush them
+# (fits in one Main.ino loop pass, MAX_LINES_PER_PASS)
+MAX_IN_FLIGHT = 8
+# Never resent after a reconnect: the controller may already have started them
+MOTION_COMMANDS = {'MoveX', 'MoveY', 'EnableX', 'EnableY', 'Tape'}
+# Sent fresh by resume() after every reconnect, so never replayed
+SESSION_COMMANDS = {'SetTelemetry'}
+REPLAY_WINDOW = 10.0            # Unanswered commands older than this fail instead of being resent
+LISTEN_RETRY_DELAY = 1.0        # Seconds between attempts to open the controller listener
+PING_MESSAGE = b'PING\n'         # Heartbeat; answered with PONG
+PING_INTERVAL = 0.25            # Heartbeat period; Main.ino drops the link after 1 s without a PING
+MIN_RESPONSE_TIMEOUT = 1.0      # Bounds for the adaptive "no data from the controller" timeout
+MAX_RESPONSE_TIMEOUT = 7.0      # (also the timeout until a PONG has been measured)
+HEARTBEAT_MISSES = 3            # PING intervals of silence tolerated on top of the measured RTT
+KEEPALIVE_IDLE = 1              # TCP keepalive: seconds idle before probing,
+KEEPALIVE_INTERVAL = 1          # seconds between probes,
+KEEPALIVE_COUNT = 3             # and unanswered probes before the kernel drops the link
+ESTOP_LATENCY_SAMPLES = 200     # E-stop latency measurements kept for /estop_latency
+TELEMETRY_RATE_HZ = 20.0        # Max rate telemetry is pushed to each browser
+# Status format asked of the controller on connect: 'binary' (see statusframe.py) or 'json'.
+# Firmware that doesn't know SetTelemetry rejects it and keeps sending JSON every 500 ms.
+TELEMETRY_PROTOCOL = os.environ.get('EXFOLIATOR_TELEMETRY', 'binary')
+TELEMETRY_INTERVAL_MS = 100     # Status period requested along with the binary format
+HISTORY_CAPACITY = 4 * 3600 * 10  # Status samples kept in RAM (4 h at 10 Hz, ~9 MB)
+HISTORY_MAX_BUCKETS = 2000      # Upper bound on points returned by /history per field
+# Recordings, captures, recipes and the log live next to app.py (not in the working directory, which
+# a service manager picks), unless EXFOLIATOR_DATA_DIR moves them (bench.py uses a scratch directory)
+DATA_DIR = os.environ.get('EXFOLIATOR_DATA_DIR', app.root_path)
+RECORDINGS_DIR = os.path.join(DATA_DIR, 'recordings')  # One subdirectory per station, one binary file per session
+RECIPES_DIR = os.path.join(DATA_DIR, 'recipes')        # Stored macro/recipe JSON files
+CAPTURE_DIR = os.path.join(DATA_DIR, 'captures')       # Raw controller messages, per station, one file per connection
+CAPTURE_ENABLED = os.environ.get('EXFOLIATOR_CAPTURE', '1') != '0'
+REPLAY_DEVICE = 'replay'        # Station /replay plays into unless another is named
+MOVE_WAIT_TIMEOUT = 60.0        # Default/maximum seconds a move_and_wait, /motion or /status long-poll blocks
+MAX_BATCH_COMMANDS = 500        # Longest command list /commands and send_commands accept
+DIAGNOSTICS_INTERVAL = 1.0      # Seconds between metric pushes to the 'diagnostics' Socket.IO room
+THERMAL_INTERVAL = 2.0          # Seconds between heater predictions pushed to each station's clients
+LOG_FILE = os.path.join(DATA_DIR, 'flask_app.log')  # JSON-lines audit log, rotated by size (see auditlog.py)
+SHUTDOWN_TIMEOUT = 5.0          # Seconds shutdown waits for the communication loop and recorders
+
+# Controller messages that are not replies to a command (Heater.ino / Main.ino alarms)
+UNSOLICITED_MESSAGES = {
+    'Heater Not Holding Temperature',
+    'Thermistor Out Of Range',
+    'Thermal Runaway',
+    'EMERGENCY STOPPED. Restart required.',
+}
+# Replies that mean the controller refused the command
+REJECTED_PREFIXES = ('!!!WARNING!!!', 'Unknown command', 'Invalid', 'Motor Moving Will Not')
+
+_command_ids = itertools.count(1)
+# Part of every /status ETag, so versions counted by a previous run of the bridge never match
+BOOT_ID = format(int(time.time()), 'x')
+
+def parse_devices(spec):
+    """'name=ip,name=ip' -> {ip: name}, keeping the order they were listed in"""
+    devices = {}
+    for entry in spec.split(','):
+        name, _, address = entry.strip().partition('=')
+        if name and address:
+            devices[address.strip()] = name.strip()
+    return devices
+
+# Hot-path instrumentation, served at /metrics and pushed to the 'diagnostics' Socket.IO room
+QUEUE_WAIT = REGISTRY.histogram('exfoliator_command_queue_wait_seconds',
+                                'Time a command spent in command_queue before it was written')
+COMMAND_RTT = REGISTRY.histogram('exfoliator_command_rtt_seconds',
+                                 'Time from writing a command to the controller\'s reply')
+COMMANDS = REGISTRY.counter('exfoliator_commands_total', 'Commands finished, by outcome', label='status')
+SEND_SECONDS = REGISTRY.histogram('exfoliator_socket_send_seconds', 'Time spent in sendall() to the controller')
+RECV_SECONDS = REGISTRY.histogram('exfoliator_socket_recv_seconds', 'Time spent in recv() from the controller')
+BYTES_SENT = REGISTRY.counter('exfoliator_socket_sent_bytes_total', 'Bytes written to the controller')
+BYTES_RECEIVED = REGISTRY.counter('exfoliator_socket_received_bytes_total', 'Bytes read from the controller')
+PARSE_SECONDS = REGISTRY.histogram('exfoliator_status_parse_seconds',
+                                   'Time to parse and apply one status frame, including fan-out to the broadcaster')
+STATUS_FRAMES = REGISTRY.counter('exfoliator_status_frames_total', 'Status frames received from the controller')
+PARSE_ERRORS = REGISTRY.counter('exfoliator_status_parse_errors_total', 'Status frames that failed to parse')
+FRAMES_LOST = REGISTRY.counter('exfoliator_status_frames_lost_total',
+                               'Binary status frames missing from the sequence, or dropped for a bad CRC/version')
+PING_RTT = REGISTRY.histogram('exfoliator_ping_rtt_seconds', 'PING to PONG round trip')
+RECONNECT_SECONDS = REGISTRY.histogram('exfoliator_reconnect_seconds',
+                                       'Time a station was without its controller link before it came back',
+                                       buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+REPLAYED = REGISTRY.counter('exfoliator_commands_replayed_total', 'Unanswered commands resent after a reconnect')
+
+class PendingCommand:
+    """A command on its way to the controller, resolved when the controller replies to it"""
+    def __init__(self, command, sid=None, device=None):
+        self.id = next(_command_ids)
+        self.command = command.text  # A commands.Command
+        self.encoded = command.encoded
+        self.sid = sid  # Socket.IO client that asked for it, if any
+        self.device = device
+        self.queued_at = time.time()
+        self.sent_at = None
+        self.future = Future()
+
+    def result(self, status, response=None):
+        now = time.time()
+        return {
+            'id': self.id,
+            'device': self.device,
+            'command': self.command,
+            'status': status,
+            'response': response,
+            'queue_ms': round(((self.sent_at or now) - self.queued_at) * 1000, 1),
+            'rtt_ms': round((now - self.sent_at) * 1000, 1) if self.sent_at else None
+        }
 
 class ArduinoTCPServer:
-    def __init__(self):
-        self.server_socket = None
+    """One station's controller link: its socket, command queue, heartbeat and machine state"""
+    def __init__(self, device_id, hub):
+        self.device_id = device_id
+        self.hub = hub
+        self.room = f"device:{device_id}"  # Socket.IO room of the clients watching this station
+        self.address = None
         self.client_socket = None
         self.connected = False
-        self.command_queue = queue.Queue()
+        self.command_queue = queue.Queue()  # PendingCommands, or lists of them from enqueue_batch()
+        self.in_flight = deque()  # Sent commands awaiting a reply, oldest first
+        self.batch_remainder = deque()  # Unsent tail of the batch being written; goes out before the queue
+        self.last_reply_at = 0.0  # When the controller last answered one of them
+        # Serialises writes so the wire order always matches in_flight, including safety
+        # commands written straight from a Socket.IO handler thread
+        self.send_lock = threading.Lock()
+        self.estop_latency = {
+            'handler_to_wire': deque(maxlen=ESTOP_LATENCY_SAMPLES),  # Measured on the Pi
+            'click_to_ack': deque(maxlen=ESTOP_LATENCY_SAMPLES)      # Reported by the browser
+        }
+        self.recv_buffer = b''  # Partial line or binary frame carried over between recv() calls
+        self.protocol = 'json'  # Status format the controller agreed to send on this link
+        self.frame_seq = None   # Sequence number of the last binary status frame
         self.temperature = 0
         self.set_temperature = 0
         self.position = {'x': 0, 'y': 0}
@@ -42,95 +209,472 @@ class ArduinoTCPServer:
         }
         # PING/PONG heartbeat tracking
         self.last_ping_sent = time.time()
-        self.ping_interval = 2.0  # Send PING every 2 seconds
+        self.ping_interval = PING_INTERVAL
         self.last_response_received = time.time()  # Any response (JSON, PONG, etc.)
-        self.response_timeout = 7.0  # Consider disconnected if no response for 7 seconds
+        self.ping_outstanding = False  # A PING went out and its PONG has not come back yet
+        # Consider the link dead after this long without data; tightened from the measured PONG RTT
+        self.response_timeout = MAX_RESPONSE_TIMEOUT
+        self.srtt = None    # Smoothed PONG round trip
+        self.rttvar = None  # and its mean deviation
+        self.disconnected_at = None
+        self.replay = []  # Unanswered non-motion commands held across a dropped link
         self.estop_triggered = False
-        
-    def start_server(self):
-        try:
-            if self.server_socket:
-                self.server_socket.close()
-            
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((SERVER_HOST, TCP_SERVER_PORT))
-            self.server_socket.listen(1)
-            self.server_socket.settimeout(1.0)  # Non-blocking accept
-            logging.info(f"TCP Server listening on port {TCP_SERVER_PORT}")
-            return True
-        except Exception as e:
-            logging.error(f"Failed to start TCP server: {e}")
-            return False
-    
-    def wait_for_connection(self):
-        try:
-            if not self.server_socket:
-                return False
-                
-            self.client_socket, addr = self.server_socket.accept()
-            self.client_socket.settimeout(1.0)  # Non-blocking recv
-            self.connected = True
-            self.last_ping_sent = time.time()
-            self.last_response_received = time.time()
-            socketio.emit('arduino_connection_status', {'connected': True})
-            logging.info(f"Device connected from {addr}")
-            return True
-        except socket.timeout:
-            return False
-        except Exception as e:
-            logging.error(f"Failed to accept connection: {e}")
-            return False
-    
-    def disconnect(self):
+        self.telemetry = TelemetryDiffer()
+        self.history = TelemetryHistory(HISTORY_CAPACITY)
+        self.thermal = thermal.ThermalModel(self.history)
+        self.recorder = TelemetryRecorder(os.path.join(RECORDINGS_DIR, device_id))
+        self.capture = LinkCapture(os.path.join(CAPTURE_DIR, device_id))
+        self.playback = None  # CapturePlayback feeding this station instead of a controller
+        # Notified after every status frame so recipes and other waiters can block on telemetry
+        self.state_changed = threading.Condition()
+        self.frame_count = 0
+        # /status body, serialised once per change and served as-is; see refresh_status()
+        self.status_version = 0
+        self.status_sample = None
+        self.status_cache = (0, b'')
+        self.refresh_status()
+        self.recipes = RecipeEngine(self, self.emit)
+        self.motion = MotionTracker(self, on_complete=lambda move: self.emit('move_complete', move.result()))
+        self.scans = ScanRunner(self, self.emit)
+
+    def emit(self, event, data):
+        """Send an event to the clients watching this station, tagged with its device id"""
+        socketio.emit(event, dict(data, device=self.device_id), to=self.room)
+
+    def attach(self, client_socket, addr):
+        """Take over a freshly accepted controller connection"""
+        if self.client_socket:
+            # The controller reconnected before we noticed the old link die
+            logging.warning("%s reconnected from %s, dropping its previous link", self.device_id, addr[0])
+            self.disconnect()
+        self.client_socket = client_socket
+        self.client_socket.settimeout(1.0)  # Bounds send(); recv() only runs once select() reports data
+        tune_socket(self.client_socket)
+        self.address = addr[0]
+        self.recv_buffer = b''
+        self.protocol = 'json'  # Main.ino starts every connection in JSON
+        self.frame_seq = None
+        if self.playback:
+            self.playback.stop()  # A real controller takes over from a replay
+        self.hub.selector.register(self.client_socket, selectors.EVENT_READ, self)
+        self.connected = True
+        self.recorder.new_session()
+        self.capture.new_session()
+        self.last_ping_sent = time.time()
+        self.last_response_received = time.time()
+        self.ping_outstanding = False
+        self.emit('arduino_connection_status', {'connected': True})
+        self.refresh_status()
+        logging.info("Device %s connected from %s", self.device_id, addr)
+        self.resume()
+
+    def resume(self):
+        """Pick up where a dropped link left off: push a full snapshot with the next status
+        frame and resend held commands ahead of anything still queued"""
+        if self.disconnected_at:
+            RECONNECT_SECONDS.observe(time.time() - self.disconnected_at)
+            logging.info("%s was without its controller for %.2fs", self.device_id,
+                         time.time() - self.disconnected_at)
+            self.disconnected_at = None
+        self.telemetry.reset()
+        replay, self.replay = self.replay, []
+        for pending in replay:
+            with self.send_lock:
+                sent = self.write_pending(pending)
+            if not sent:
+                complete_command(pending, 'send_failed')
+            else:
+                REPLAYED.inc()
+                logging.info("Replayed '%s' to %s after reconnecting", pending.command, self.device_id)
+        if TELEMETRY_PROTOCOL == 'binary':
+            self.negotiate_telemetry()
+
+    def negotiate_telemetry(self):
+        """Ask the controller for binary status frames; a rejection leaves the link on JSON"""
+        pending = self.enqueue_command(commands.build('SetTelemetry', 'binary', TELEMETRY_INTERVAL_MS))
+
+        def negotiated(future):
+            result = future.result()
+            if result['status'] == 'ok' and (result['response'] or '').startswith('Telemetry binary'):
+                self.protocol = 'binary'
+                logging.info("%s switched to binary telemetry: %s", self.device_id, result['response'])
+            else:
+                logging.info("%s keeps JSON telemetry (SetTelemetry %s: %s)", self.device_id,
+                             result['status'], result['response'])
+        pending.future.add_done_callback(negotiated)
+
+    def disconnect(self, resumable=True):
+        """Drop the controller link. Unless resumable is False (an operator disconnect),
+        unanswered non-motion commands are held and resent when the controller reconnects."""
         self.connected = False
+        if self.disconnected_at is None:
+            self.disconnected_at = time.time()
+        if resumable:
+            while self.in_flight:
+                pending = self.in_flight.popleft()
+                name = pending.command.split()[0]
+                if name in MOTION_COMMANDS or name in SESSION_COMMANDS:
+                    complete_command(pending, 'disconnected')
+                else:
+                    self.replay.append(pending)
+        else:
+            self.fail_in_flight('disconnected')
+            self.expire_replays(expire_all=True)
         if self.client_socket:
+            self.hub.unregister(self.client_socket)
             try:
                 self.client_socket.close()
             except:
                 pass
             self.client_socket = None
-        if self.server_socket:
+        self.recv_buffer = b''
+        self.emit('arduino_connection_status', {'connected': False})
+        self.refresh_status()
+
+    def snapshot(self):
+        """Current machine state keyed by the controller's status JSON field names"""
+        return {
+            'x': self.position['x'],
+            'y': self.position['y'],
+            'stateX': self.motor_states['x'],
+            'stateY': self.motor_states['y'],
+            'tape': [self.tape['speed'], self.tape['torque']],
+            'nozzle': self.pneumatics['nozzle'],
+            'stage': self.pneumatics['stage'],
+            'stamp': self.pneumatics['stamp'],
+            'vacnozzle': self.vacuums['vacnozzle'],
+            'chuck': self.vacuums['chuck'],
+            'settemp': self.set_temperature,
+            'temp': self.temperature,
+            'eStopTriggered': self.estop_triggered
+        }
+
+    def sample(self):
+        """Current state as numbers in history.FIELDS order"""
+        return (
+            self.position['x'], self.position['y'],
+            MOTOR_STATE_CODES.get(self.motor_states['x'], 0),
+            MOTOR_STATE_CODES.get(self.motor_states['y'], 0),
+            self.tape['speed'], self.tape['torque'],
+            self.pneumatics['nozzle'], self.pneumatics['stage'], self.pneumatics['stamp'],
+            self.vacuums['vacnozzle'], self.vacuums['chuck'],
+            self.set_temperature, self.temperature, self.estop_triggered
+        )
+
+    def status(self):
+        """The /status view of this station"""
+        return {
+            'device': self.device_id,
+            'connected': self.connected,
+            'temperature': self.temperature,
+            'set_temperature': self.set_temperature,
+            'position': self.position,
+            'motor_states': self.motor_states,
+            'pneumatics': self.pneumatics,
+            'vacuums': self.vacuums,
+            'tape': self.tape
+        }
+
+    def refresh_status(self, sample=None):
+        """Re-serialise the /status body under a new version, unless sample shows nothing changed.
+        Wakes /status?since= long-polls waiting for it."""
+        if sample is not None and sample == self.status_sample:
+            return
+        with self.state_changed:
+            self.status_sample = sample
+            self.status_version += 1
+            body = json.dumps(dict(self.status(), version=self.status_version), separators=(',', ':'))
+            self.status_cache = (self.status_version, body.encode())
+            self.state_changed.notify_all()
+
+    def wait_for_status(self, since, timeout):
+        """Block until the /status version is past since; returns the current (version, body)"""
+        deadline = time.time() + timeout
+        with self.state_changed:
+            while self.status_version <= since:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.state_changed.wait(remaining)
+            return self.status_cache
+
+    def notify_state(self):
+        """Wake everything blocked in wait_for_state() after a status frame was applied"""
+        with self.state_changed:
+            self.frame_count += 1
+            self.state_changed.notify_all()
+
+    def wake_state_waiters(self):
+        """Make waiters re-check their predicate without a new frame (e.g. to notice a stop request)"""
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+    def wait_for_state(self, predicate, timeout, after_frame=None):
+        """Block until a status frame newer than after_frame makes predicate(snapshot) true.
+        Returns False on timeout."""
+        deadline = time.time() + timeout
+        with self.state_changed:
+            while True:
+                if (after_frame is None or self.frame_count > after_frame) and predicate(self.snapshot()):
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.state_changed.wait(remaining)
+
+    def enqueue_command(self, command, sid=None):
+        """Queue a command (a commands.Command, or text that commands.parse() accepts, else
+        ValueError) and wake the communication loop so it goes out immediately.
+        Safety commands bypass the queue, see send_priority()."""
+        if isinstance(command, str):
+            command = commands.parse(command)
+        pending = PendingCommand(command, sid, self.device_id)
+        if command.name in SAFETY_COMMANDS:
+            self.send_priority(pending)
+        else:
+            self.command_queue.put(pending)
+            self.hub.wake()
+        return pending
+
+    def enqueue_batch(self, command_list):
+        """Queue commands.Command objects as one unit: they go out back-to-back, MAX_IN_FLIGHT per
+        write, with nothing from other clients interleaved"""
+        batch = [PendingCommand(command, None, self.device_id) for command in command_list]
+        self.command_queue.put(batch)
+        self.hub.wake()
+        return batch
+
+    def send_priority(self, pending):
+        """Drop every queued command and write this one from the calling thread right away"""
+        with self.send_lock:
+            flushed = self.flush_queue()
+            sent = self.write_pending(pending)
+        for stale in flushed:
+            complete_command(stale, 'flushed')
+        if flushed:
+            logging.warning("%s flushed %s queued command(s)", pending.command, len(flushed))
+        if not sent:
+            complete_command(pending, 'send_failed')
+        self.hub.wake()  # Let the loop account for the new in-flight command's timeout
+
+    def flush_queue(self):
+        flushed = list(self.batch_remainder)
+        self.batch_remainder.clear()
+        while True:
             try:
-                self.server_socket.close()
-            except:
-                pass
-            self.server_socket = None
-        socketio.emit('arduino_connection_status', {'connected': False})
+                item = self.command_queue.get_nowait()
+            except queue.Empty:
+                return flushed
+            flushed.extend(item if isinstance(item, list) else [item])
+
+    def write_pending(self, pending):
+        """Put a command on the wire and start waiting for its reply; caller holds send_lock"""
+        if not self.send_command(pending.command, pending.encoded):
+            return False
+        pending.sent_at = time.time()
+        self.in_flight.append(pending)
+        QUEUE_WAIT.observe(pending.sent_at - pending.queued_at)
+        return True
+
+    def write_batch(self, batch):
+        """write_pending() for a whole batch, in one sendall(); caller holds send_lock"""
+        message = b''.join(pending.encoded for pending in batch)
+        if not self.send_bytes(message):
+            return False
+        logging.info("Sent batch of %s commands: %s ... %s", len(batch), batch[0].command, batch[-1].command)
+        sent_at = time.time()
+        for pending in batch:
+            pending.sent_at = sent_at
+            QUEUE_WAIT.observe(sent_at - pending.queued_at)
+        self.in_flight.extend(batch)
+        return True
+
+    def dispatch_queued(self):
+        """Write queued commands while fewer than MAX_IN_FLIGHT await a reply. The communication loop
+        calls this after every read, so more go out as replies are matched."""
+        while True:
+            # Take and write under the lock so a safety command can never land behind a
+            # motion command that was already dequeued
+            with self.send_lock:
+                room = MAX_IN_FLIGHT - len(self.in_flight)
+                if room <= 0:
+                    return True
+                if self.batch_remainder:
+                    chunk = [self.batch_remainder.popleft() for _ in range(min(room, len(self.batch_remainder)))]
+                    sent = self.write_batch(chunk)
+                else:
+                    try:
+                        item = self.command_queue.get_nowait()
+                    except queue.Empty:
+                        return True
+                    if isinstance(item, list):
+                        self.batch_remainder.extend(item)
+                        continue
+                    chunk = [item]
+                    sent = self.write_pending(item)
+                if not sent:
+                    # The rest of a batch fails with it rather than running without its head
+                    chunk.extend(self.batch_remainder)
+                    self.batch_remainder.clear()
+            if not sent:
+                for pending in chunk:
+                    complete_command(pending, 'send_failed')
+                return False
+
+    def match_reply(self, response):
+        """Return the oldest in-flight command, which the controller answers next, or None"""
+        if response in UNSOLICITED_MESSAGES or not self.in_flight:
+            return None
+        self.last_reply_at = time.time()
+        return self.in_flight.popleft()
+
+    def reply_deadline(self):
+        """When the oldest in-flight command times out. The controller answers one command per
+        loop pass, in order, so the clock starts once the command is sent and everything ahead
+        of it is answered; a long pipelined batch doesn't time out its own tail."""
+        return max(self.in_flight[0].sent_at, self.last_reply_at) + COMMAND_TIMEOUT
+
+    def expire_commands(self):
+        """Fail in-flight commands the controller never answered"""
+        now = time.time()
+        while self.in_flight and now > self.reply_deadline():
+            pending = self.in_flight.popleft()
+            logging.warning("No reply to command '%s' after %ss", pending.command, COMMAND_TIMEOUT)
+            complete_command(pending, 'timeout')
+
+    def fail_in_flight(self, status):
+        while self.in_flight:
+            complete_command(self.in_flight.popleft(), status)
+
+    def expire_replays(self, expire_all=False):
+        """Fail held commands once the controller has been gone longer than REPLAY_WINDOW"""
+        now = time.time()
+        keep = []
+        for pending in self.replay:
+            if expire_all or now - pending.queued_at > REPLAY_WINDOW:
+                complete_command(pending, 'disconnected')
+            else:
+                keep.append(pending)
+        self.replay = keep
+
+    def next_timeout(self):
+        """Seconds until the heartbeat next needs attention, or None to wait for socket activity only"""
+        if not self.connected:
+            if self.replay:  # Held commands still need expiring if the controller stays away
+                return max(0.0, self.replay[0].queued_at + REPLAY_WINDOW - time.time())
+            return None
+        deadline = min(self.last_ping_sent + self.ping_interval,
+                       self.last_response_received + self.response_timeout)
+        if self.in_flight:
+            deadline = min(deadline, self.reply_deadline())
+        return max(0.0, deadline - time.time())
         
-    def send_command(self, command):
+    def send_command(self, command, encoded=None):
+        """Write one command; encoded is its wire form when the caller already has it"""
+        if not self.send_bytes(encoded or f"{command}\n".encode(), command):
+            return False
+        logging.info("Sent command: %s", command)
+        return True
+
+    def send_bytes(self, message, description='batch'):
+        """Write newline-terminated command text to the controller"""
         if not self.connected or not self.client_socket:
-            logging.warning(f"Cannot send command '{command}' - Arduino not connected")
+            logging.warning("Cannot send command '%s' - %s not connected", description, self.device_id)
             return False
         try:
-            message = f"{command}\n"
-            self.client_socket.send(message.encode())
-            logging.info(f"Sent command: {command}")
+            started = time.perf_counter()
+            self.client_socket.sendall(message)
+            SEND_SECONDS.observe(time.perf_counter() - started)
+            BYTES_SENT.inc(len(message))
             return True
         except Exception as e:
-            logging.error(f"Failed to send command '{command}': {e}")
+            logging.error("Failed to send command '%s': %s", description, e)
             self.connected = False
-            socketio.emit('arduino_connection_status', {'connected': False})
+            self.emit('arduino_connection_status', {'connected': False})
             return False
     
     def read_response(self):
+        """Return every complete message received so far, in order: text lines as str and
+        binary status frames as bytes. A partial line or frame is kept in recv_buffer until
+        the rest of it arrives."""
         if not self.connected or not self.client_socket:
-            return None
+            return []
         try:
-            response = self.client_socket.recv(1024).decode().strip()
-            if response:
-                logging.debug(f"Received response: {response}")
-                # Update heartbeat for ANY response received
-                self.last_response_received = time.time()
-            return response
+            started = time.perf_counter()
+            data = self.client_socket.recv(RECV_CHUNK_SIZE)
+            RECV_SECONDS.observe(time.perf_counter() - started)
         except socket.timeout:
-            return None
+            return []
         except Exception as e:
-            if e.errno != 11:  # Ignore "Resource temporarily unavailable" 
-                logging.error(f"Failed to read response: {e}")
+            if getattr(e, 'errno', None) != 11:  # Ignore "Resource temporarily unavailable"
+                logging.error("Failed to read response: %s", e)
                 self.connected = False
-                socketio.emit('arduino_connection_status', {'connected': False})
-            return None
+                self.emit('arduino_connection_status', {'connected': False})
+            return []
+        if not data:
+            # An orderly shutdown from the controller; without this the closed socket stays readable forever
+            logging.warning("Controller %s closed the connection", self.device_id)
+            self.connected = False
+            self.emit('arduino_connection_status', {'connected': False})
+            return []
+
+        # Update heartbeat for ANY data received
+        self.last_response_received = time.time()
+        BYTES_RECEIVED.inc(len(data))
+        buffer = self.recv_buffer + data
+        if statusframe.MAGIC in buffer:
+            lines, self.recv_buffer = self.split_frames(buffer)
+        else:
+            *lines, self.recv_buffer = buffer.split(b'\n')
+        if len(self.recv_buffer) > MAX_LINE_LENGTH:
+            logging.warning("Discarding %s bytes without a newline from controller", len(self.recv_buffer))
+            self.recv_buffer = b''
+
+        responses = []
+        for line in lines:
+            if line[:2] == statusframe.MAGIC:
+                responses.append(line)
+                continue
+            response = line.decode(errors='replace').strip()
+            if response:
+                logging.debug("Received response: %s", response)
+                responses.append(response)
+        if CAPTURE_ENABLED:
+            for response in responses:
+                self.capture.record(self.last_response_received, response)
+        return responses
+
+    def split_frames(self, buffer):
+        """Cut a buffer holding binary status frames into frames and text lines.
+        Returns (messages, leftover). A frame with a bad CRC or unknown version is dropped
+        whole; TCP already guarantees the byte count, so the next message starts right after it."""
+        messages = []
+        start = 0
+        while start < len(buffer):
+            if buffer.startswith(statusframe.MAGIC, start):
+                end = start + statusframe.SIZE
+                if end > len(buffer):
+                    break
+                frame = buffer[start:end]
+                if statusframe.valid(frame):
+                    messages.append(frame)
+                else:
+                    FRAMES_LOST.inc()
+                    logging.warning("Dropped a corrupt binary status frame from %s", self.device_id)
+                start = end
+                continue
+            newline = buffer.find(b'\n', start)
+            magic = buffer.find(statusframe.MAGIC, start)
+            if newline < 0 or 0 <= magic < newline:
+                if magic < 0:
+                    break
+                # Main.ino ends every line before writing a frame, so whatever precedes one is debris
+                logging.debug("Skipped %s bytes before a binary status frame", magic - start)
+                start = magic
+            else:
+                messages.append(buffer[start:newline])
+                start = newline + 1
+        return messages, buffer[start:]
     
     def should_send_ping(self):
         """Check if it's time to send a PING"""
@@ -138,12 +682,33 @@ class ArduinoTCPServer:
     
     def send_ping(self):
         """Send PING command and update timestamp"""
-        if self.send_command("PING"):
+        with self.send_lock:
+            sent = self.send_bytes(PING_MESSAGE, 'PING')  # Four per second; no audit line
+        if sent:
             self.last_ping_sent = time.time()
-            logging.debug("PING sent")
+            self.ping_outstanding = True
             return True
         return False
     
+    def pong_received(self):
+        """Record the heartbeat round trip; firmware without PONG support simply never calls this"""
+        if self.ping_outstanding:
+            rtt = time.time() - self.last_ping_sent
+            PING_RTT.observe(rtt)
+            self.ping_outstanding = False
+            self.update_response_timeout(rtt)
+
+    def update_response_timeout(self, rtt):
+        """Track the PONG round trip like TCP's RTO estimator (RFC 6298) and size the
+        heartbeat timeout from it, so a dead link is noticed quickly without tripping on jitter"""
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        timeout = HEARTBEAT_MISSES * self.ping_interval + self.srtt + 4 * self.rttvar
+        self.response_timeout = min(MAX_RESPONSE_TIMEOUT, max(MIN_RESPONSE_TIMEOUT, timeout))
+
     def check_connection_health(self):
         """Check if we've received any response recently enough to consider connection alive"""
         if not self.connected:
@@ -151,462 +716,1228 @@ class ArduinoTCPServer:
             
         time_since_last_response = time.time() - self.last_response_received
         if time_since_last_response > self.response_timeout:
-            logging.warning(f"Connection timeout - {time_since_last_response:.2f}s since last response")
+            logging.warning("Connection timeout on %s - %.2fs since last response",
+                            self.device_id, time_since_last_response)
             self.disconnect()
             return False
         return True
 
-arduino_server = ArduinoTCPServer()
+def tune_socket(sock):
+    """Low-latency, self-checking controller socket: no Nagle delay, and kernel keepalive
+    (plus a bound on unacknowledged data, where supported) so a dead peer is noticed quickly"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                          ('TCP_KEEPCNT', KEEPALIVE_COUNT),
+                          ('TCP_USER_TIMEOUT', int(MAX_RESPONSE_TIMEOUT * 1000))):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
 
-def arduino_communication_thread():
-    """Background thread for Arduino communication"""
-    while True:
+class ControllerHub:
+    """Owns the controller listener and the single selector loop that serves every station.
+
+    Links are keyed by device id: the name DEVICES gives the controller's address, or (with
+    ALLOW_UNLISTED) the address itself. A station that reconnects takes over its existing link,
+    so its queue, history and Socket.IO room carry over; an unlisted station is removed once its
+    controller is gone.
+    """
+    def __init__(self, devices):
+        self.names = parse_devices(devices)
+        self.server_socket = None
+        self.devices = {}
+        self.unlisted = set()  # Ids of stations created for controllers DEVICES doesn't list
+        self.refused = set()   # Unlisted addresses already warned about
+        self.lock = threading.Lock()
+        # The communication loop sleeps in select() until a socket is readable, a command is
+        # enqueued (signalled through the wakeup socketpair) or a heartbeat timer is due
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        self.stopping = threading.Event()
+        self.stopped = threading.Event()  # Set by the communication loop on its way out
+        for name in self.names.values():
+            self.device(name, create=True)
+        self.default_device = next(iter(self.names.values()), None)
+
+    def device(self, device_id, create=False):
+        """The link for a device id, or None; create=True adds (and starts recording for) a new station"""
+        with self.lock:
+            server = self.devices.get(device_id)
+            if server is None and create:
+                server = self.devices[device_id] = ArduinoTCPServer(device_id, self)
+                server.recorder.start()
+                if CAPTURE_ENABLED:
+                    server.capture.start()
+            return server
+
+    def links(self):
+        return list(self.devices.values())
+
+    def start_server(self):
         try:
-            # Try to start server if not connected
-            if not arduino_server.connected:
-                if not arduino_server.start_server():
-                    time.sleep(5)
-                    continue
-                    
-                # Try to accept connection (non-blocking)
-                if not arduino_server.wait_for_connection():
-                    time.sleep(0.1)
-                    continue
-            
-            # Send PING if it's time
-            if arduino_server.connected and arduino_server.should_send_ping():
-                arduino_server.send_ping()
+            if self.server_socket:
+                self.unregister(self.server_socket)
+                self.server_socket.close()
             
-            # Process command queue
-            while not arduino_server.command_queue.empty():
-                command = arduino_server.command_queue.get()
-                success = arduino_server.send_command(command)
-                
-                if success:
-                    # Wait a bit for response
-                    time.sleep(0.1)
-                    response = arduino_server.read_response()
-                    if response:
-                        # Try to parse JSON status updates
-                        if response.startswith('{') and response.endswith('}'):
-                            parse_json_status(response)
-                        elif response == "PONG":
-                            logging.debug("PONG received")
-                            # PONG response already updated last_response_received in read_response()
-                        else:
-                            socketio.emit('machine_response', {'response': response})
-                            logging.info(f"Arduino response: {response}")
-                
-            # Check connection health
-            if arduino_server.connected:
-                if not arduino_server.check_connection_health():
-                    logging.warning("Connection health check failed - Arduino disconnected")
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((SERVER_HOST, TCP_SERVER_PORT))
+            self.server_socket.listen(LISTEN_BACKLOG)
+            self.server_socket.setblocking(False)  # accept() only runs once select() reports it ready
+            self.selector.register(self.server_socket, selectors.EVENT_READ)
+            logging.info("TCP Server listening on port %s", TCP_SERVER_PORT)
+            return True
+        except Exception as e:
+            logging.error("Failed to start TCP server: %s", e)
+            if self.server_socket:
+                self.server_socket.close()
+                self.server_socket = None  # Retried by the communication loop
+            return False
+
+    def accept(self):
+        """Accept one pending controller connection and hand it to its station's link"""
+        try:
+            client_socket, addr = self.server_socket.accept()
+        except (socket.timeout, BlockingIOError):
+            return None
+        except Exception as e:
+            logging.error("Failed to accept connection: %s", e)
+            return None
+        device_id = self.names.get(addr[0])
+        if device_id is None:
+            device_id = addr[0]
+            if not self.admit_unlisted(device_id):
+                client_socket.close()
+                return None
+        server = self.device(device_id, create=True)
+        server.attach(client_socket, addr)
+        return server
+
+    def admit_unlisted(self, address):
+        """Whether a controller from an address DEVICES doesn't list may have a station"""
+        with self.lock:
+            if address in self.unlisted:
+                return True
+            if ALLOW_UNLISTED and len(self.unlisted) < MAX_UNLISTED_STATIONS:
+                self.unlisted.add(address)
+                return True
+        if address not in self.refused:
+            self.refused.add(address)
+            logging.warning("Refused controller from unlisted address %s (%s)", address,
+                            'MAX_UNLISTED_STATIONS reached' if ALLOW_UNLISTED else 'not in EXFOLIATOR_DEVICES')
+        return False
+
+    def remove(self, server):
+        """Drop an unlisted station whose controller has gone: stop what runs on it, fail what is
+        still queued and let its writers finish the files"""
+        with self.lock:
+            self.devices.pop(server.device_id, None)
+            self.unlisted.discard(server.device_id)
+        server.recipes.stop('disconnected')
+        server.scans.stop('disconnected')
+        for pending in server.flush_queue():
+            complete_command(pending, 'disconnected')
+        server.recorder.stop(0)
+        server.capture.stop(0)
+        logging.info("Removed unlisted station %s, its controller is gone", server.device_id)
+
+    def unregister(self, sock):
+        """Stop watching a socket in the communication loop's selector"""
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def wake(self):
+        """Interrupt the communication loop's select() from another thread"""
+        try:
+            self.wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # A wakeup is already pending
+
+    def drain_wakeups(self):
+        """Discard pending wakeup bytes once the loop is awake"""
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def next_timeout(self):
+        """Seconds until some link's heartbeat or command timeout is due, or None if none is connected"""
+        timeouts = [timeout for timeout in (server.next_timeout() for server in self.links()) if timeout is not None]
+        return min(timeouts) if timeouts else None
+
+    def stop(self):
+        """Ask the communication loop to exit after its current pass"""
+        self.stopping.set()
+        self.wake()
+
+    def close(self):
+        """Once the communication loop has exited: stop recipes, drop every controller link (failing
+        what is still queued or in flight), stop listening and flush the recordings"""
+        for server in self.links():
+            server.recipes.stop('shutdown')
+            server.scans.stop('shutdown')
+            if server.playback:
+                server.playback.stop()
+            if server.client_socket:
+                server.disconnect(resumable=False)
+            for pending in server.flush_queue():
+                complete_command(pending, 'shutdown')
+        if self.server_socket:
+            self.unregister(self.server_socket)
+            self.server_socket.close()
+            self.server_socket = None
+        for server in self.links():
+            server.recorder.stop(SHUTDOWN_TIMEOUT)
+            server.capture.stop(SHUTDOWN_TIMEOUT)
+
+hub = ControllerHub(DEVICES)
+broadcaster = TelemetryBroadcaster(socketio, rate_hz=TELEMETRY_RATE_HZ)
+recipe_store = RecipeStore(RECIPES_DIR)
+client_devices = {}  # sid -> device id the client is watching
+diagnostics_subscribers = set()  # sids in the 'diagnostics' room
+
+# Gauges are only evaluated when someone scrapes /metrics or subscribes to diagnostics
+REGISTRY.gauge('exfoliator_command_queue_depth', 'Commands waiting in command_queue, all stations',
+               lambda: sum(server.command_queue.qsize() for server in hub.links()))
+REGISTRY.gauge('exfoliator_commands_in_flight', 'Commands written and awaiting a reply, all stations',
+               lambda: sum(len(server.in_flight) for server in hub.links()))
+REGISTRY.gauge('exfoliator_controllers_connected', 'Stations whose controller link is up',
+               lambda: sum(server.connected for server in hub.links()))
+REGISTRY.gauge('exfoliator_socketio_clients', 'Browsers receiving telemetry',
+               lambda: broadcaster.stats()['clients'])
+REGISTRY.gauge('exfoliator_telemetry_coalesced_frames', 'Telemetry frames superseded before a client took them',
+               lambda: broadcaster.stats()['dropped'])
+
+def arduino_communication_thread():
+    """Background task serving every controller link, woken by the selector instead of polling"""
+    while not hub.stopping.is_set():
+        try:
+            # Clean up links that failed mid-send/recv, then make sure we are listening
+            for server in hub.links():
+                if not server.connected and server.client_socket:
+                    server.disconnect()
+            if not hub.server_socket:
+                if not hub.start_server():
+                    socketio.sleep(LISTEN_RETRY_DELAY)
                     continue
-                
-                # Read any incoming responses (JSON, PONG, etc.)
-                response = arduino_server.read_response()
-                if response:
-                    if response.startswith('{') and response.endswith('}'):
-                        parse_json_status(response)
-                    elif response == "PONG":
-                        logging.debug("PONG received")
-                        # Response timestamp already updated in read_response()
-                    else:
-                        socketio.emit('machine_response', {'response': response})
-                        logging.info(f"Arduino response: {response}")
-            
-            time.sleep(0.1)  # Check frequently for responses
-            
+
+            # Sleep until a socket is readable, a command is enqueued or a heartbeat is due
+            for key, _ in hub.selector.select(hub.next_timeout()):
+                if key.fileobj is hub.wakeup_recv:
+                    hub.drain_wakeups()
+                elif key.fileobj is hub.server_socket:
+                    hub.accept()
+                else:
+                    # Read any incoming responses (JSON, PONG, etc.) from that station
+                    server = key.data
+                    for response in server.read_response():
+                        handle_controller_message(server, response)
+
+            for server in hub.links():
+                if server.connected:
+                    service_link(server)
+                elif server.replay:
+                    server.expire_replays()
+                elif server.device_id in hub.unlisted and not (server.playback and not server.playback.done):
+                    hub.remove(server)
+
         except Exception as e:
-            logging.error(f"Communication thread error: {e}")
-            arduino_server.connected = False
-            socketio.emit('arduino_connection_status', {'connected': False})
-            time.sleep(1)
+            logging.error("Communication thread error: %s", e)
+            socketio.sleep(1)
+    hub.stopped.set()
+
+def service_link(server):
+    """Timers and queued writes for one connected station; a failure only takes down that link"""
+    try:
+        # Pipeline queued commands onto the wire and time out unanswered ones
+        server.dispatch_queued()
+        server.expire_commands()
+
+        # Send PING if it's time
+        if server.connected and server.should_send_ping():
+            server.send_ping()
+
+        # Check connection health
+        if server.connected and not server.check_connection_health():
+            logging.warning("Connection health check failed - %s disconnected", server.device_id)
+    except Exception as e:
+        logging.error("Communication error on %s: %s", server.device_id, e)
+        server.connected = False
+        server.emit('arduino_connection_status', {'connected': False})
+
+def handle_controller_message(server, response):
+    """Route one complete message from a station's controller"""
+    if isinstance(response, bytes):
+        parse_binary_status(server, response)
+    elif response.startswith('{') and response.endswith('}'):
+        parse_json_status(server, response)
+    elif response == "PONG":
+        logging.debug("PONG received")
+        server.pong_received()
+        # Response timestamp already updated in read_response()
+    else:
+        pending = server.match_reply(response)
+        server.emit('machine_response', {'response': response,
+                                         'command': pending.command if pending else None})
+        logging.info("Arduino response from %s: %s", server.device_id, response)
+        if pending:
+            status = 'rejected' if response.startswith(REJECTED_PREFIXES) else 'ok'
+            complete_command(pending, status, response)
 
-def parse_json_status(json_string):
-    """Parse JSON status updates from Arduino"""
+def complete_command(pending, status, response=None):
+    """Resolve a command's future and tell the client that sent it how it went"""
+    result = pending.result(status, response)
+    if not pending.future.done():
+        pending.future.set_result(result)
+    COMMANDS.inc(label_value=status)
+    if pending.sent_at and status in ('ok', 'rejected'):
+        COMMAND_RTT.observe(time.time() - pending.sent_at)
+    if pending.sid:
+        socketio.emit('command_sent', result, to=pending.sid)
+    logging.debug("Command '%s' finished: %s in %s ms", pending.command, status, result['rtt_ms'])
+
+def latency_summary(samples):
+    """Summarise a window of millisecond latency samples"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'last_ms': samples[-1],
+        'mean_ms': round(sum(ordered) / len(ordered), 2),
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'max_ms': ordered[-1]
+    }
+
+def parse_json_status(server, json_string):
+    """Parse JSON status updates from a station's controller"""
+    started = time.perf_counter()
     try:
-        logging.debug(f"Parsing JSON: {json_string}")
+        logging.debug("Parsing JSON: %s", json_string)
         data = json.loads(json_string)
         
         # Update position
         if 'x' in data and 'y' in data:
-            arduino_server.position['x'] = float(data['x'])
-            arduino_server.position['y'] = float(data['y'])
-            socketio.emit('position_update', arduino_server.position)
-            logging.debug(f"Position update: {arduino_server.position}")
+            server.position['x'] = float(data['x'])
+            server.position['y'] = float(data['y'])
+            logging.debug("Position update: %s", server.position)
         
         # Update motor states
         motor_states_updated = False
         if 'stateX' in data:
-            arduino_server.motor_states['x'] = str(data['stateX'])
+            server.motor_states['x'] = str(data['stateX'])
             motor_states_updated = True
         if 'stateY' in data:
-            arduino_server.motor_states['y'] = str(data['stateY'])
+            server.motor_states['y'] = str(data['stateY'])
             motor_states_updated = True
         
         if motor_states_updated:
-            socketio.emit('motor_states_update', arduino_server.motor_states)
-            logging.debug(f"Motor states update: {arduino_server.motor_states}")
+            logging.debug("Motor states update: %s", server.motor_states)
         
         # Update tape motor status
         if 'tape' in data:
             tape_data = data['tape']
             if isinstance(tape_data, list) and len(tape_data) >= 2:
-                arduino_server.tape['speed'] = int(tape_data[0])
-                arduino_server.tape['torque'] = int(tape_data[1])
-                socketio.emit('tape_update', arduino_server.tape)
-                logging.debug(f"Tape update: {arduino_server.tape}")
+                server.tape['speed'] = int(tape_data[0])
+                server.tape['torque'] = int(tape_data[1])
+                logging.debug("Tape update: %s", server.tape)
         
         # Update pneumatics
         pneumatics_updated = False
         if 'nozzle' in data:
-            arduino_server.pneumatics['nozzle'] = bool(data['nozzle'])
+            server.pneumatics['nozzle'] = bool(data['nozzle'])
             pneumatics_updated = True
         if 'stage' in data:
-            arduino_server.pneumatics['stage'] = bool(data['stage'])
+            server.pneumatics['stage'] = bool(data['stage'])
             pneumatics_updated = True
         if 'stamp' in data:
-            arduino_server.pneumatics['stamp'] = bool(data['stamp'])
+            server.pneumatics['stamp'] = bool(data['stamp'])
             pneumatics_updated = True
         
         if pneumatics_updated:
-            socketio.emit('pneumatics_update', arduino_server.pneumatics)
-            logging.debug(f"Pneumatics update: {arduino_server.pneumatics}")
+            logging.debug("Pneumatics update: %s", server.pneumatics)
         
         # Update vacuums
         vacuums_updated = False
         if 'vacnozzle' in data:
-            arduino_server.vacuums['vacnozzle'] = bool(data['vacnozzle'])
+            server.vacuums['vacnozzle'] = bool(data['vacnozzle'])
             vacuums_updated = True
         if 'chuck' in data:
-            arduino_server.vacuums['chuck'] = bool(data['chuck'])
+            server.vacuums['chuck'] = bool(data['chuck'])
             vacuums_updated = True
         
         if vacuums_updated:
-            socketio.emit('vacuums_update', arduino_server.vacuums)
-            logging.debug(f"Vacuums update: {arduino_server.vacuums}")
+            logging.debug("Vacuums update: %s", server.vacuums)
         
         # Update temperatures
         temp_updated = False
         if 'temp' in data:
-            arduino_server.temperature = float(data['temp'])
+            server.temperature = float(data['temp'])
             temp_updated = True
         if 'settemp' in data:
-            arduino_server.set_temperature = float(data['settemp'])
+            server.set_temperature = float(data['settemp'])
             temp_updated = True
         
         if temp_updated:
-            socketio.emit('temperature_update', {
-                'temperature': arduino_server.temperature,
-                'set_temperature': arduino_server.set_temperature
-            })
-            logging.debug(f"Temperature update: {arduino_server.temperature}°C (target: {arduino_server.set_temperature}°C)")
+            logging.debug("Temperature update: %s°C (target: %s°C)", server.temperature, server.set_temperature)
         
         # Update emergency stop status
         if 'eStopTriggered' in data:
-            arduino_server.estop_triggered = bool(data['eStopTriggered'])
-            socketio.emit('estop_update', {'triggered': arduino_server.estop_triggered})
-            if arduino_server.estop_triggered:
-                logging.warning("Emergency stop triggered!")
-            
+            server.estop_triggered = bool(data['eStopTriggered'])
+
+        status_applied(server, started)
+
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse JSON status: {json_string} - Error: {e}")
+        PARSE_ERRORS.inc()
+        logging.error("Failed to parse JSON status: %s - Error: %s", json_string, e)
     except Exception as e:
-        logging.error(f"Error processing JSON status: {e}")
+        PARSE_ERRORS.inc()
+        logging.error("Error processing JSON status: %s", e)
+
+def parse_binary_status(server, frame):
+    """Apply a binary status frame (CRC already checked by read_response); see statusframe.py"""
+    started = time.perf_counter()
+    try:
+        (_, _, flags, x, y, state_x, state_y, speed, torque,
+         set_temp, temp, seq, _) = statusframe.FRAME.unpack(frame)
+        if server.frame_seq is not None and seq != (server.frame_seq + 1) & 0xFFFF:
+            FRAMES_LOST.inc((seq - server.frame_seq - 1) & 0xFFFF)
+        server.frame_seq = seq
+
+        # Floats travel as float32; round like the JSON's %.2f so deltas and history match
+        server.position['x'] = round(x, 2)
+        server.position['y'] = round(y, 2)
+        server.motor_states['x'] = MOTOR_STATES[state_x] if state_x < len(MOTOR_STATES) else MOTOR_STATES[0]
+        server.motor_states['y'] = MOTOR_STATES[state_y] if state_y < len(MOTOR_STATES) else MOTOR_STATES[0]
+        server.tape['speed'] = speed
+        server.tape['torque'] = torque
+        server.pneumatics['nozzle'] = bool(flags & 1)
+        server.pneumatics['stage'] = bool(flags & 2)
+        server.pneumatics['stamp'] = bool(flags & 4)
+        server.vacuums['vacnozzle'] = bool(flags & 8)
+        server.vacuums['chuck'] = bool(flags & 16)
+        server.estop_triggered = bool(flags & 32)
+        server.set_temperature = round(set_temp, 2)
+        server.temperature = round(temp, 2)
+
+        status_applied(server, started)
+    except Exception as e:
+        PARSE_ERRORS.inc()
+        logging.error("Error processing binary status: %s", e)
+
+def status_applied(server, started):
+    """Record, publish and wake waiters for a status frame just applied to server's state"""
+    now = time.time()
+    sample = server.sample()
+    server.history.append(now, sample)
+    server.recorder.record(now, sample)
+    server.refresh_status(sample)
+
+    server.notify_state()
+    state = server.snapshot()
+    server.motion.on_status(state, server.frame_count)
+
+    # Push only the fields that moved past their deadband, as one event; ts lets the page show its lag
+    delta = server.telemetry.diff(state)
+    if delta:
+        broadcaster.publish('state_delta', dict(delta, ts=round(now, 3)), merge=True, device=server.device_id)
+        if delta.get('eStopTriggered'):
+            logging.warning("Emergency stop triggered on %s!", server.device_id)
+    STATUS_FRAMES.inc()
+    PARSE_SECONDS.observe(time.perf_counter() - started)
+
+class StaticPage:
+    """A file served from memory with an ETag and a ready-gzipped copy, reloaded when it changes on disk"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.body = self.gzipped = self.etag = None
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.path, 'rb') as f:
+                    self.body = f.read()
+                self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+                self.etag = hashlib.sha1(self.body).hexdigest()[:16]
+                self.mtime = mtime
+            return self.body, self.gzipped, self.etag
+
+control_page = StaticPage(os.path.join(app.root_path, 'control.html'))
 
 # Web Routes
 @app.route('/')
 def index():
-    return send_file('control.html')
+    """control.html, gzipped when the browser accepts it; revalidated by ETag so a reload is a 304"""
+    body, gzipped, etag = control_page.load()
+    compressed = bool(request.accept_encodings['gzip'])
+    response = Response(gzipped if compressed else body, mimetype='text/html')
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(f"{etag}-gzip" if compressed else etag)
+    return response.make_conditional(request)
+
+def device_for(data=None):
+    """The station a request or event is for: an explicit 'device' (event data or ?device=),
+    else the one the Socket.IO client selected, else the default station"""
+    device_id = data.get('device') if isinstance(data, dict) else None
+    device_id = (device_id or request.args.get('device') or
+                 client_devices.get(getattr(request, 'sid', None)) or hub.default_device)
+    return hub.device(device_id)
+
+def unknown_device():
+    device_id = request.args.get('device') or (request.get_json(silent=True) or {}).get('device')
+    return jsonify({'success': False, 'error': f"Unknown device '{device_id}'",
+                    'devices': sorted(hub.devices)}), 404
+
+@app.route('/devices', methods=['GET'])
+def list_devices():
+    return jsonify({'default': hub.default_device,
+                    'devices': [{'device': server.device_id, 'connected': server.connected,
+                                 'address': server.address, 'telemetry': server.protocol}
+                                for server in hub.links()]})
 
 @app.route('/connect', methods=['POST'])
 def connect_machine():
     # Connection is handled automatically by the TCP server
-    status = {'success': True, 'connected': arduino_server.connected}
-    logging.info(f"Connect request - Status: {status}")
+    server = device_for()
+    if not server:
+        return unknown_device()
+    status = {'success': True, 'device': server.device_id, 'connected': server.connected}
+    logging.info("Connect request - Status: %s", status)
     return jsonify(status)
 
 @app.route('/disconnect', methods=['POST'])
 def disconnect_machine():
-    arduino_server.disconnect()
-    status = {'success': True, 'connected': arduino_server.connected}
-    logging.info(f"Disconnect request - Status: {status}")
+    server = device_for()
+    if not server:
+        return unknown_device()
+    server.disconnect(resumable=False)
+    status = {'success': True, 'device': server.device_id, 'connected': server.connected}
+    logging.info("Disconnect request - Status: %s", status)
     return jsonify(status)
 
+@app.route('/estop_latency', methods=['GET'])
+def get_estop_latency():
+    server = device_for()
+    if not server:
+        return unknown_device()
+    return jsonify({name: latency_summary(samples)
+                    for name, samples in server.estop_latency.items()})
+
+@app.route('/thermal', methods=['GET'])
+def get_thermal():
+    """Heater settling prediction for the current setpoint step (see thermal.py)"""
+    server = device_for()
+    if not server:
+        return unknown_device()
+    return jsonify(dict(server.thermal.latest(), device=server.device_id))
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    """Downsampled telemetry: ?seconds=600 (or start/end epoch seconds), buckets=200, fields=temp,settemp"""
+    server = device_for()
+    if not server:
+        return unknown_device()
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - float(request.args.get('seconds', 600))))
+        buckets = max(1, min(int(request.args.get('buckets', 200)), HISTORY_MAX_BUCKETS))
+    except ValueError:
+        return jsonify({'error': 'start, end, seconds and buckets must be numbers'}), 400
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else HISTORY_FIELDS
+    unknown = [field for field in fields if field not in HISTORY_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}", 'fields': HISTORY_FIELDS}), 400
+    result = server.history.window(start, end, buckets, fields)
+    result['motor_states'] = MOTOR_STATES  # stateX/stateY values index into this
+    return jsonify(result)
+
+@app.route('/captures', methods=['GET'])
+def get_captures():
+    """Recorded controller sessions that /replay can play, oldest first"""
+    return jsonify({'captures': [{'capture': name, 'bytes': os.path.getsize(os.path.join(CAPTURE_DIR, name))}
+                                 for name in list_captures(CAPTURE_DIR)] if os.path.isdir(CAPTURE_DIR) else []})
+
+@app.route('/replay', methods=['GET', 'POST'])
+def replay_capture():
+    """GET: how a station's replay is going. POST {"capture": name from /captures, "speed": 1,
+    "device": "replay"}: play a capture into the replay station, or an existing one with no
+    controller attached"""
+    if request.method == 'GET':
+        server = device_for()
+        if not server:
+            return unknown_device()
+        return jsonify(dict(server.playback.stats if server.playback else {'status': 'idle'},
+                            device=server.device_id))
+    data = request.get_json(silent=True) or {}
+    device_id = str(data.get('device') or REPLAY_DEVICE)
+    name = str(data.get('capture', ''))
+    path = os.path.realpath(os.path.join(CAPTURE_DIR, name))
+    if not name or not path.startswith(os.path.realpath(CAPTURE_DIR) + os.sep) or not os.path.isfile(path):
+        return jsonify({'success': False, 'error': f"No capture named '{name}'"}), 404
+    try:
+        speed = float(data.get('speed', 1.0))
+    except (TypeError, ValueError):
+        speed = -1.0
+    if not 0 <= speed < float('inf'):
+        return jsonify({'success': False, 'error': 'speed must be 0 (as fast as possible) or a positive number'}), 400
+    # Only the replay station is created on demand; any other name must be a configured station
+    server = hub.device(device_id, create=device_id == REPLAY_DEVICE)
+    if not server:
+        return jsonify({'success': False, 'error': f"Replay into '{REPLAY_DEVICE}' or an existing station, "
+                                                   f"not '{device_id}'"}), 400
+    if server.connected or (server.playback and not server.playback.done):
+        return jsonify({'success': False, 'device': device_id,
+                        'error': 'Station has a controller attached or is already replaying'}), 409
+    try:
+        playback = CapturePlayback(path, lambda message: handle_controller_message(server, message),
+                                   speed, sleep=socketio.sleep)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    playback.stats['capture'] = name
+    server.playback = playback
+    server.frame_seq = None
+
+    def run():
+        stats = playback.run()
+        logging.info("Replay of %s into %s %s: %s messages in %s s", name, device_id, stats['status'],
+                     stats['messages'], stats['elapsed_s'])
+        server.emit('replay_finished', stats)
+
+    socketio.start_background_task(run)
+    logging.info("Replaying %s into %s at speed %s", name, device_id, speed)
+    return jsonify({'success': True, 'device': device_id, 'capture': name, 'speed': speed}), 202
+
+@app.route('/replay/stop', methods=['POST'])
+def stop_replay():
+    server = device_for()
+    if not server:
+        return unknown_device()
+    if server.playback:
+        server.playback.stop()
+    return jsonify({'success': True, 'device': server.device_id})
+
+@app.route('/recipes', methods=['GET'])
+def list_recipes():
+    server = device_for()
+    if not server:
+        return unknown_device()
+    return jsonify({'recipes': recipe_store.list(), **server.recipes.status()})
+
+@app.route('/recipes/<name>', methods=['GET', 'PUT', 'DELETE'])
+def recipe_file(name):
+    try:
+        if request.method == 'GET':
+            return jsonify(recipe_store.load(name))
+        if request.method == 'PUT':
+            recipe_store.save(name, request.get_json(silent=True))
+            logging.info("Recipe '%s' saved", name)
+            return jsonify({'success': True})
+        recipe_store.delete(name)
+        logging.info("Recipe '%s' deleted", name)
+        return jsonify({'success': True})
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': f"No recipe named '{name}'"}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/recipes/<name>/run', methods=['POST'])
+def run_recipe(name):
+    server = device_for()
+    if not server:
+        return unknown_device()
+    result = start_recipe(server, name)
+    return jsonify(result), (200 if result['success'] else 409)
+
+@app.route('/recipes/stop', methods=['POST'])
+def stop_recipe():
+    server = device_for()
+    if not server:
+        return unknown_device()
+    server.recipes.stop()
+    return jsonify({'success': True})
+
+def start_recipe(server, name):
+    if not server.connected:
+        return {'success': False, 'error': f"{server.device_id} not connected"}
+    try:
+        recipe = recipe_store.load(name)
+    except FileNotFoundError:
+        return {'success': False, 'error': f"No recipe named '{name}'"}
+    except ValueError as e:
+        return {'success': False, 'error': str(e)}
+    if server.scans.running():
+        return {'success': False, 'error': f"A scan is running on {server.device_id}"}
+    if not server.recipes.start(name, recipe):
+        return {'success': False, 'error': f"Another recipe is already running on {server.device_id}"}
+    return {'success': True, 'device': server.device_id, 'name': name, 'steps': len(recipe['steps'])}
+
+def run_blocking(func, *args):
+    """func(*args) on an OS thread under eventlet, so CPU-bound work doesn't stall the hub (and with it
+    the PINGs and STOP); called directly with the threading server"""
+    if ASYNC_MODE == 'eventlet':
+        return eventlet.tpool.execute(func, *args)
+    return func(*args)
+
+@app.route('/scan', methods=['GET', 'POST'])
+def scan():
+    """Plan a grid or point-list scan from the current position and stream it (see planner.py);
+    with \"dry_run\": true only the plan is returned"""
+    if request.method == 'GET':
+        server = device_for()
+        if not server:
+            return unknown_device()
+        return jsonify({'device': server.device_id, **server.scans.status()})
+    data = request.get_json(silent=True) or {}
+    server = device_for(data)
+    if not server:
+        return unknown_device()
+    spec = {key: value for key, value in data.items() if key not in ('device', 'dry_run')}
+    try:
+        plan = run_blocking(plan_scan, spec, (server.position['x'], server.position['y']))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if data.get('dry_run'):
+        return jsonify({'success': True, 'device': server.device_id, **plan.summary(),
+                        'path': [[float(x), float(y)] for x, y in plan.path]})
+    if not server.connected:
+        return jsonify({'success': False, 'error': f"{server.device_id} not connected"}), 409
+    if server.recipes.running():
+        return jsonify({'success': False, 'error': f"A recipe is running on {server.device_id}"}), 409
+    if not server.scans.start(plan):
+        return jsonify({'success': False, 'error': f"A scan is already running on {server.device_id}"}), 409
+    logging.info("REST: Scan of %s points on %s", plan.points, server.device_id)
+    return jsonify({'success': True, 'device': server.device_id, **plan.summary()}), 202
+
+@app.route('/scan/stop', methods=['POST'])
+def stop_scan():
+    server = device_for()
+    if not server:
+        return unknown_device()
+    server.scans.stop()
+    return jsonify({'success': True, 'device': server.device_id})
+
+@app.route('/motion', methods=['GET'])
+def get_motion():
+    """Recent moves with their measured durations"""
+    server = device_for()
+    if not server:
+        return unknown_device()
+    return jsonify({'device': server.device_id, 'moves': server.motion.recent_results()})
+
+@app.route('/motion/move', methods=['POST'])
+def post_move():
+    """Start a move; with \"wait\": true the response is held until the axis finishes"""
+    data = request.get_json(silent=True) or {}
+    server = device_for(data)
+    if not server:
+        return unknown_device()
+    axis = str(data.get('axis', '')).upper()
+    if axis not in ('X', 'Y'):
+        return jsonify({'success': False, 'error': "axis must be 'X' or 'Y'"}), 400
+    position = data.get('position')
+    try:
+        commands.build(f"Move{axis}", position)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not server.connected:
+        return jsonify({'success': False, 'error': f"{server.device_id} not connected"}), 409
+    move = server.motion.start_move(axis, position)
+    logging.info("REST: Move %s %s axis to position %s (move %s)", server.device_id, axis, position, move.id)
+    if data.get('wait'):
+        return jsonify(server.motion.wait(move, wait_timeout(data.get('timeout'))))
+    return jsonify(move.result())
+
+@app.route('/motion/<int:move_id>', methods=['GET'])
+def get_move(move_id):
+    """Long-poll a move: ?timeout=30 holds the response until it finishes"""
+    # Move ids are unique across stations, so no device is needed to look one up
+    for server in hub.links():
+        move = server.motion.get(move_id)
+        if move:
+            break
+    else:
+        return jsonify({'error': f"Unknown move {move_id}"}), 404
+    if 'timeout' in request.args:
+        return jsonify(server.motion.wait(move, wait_timeout(request.args.get('timeout'))))
+    return jsonify(move.result())
+
+@app.route('/commands', methods=['POST'])
+def post_commands():
+    """Run a list of commands as one batch: {"commands": [...], "wait": true, "timeout": 15}.
+    Everything is validated before anything is queued; the reply aggregates every command's result"""
+    data = request.get_json(silent=True) or {}
+    server = device_for(data)
+    if not server:
+        return unknown_device()
+    result, http_status = submit_batch(server, data.get('commands'), data.get('wait', True), data.get('timeout'))
+    return jsonify(result), http_status
+
+def submit_batch(server, command_list, wait=True, timeout=None):
+    """Validate, enqueue and (with wait) collect a batch. Returns (result, HTTP status)"""
+    if not isinstance(command_list, list) or not 0 < len(command_list) <= MAX_BATCH_COMMANDS:
+        return {'success': False, 'error': f"commands must be a list of 1 to {MAX_BATCH_COMMANDS} strings"}, 400
+    validated, errors = [], []
+    for index, command in enumerate(command_list):
+        try:
+            validated.append(commands.parse(command))
+        except ValueError as e:
+            errors.append({'index': index, 'command': command, 'error': str(e)})
+            continue
+        if validated[-1].name in SAFETY_COMMANDS:
+            # A STOP must never wait behind other commands; it has its own event and flushes the queue
+            errors.append({'index': index, 'command': command, 'error': f"{validated[-1].name} cannot be batched"})
+    if errors:
+        return {'success': False, 'device': server.device_id, 'errors': errors}, 400
+    if not server.connected:
+        return {'success': False, 'device': server.device_id, 'error': f"{server.device_id} not connected"}, 409
+
+    started = time.time()
+    batch = server.enqueue_batch(validated)
+    logging.info("Batch of %s commands queued for %s", len(batch), server.device_id)
+    if not wait:
+        return {'success': True, 'device': server.device_id, 'ids': [pending.id for pending in batch]}, 202
+    wait_futures([pending.future for pending in batch], wait_timeout(timeout))
+    results = [pending.future.result() if pending.future.done() else pending.result('pending')
+               for pending in batch]
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    return {
+        'success': statuses.get('ok', 0) == len(results),
+        'device': server.device_id,
+        'count': len(results),
+        'statuses': statuses,
+        'total_ms': round((time.time() - started) * 1000, 1),
+        'results': results
+    }, 200
+
+def wait_timeout(value):
+    try:
+        return min(max(float(value), 0.0), MOVE_WAIT_TIMEOUT)
+    except (TypeError, ValueError):
+        return MOVE_WAIT_TIMEOUT
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of the bridge's counters and latency histograms"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/status', methods=['GET'])
 def get_status():
-    status = {
-        'connected': arduino_server.connected,
-        'temperature': arduino_server.temperature,
-        'set_temperature': arduino_server.set_temperature,
-        'position': arduino_server.position,
-        'motor_states': arduino_server.motor_states,
-        'pneumatics': arduino_server.pneumatics,
-        'vacuums': arduino_server.vacuums,
-        'tape': arduino_server.tape
-    }
-    logging.debug(f"Status request: {status}")
-    return jsonify(status)
+    """Current state, served from a cache refreshed once per change. Honours If-None-Match;
+    ?since=<version> holds the response until the state is newer than that (up to ?timeout=)"""
+    server = device_for()
+    if not server:
+        return unknown_device()
+    if 'since' in request.args:
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since must be a status version number'}), 400
+        version, body = server.wait_for_status(since, wait_timeout(request.args.get('timeout')))
+    else:
+        version, body = server.status_cache
+    response = Response(body, mimetype='application/json')
+    response.set_etag(f"{BOOT_ID}-{server.device_id}-{version}")
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate; a match costs a 304
+    return response.make_conditional(request)
 
 # SocketIO Event Handlers with Button Press Logging
 @socketio.on('connect')
 def handle_connect():
     logging.info("Client connected to SocketIO")
-    emit('connection_status', {'connected': arduino_server.connected})
-    emit('temperature_update', {
-        'temperature': arduino_server.temperature,
-        'set_temperature': arduino_server.set_temperature
-    })
-    emit('position_update', arduino_server.position)
-    emit('motor_states_update', arduino_server.motor_states)
-    emit('pneumatics_update', arduino_server.pneumatics)
-    emit('vacuums_update', arduino_server.vacuums)
-    emit('tape_update', arduino_server.tape)
+    broadcaster.add_client(request.sid)
+    # Connect with ?device=<id> to watch a specific station, otherwise the default one
+    watch_device(device_for())
 
 @socketio.on('disconnect')
 def handle_disconnect():
     logging.info("Client disconnected from SocketIO")
+    broadcaster.remove_client(request.sid)
+    client_devices.pop(request.sid, None)
+    diagnostics_subscribers.discard(request.sid)
+
+def watch_device(server):
+    """Move the requesting client into a station's room and send it that station's full state"""
+    previous = client_devices.get(request.sid)
+    if previous:
+        leave_room(f"device:{previous}")
+    if not server:
+        client_devices.pop(request.sid, None)
+        broadcaster.set_device(request.sid, None)
+        emit('connection_status', {'connected': False, 'device': None})
+        return
+    client_devices[request.sid] = server.device_id
+    join_room(server.room)
+    broadcaster.set_device(request.sid, server.device_id)
+    emit('connection_status', {'connected': server.connected, 'device': server.device_id})
+    # Full state up front; state_delta broadcasts only carry changes after this
+    emit('state_delta', dict(server.snapshot(), device=server.device_id, ts=round(time.time(), 3)))
+
+@socketio.on('list_devices')
+def handle_list_devices():
+    return {'default': hub.default_device, 'selected': client_devices.get(request.sid),
+            'devices': [{'device': server.device_id, 'connected': server.connected} for server in hub.links()]}
+
+@socketio.on('select_device')
+def handle_select_device(data):
+    """Switch the station this client watches and commands"""
+    server = hub.device(data.get('device'))
+    if not server:
+        return {'success': False, 'error': f"Unknown device '{data.get('device')}'"}
+    logging.info("Client switched to station %s", server.device_id)
+    watch_device(server)
+    return {'success': True, 'device': server.device_id, 'connected': server.connected}
+
+@socketio.on('subscribe_diagnostics')
+def handle_subscribe_diagnostics():
+    """Join the diagnostics room; the ack carries the current metrics straight away"""
+    join_room('diagnostics')
+    diagnostics_subscribers.add(request.sid)
+    return REGISTRY.snapshot()
+
+@socketio.on('unsubscribe_diagnostics')
+def handle_unsubscribe_diagnostics():
+    leave_room('diagnostics')
+    diagnostics_subscribers.discard(request.sid)
+
+def diagnostics_publisher():
+    """Background task: push metric summaries to the diagnostics room while anyone is in it"""
+    while True:
+        socketio.sleep(DIAGNOSTICS_INTERVAL)
+        if diagnostics_subscribers:
+            try:
+                socketio.emit('diagnostics', REGISTRY.snapshot(), to='diagnostics')
+            except Exception as e:
+                logging.error("Diagnostics publish error: %s", e)
+
+def thermal_publisher():
+    """Background task: push each heating station's settling prediction to its clients"""
+    last_states = {}
+    while True:
+        socketio.sleep(THERMAL_INTERVAL)
+        for server in hub.links():
+            try:
+                # Keep publishing until the clients have seen the heater go off
+                idle = server.set_temperature <= 0 and last_states.get(server.device_id, 'off') == 'off'
+                if not server.connected or idle:
+                    continue
+                estimate = server.thermal.latest()
+                last_states[server.device_id] = estimate['state']
+                server.emit('thermal', estimate)
+            except Exception as e:
+                logging.error("Thermal publish error for %s: %s", server.device_id, e)
 
 @socketio.on('get_arduino_status')
-def handle_get_arduino_status():
-    emit('arduino_connection_status', {'connected': arduino_server.connected})
+def handle_get_arduino_status(data=None):
+    server = device_for(data)
+    emit('arduino_connection_status', {'connected': bool(server and server.connected),
+                                       'device': server.device_id if server else None})
 
 @socketio.on('send_command')
 def handle_command(data):
+    server = device_for(data)
     command = data.get('command', '')
-    logging.info(f"Button Press: Raw command '{command}' received from web interface")
+    logging.info("Button Press: Raw command '%s' received from web interface", command)
     
     if command:
-        if arduino_server.connected:
-            arduino_server.command_queue.put(command)
-            logging.info(f"Button Press: Command '{command}' queued for Arduino")
-            emit('command_sent', {'command': command, 'status': 'queued'})
-        else:
-            logging.warning(f"Button Press: Command '{command}' received but Arduino not connected")
-            emit('command_sent', {'command': command, 'status': 'not_connected'})
+        try:
+            command = commands.parse(command)
+        except ValueError as e:
+            logging.warning("Button Press: Invalid command '%s' - %s", command, e)
+            emit('command_sent', {'command': command, 'status': 'invalid', 'error': str(e)})
+            return
+        queue_command(server, command, 'Command')
     else:
         logging.warning("Button Press: Empty command received")
 
+def queue_command(server, command, kind, *args):
+    """Build (unless command is already a commands.Command), check and queue a command for the
+    Socket.IO client that asked for it, telling it via command_sent when that fails.
+    Returns the PendingCommand, or None."""
+    if not isinstance(command, commands.Command):
+        try:
+            command = commands.build(command, *args)
+        except ValueError as e:
+            text = ' '.join(str(part) for part in (command, *args))
+            logging.warning("Button Press: Invalid %s '%s' - %s", kind.lower(), text, e)
+            emit('command_sent', {'command': text, 'status': 'invalid', 'error': str(e)})
+            return None
+    if server and server.connected:
+        pending = server.enqueue_command(command, request.sid)
+        logging.info("Button Press: %s '%s' queued for Arduino", kind, command)
+        return pending
+    logging.warning("Button Press: %s '%s' received but Arduino not connected", kind, command)
+    emit('command_sent', {'command': str(command), 'status': 'not_connected'})
+    return None
+
+@socketio.on('send_commands')
+def handle_commands(data):
+    """Batch counterpart of send_command; the ack carries the aggregated result"""
+    server = device_for(data)
+    if not server:
+        return {'success': False, 'error': f"Unknown device '{data.get('device')}'"}
+    logging.info("Button Press: Batch of %s commands received from web interface",
+                 len(data.get('commands') or []))
+    result, _ = submit_batch(server, data.get('commands'), data.get('wait', True), data.get('timeout'))
+    return result
+
 @socketio.on('stop_command')
-def handle_stop_command():
+def handle_stop_command(data=None):
+    server = device_for(data)
     logging.warning("Button Press: STOP command activated!")
     
-    if arduino_server.connected:
-        arduino_server.command_queue.put("STOP")
-        logging.warning("Button Press: STOP command queued for Arduino")
-        emit('command_sent', {'command': 'STOP', 'status': 'queued'})
+    if server and server.connected:
+        server.enqueue_command(commands.build('STOP'), request.sid)
+        server.recipes.stop('stopped')
+        server.scans.stop('stopped')
+        logging.warning("Button Press: STOP command sent to Arduino ahead of queued commands")
     else:
         logging.warning("Button Press: STOP command requested but Arduino not connected")
         emit('command_sent', {'command': 'STOP', 'status': 'not_connected'})
 
 @socketio.on('move_position')
 def handle_move_position(data):
+    server = device_for(data)
     axis = data.get('axis')
     position = data.get('position', 0)
     
-    logging.info(f"Button Press: Move {axis} axis to position {position}")
+    logging.info("Button Press: Move %s axis to position %s", axis, position)
     
-    if axis == 'X':
-        command = f"MoveX {position}"
-    elif axis == 'Y':
-        command = f"MoveY {position}"
-    else:
-        logging.warning(f"Button Press: Invalid axis '{axis}' for move command")
+    if axis not in ('X', 'Y'):
+        logging.warning("Button Press: Invalid axis '%s' for move command", axis)
+        return
+    try:
+        command = commands.build(f"Move{axis}", position)
+    except ValueError as e:
+        logging.warning("Button Press: Invalid move command - %s", e)
+        emit('command_sent', {'command': f"Move{axis} {position}", 'status': 'invalid', 'error': str(e)})
         return
     
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Move command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
+    if server and server.connected:
+        move = server.motion.start_move(axis, command.args[0], request.sid)
+        logging.info("Button Press: Move command '%s' queued for Arduino", command)
+        return {'move_id': move.id}
     else:
-        logging.warning(f"Button Press: Move command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
+        logging.warning("Button Press: Move command '%s' received but Arduino not connected", command)
+        emit('command_sent', {'command': str(command), 'status': 'not_connected'})
+
+@socketio.on('move_and_wait')
+def handle_move_and_wait(data):
+    """Like move_position, but the ack only comes back once the axis has finished the move"""
+    server = device_for(data)
+    axis = data.get('axis')
+    position = data.get('position')
+    if axis not in ('X', 'Y'):
+        return {'status': 'invalid', 'error': "axis must be 'X' or 'Y'"}
+    try:
+        commands.build(f"Move{axis}", position)
+    except ValueError as e:
+        return {'status': 'invalid', 'error': str(e)}
+    if not (server and server.connected):
+        return {'status': 'not_connected'}
+    move = server.motion.start_move(axis, position, request.sid)
+    logging.info("Button Press: Move %s axis to position %s and wait (move %s)", axis, position, move.id)
+    return server.motion.wait(move, wait_timeout(data.get('timeout')))
 
 @socketio.on('enable_axis')
 def handle_enable_axis(data):
+    server = device_for(data)
     axis = data.get('axis')  # 'X' or 'Y'
     
-    logging.info(f"Button Press: Enable {axis} axis")
+    logging.info("Button Press: Enable %s axis", axis)
     
-    if axis == 'X':
-        command = "EnableX"
-    elif axis == 'Y':
-        command = "EnableY"
-    else:
-        logging.warning(f"Button Press: Invalid axis '{axis}' for enable axis")
+    if axis not in ('X', 'Y'):
+        logging.warning("Button Press: Invalid axis '%s' for enable axis", axis)
         return
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Enable axis command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
-    else:
-        logging.warning(f"Button Press: Enable axis command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
+    queue_command(server, f"Enable{axis}", 'Enable axis command')
 
 @socketio.on('set_temperature')
 def handle_temperature(data):
+    server = device_for(data)
     temperature = data.get('temperature', 0)
     
-    logging.info(f"Button Press: Set temperature to {temperature}°C")
-    
-    command = f"SetTemperature {temperature}"
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Temperature command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
-    else:
-        logging.warning(f"Button Press: Temperature command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
+    logging.info("Button Press: Set temperature to %s°C", temperature)
+    queue_command(server, 'SetTemperature', 'Temperature command', temperature)
 
 @socketio.on('get_temperature')
-def handle_get_temperature():
+def handle_get_temperature(data=None):
+    """Temperatures from the latest status frame; the controller has no command for them"""
+    server = device_for(data)
     logging.info("Button Press: Get temperature requested")
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put("GetTemperature")
-        logging.info("Button Press: GetTemperature command queued for Arduino")
-        emit('command_sent', {'command': 'GetTemperature', 'status': 'queued'})
-    else:
-        logging.warning("Button Press: GetTemperature requested but Arduino not connected")
-        emit('command_sent', {'command': 'GetTemperature', 'status': 'not_connected'})
+    if not server:
+        return {'success': False, 'error': f"Unknown device '{(data or {}).get('device')}'"}
+    return {'success': True, 'device': server.device_id, 'connected': server.connected,
+            'temperature': server.temperature, 'set_temperature': server.set_temperature}
 
 @socketio.on('pneumatic_control')
 def handle_pneumatic(data):
+    server = device_for(data)
     component = data.get('component')  # 'nozzle', 'stage', 'stamp'
     action = data.get('action')        # 'extend', 'retract'
     
-    logging.info(f"Button Press: Pneumatic control - {component} {action}")
-    
-    command_map = {
-        'nozzle': {'extend': 'ExtendNozzle', 'retract': 'RetractNozzle'},
-        'stage': {'extend': 'ExtendChipStage', 'retract': 'RetractChipStage'},
-        'stamp': {'extend': 'ExtendStamp', 'retract': 'RetractStamp'}
-    }
+    logging.info("Button Press: Pneumatic control - %s %s", component, action)
     
-    if component in command_map and action in command_map[component]:
-        command = command_map[component][action]
-        if arduino_server.connected:
-            arduino_server.command_queue.put(command)
-            logging.info(f"Button Press: Pneumatic command '{command}' queued for Arduino")
-            emit('command_sent', {'command': command, 'status': 'queued'})
-        else:
-            logging.warning(f"Button Press: Pneumatic command '{command}' received but Arduino not connected")
-            emit('command_sent', {'command': command, 'status': 'not_connected'})
+    command = commands.PNEUMATICS.get(component, {}).get(action)
+    if command:
+        queue_command(server, command, 'Pneumatic command')
     else:
-        logging.warning(f"Button Press: Invalid pneumatic command - component: {component}, action: {action}")
+        logging.warning("Button Press: Invalid pneumatic command - component: %s, action: %s", component, action)
 
 @socketio.on('vacuum_control')
 def handle_vacuum(data):
+    server = device_for(data)
     component = data.get('component')  # 'vacnozzle', 'chuck'
     action = data.get('action')        # 'on', 'off'
     
-    logging.info(f"Button Press: Vacuum control - {component} {action}")
-    
-    command_map = {
-        'vacnozzle': {'on': 'VacNozzleOn', 'off': 'VacNozzleOff'},
-        'chuck': {'on': 'ChuckOn', 'off': 'ChuckOff'}
-    }
+    logging.info("Button Press: Vacuum control - %s %s", component, action)
     
-    if component in command_map and action in command_map[component]:
-        command = command_map[component][action]
-        if arduino_server.connected:
-            arduino_server.command_queue.put(command)
-            logging.info(f"Button Press: Vacuum command '{command}' queued for Arduino")
-            emit('command_sent', {'command': command, 'status': 'queued'})
-        else:
-            logging.warning(f"Button Press: Vacuum command '{command}' received but Arduino not connected")
-            emit('command_sent', {'command': command, 'status': 'not_connected'})
+    command = commands.VACUUMS.get(component, {}).get(action)
+    if command:
+        queue_command(server, command, 'Vacuum command')
     else:
-        logging.warning(f"Button Press: Invalid vacuum command - component: {component}, action: {action}")
+        logging.warning("Button Press: Invalid vacuum command - component: %s, action: %s", component, action)
 
 @socketio.on('disable_motor')
 def handle_disable_motor(data):
+    server = device_for(data)
     axis = data.get('axis')  # 'X' or 'Y'
     
-    logging.info(f"Button Press: Disable {axis} motor")
+    logging.info("Button Press: Disable %s motor", axis)
     
-    if axis == 'X':
-        command = "DisableX"
-    elif axis == 'Y':
-        command = "DisableY"
-    else:
-        logging.warning(f"Button Press: Invalid axis '{axis}' for disable motor")
+    if axis not in ('X', 'Y'):
+        logging.warning("Button Press: Invalid axis '%s' for disable motor", axis)
         return
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Disable motor command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
-    else:
-        logging.warning(f"Button Press: Disable motor command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
+    queue_command(server, f"Disable{axis}", 'Disable motor command')
 
 @socketio.on('emergency_stop')
-def handle_emergency_stop():
+def handle_emergency_stop(data=None):
+    received_at = time.time()
+    server = device_for(data)
     logging.warning("Button Press: EMERGENCY STOP activated!")
     
-    if arduino_server.connected:
-        arduino_server.command_queue.put("STOP")
-        logging.warning("Button Press: EMERGENCY STOP command queued for Arduino")
-        emit('command_sent', {'command': 'STOP - EMERGENCY STOP', 'status': 'queued'})
+    if server and server.connected:
+        pending = server.enqueue_command(commands.build('STOP'), request.sid)
+        server.recipes.stop('emergency_stop')
+        server.scans.stop('emergency_stop')
+        if pending.sent_at is None:
+            return {'status': 'send_failed'}
+        wire_ms = round((pending.sent_at - received_at) * 1000, 2)
+        server.estop_latency['handler_to_wire'].append(wire_ms)
+        logging.warning("Button Press: EMERGENCY STOP written to Arduino %s ms after the event arrived", wire_ms)
+        # The browser times click -> this ack, an upper bound on click -> wire
+        return {'status': 'sent', 'wire_ms': wire_ms}
     else:
         logging.warning("Button Press: EMERGENCY STOP requested but Arduino not connected")
         emit('command_sent', {'command': 'STOP - EMERGENCY STOP', 'status': 'not_connected'})
+        return {'status': 'not_connected'}
+
+@socketio.on('run_recipe')
+def handle_run_recipe(data):
+    server = device_for(data)
+    name = data.get('name', '')
+    logging.info("Button Press: Run recipe '%s'", name)
+    if not server:
+        return {'success': False, 'error': f"Unknown device '{data.get('device')}'"}
+    result = start_recipe(server, name)
+    if not result['success']:
+        logging.warning("Button Press: Recipe '%s' not started - %s", name, result['error'])
+    return result
+
+@socketio.on('stop_recipe')
+def handle_stop_recipe(data=None):
+    server = device_for(data)
+    logging.info("Button Press: Stop recipe")
+    if server:
+        server.recipes.stop()
+
+@socketio.on('list_recipes')
+def handle_list_recipes(data=None):
+    server = device_for(data)
+    return {'recipes': recipe_store.list(), **(server.recipes.status() if server else {})}
+
+@socketio.on('estop_latency')
+def handle_estop_latency(data):
+    server = device_for(data)
+    click_to_ack = data.get('click_to_ack_ms')
+    if server and isinstance(click_to_ack, (int, float)):
+        server.estop_latency['click_to_ack'].append(round(float(click_to_ack), 2))
 
 @socketio.on('tape_motor')
 def handle_tape_motor(data):
+    server = device_for(data)
     speed = data.get('speed', 0)
     torque = data.get('torque', 0)
     time_ms = data.get('time', 0)
     
-    logging.info(f"Button Press: Tape motor - Speed: {speed}, Torque: {torque}, Time: {time_ms}ms")
-    
-    command = f"Tape {speed} {torque} {time_ms}"
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Tape motor command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
-    else:
-        logging.warning(f"Button Press: Tape motor command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
-
-# Start the communication thread
-communication_thread = threading.Thread(target=arduino_communication_thread, daemon=True)
-communication_thread.start()
+    logging.info("Button Press: Tape motor - Speed: %s, Torque: %s, Time: %sms", speed, torque, time_ms)
+    queue_command(server, 'Tape', 'Tape motor command', speed, torque, time_ms)
 
 @socketio.on('stop_tape')
-def handle_stop_tape():
+def handle_stop_tape(data=None):
+    server = device_for(data)
     logging.info("Button Press: Stop tape motor")
-    
-    command = "StopTape"
-    
-    if arduino_server.connected:
-        arduino_server.command_queue.put(command)
-        logging.info(f"Button Press: Stop tape command '{command}' queued for Arduino")
-        emit('command_sent', {'command': command, 'status': 'queued'})
-    else:
-        logging.warning(f"Button Press: Stop tape command '{command}' received but Arduino not connected")
-        emit('command_sent', {'command': command, 'status': 'not_connected'})
+    queue_command(server, 'StopTape', 'Stop tape command')
+
+class RequestContextFilter(logging.Filter):
+    """Tag records logged while handling a request or Socket.IO event with who sent it"""
+    def filter(self, record):
+        if has_request_context():
+            record.remote_addr = request.remote_addr
+            sid = getattr(request, 'sid', None)
+            if sid:
+                record.sid = sid
+        return True
+
+def start_background_tasks():
+    """Start the communication loop and the publishers, once logging is set up"""
+    socketio.start_background_task(arduino_communication_thread)
+    socketio.start_background_task(broadcaster.run)
+    socketio.start_background_task(diagnostics_publisher)
+    socketio.start_background_task(thermal_publisher)
+
+def shutdown():
+    """Stop the communication loop, then close the controller links and flush recordings"""
+    logging.info("Shutting down...")
+    hub.stop()
+    if not hub.stopped.wait(SHUTDOWN_TIMEOUT):
+        logging.warning("Communication loop did not stop within %s s", SHUTDOWN_TIMEOUT)
+    hub.close()
+    logging.info("Shutdown complete")
+
+def handle_sigterm(signum, frame):
+    # Unwinds socketio.run() the same way Ctrl+C does, so shutdown() runs either way
+    raise SystemExit(0)
 
 if __name__ == '__main__':
-    # Setup logging with different levels for testing
-    logging.basicConfig(
-        level=logging.INFO,  # Change to DEBUG for more verbose output
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('flask_app.log')
-        ]
-    )
+    # Logging goes through a queue so handlers and the communication thread never wait on the SD card
+    setup_logging(LOG_FILE, level=logging.INFO,  # Change to DEBUG for more verbose output
+                  filters=[RequestContextFilter()])
     
-    logging.info("Starting Flask application...")
-    logging.info(f"HTTP Server will run on port {HTTP_PORT}")
-    logging.info(f"TCP Server will listen on port {TCP_SERVER_PORT}")
-    logging.info("PING/PONG heartbeat system enabled - sending PING every 2 seconds")
+    logging.info("Starting Flask application (%s)...", ASYNC_MODE)
+    logging.info("HTTP Server will run on port %s", HTTP_PORT)
+    logging.info("TCP Server will listen on port %s", TCP_SERVER_PORT)
+    logging.info("PING/PONG heartbeat system enabled - sending PING every %s seconds", PING_INTERVAL)
     
-    # Run the Flask app with SocketIO
-    socketio.run(app, host="0.0.0.0", port=HTTP_PORT, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    start_background_tasks()
+    try:
+        # eventlet: one greenlet per HTTP request and Socket.IO connection on a single OS thread
+        socketio.run(app, host="0.0.0.0", port=HTTP_PORT, debug=False,
+                     allow_unsafe_werkzeug=ASYNC_MODE == 'threading')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""Non-blocking logging: callers enqueue records, one listener thread formats and writes them.
+
+The root logger gets a single QueueHandler, so a logging call on the communication thread or
+in a Socket.IO handler costs a queue put. The listener thread owns the console handler and a
+size-rotated JSON-lines audit file whose writes are batched to keep SD card I/O infrequent.
+Under eventlet the listener and flusher are still OS threads, and the queue and handler locks
+are the unpatched ones they share with the hub.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+try:
+    from eventlet.patcher import original
+    os_threading, os_queue, os_time = original('threading'), original('queue'), original('time')
+except ImportError:
+    os_threading, os_queue, os_time = threading, queue, time
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+BATCH_SIZE = 200            # Records buffered before the audit file is written
+FLUSH_INTERVAL = 2.0        # Seconds a record may sit in the buffer
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Attributes every LogRecord has; anything else came from extra= or a filter and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields kept as top-level keys"""
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BatchingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that buffers formatted records and writes them in batches.
+
+    The buffer is written when it reaches batch_size, when a WARNING or worse arrives, or
+    when flush() is called, which start_flusher() does every flush_interval seconds.
+    """
+    def __init__(self, filename, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding='utf-8', delay=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+            if len(self.buffer) >= self.batch_size or record.levelno >= logging.WARNING:
+                self.write_buffer()
+        except Exception:
+            self.handleError(record)
+
+    def write_buffer(self):
+        """Write buffered lines, rolling the file over first if they would push it past max_bytes"""
+        if not self.buffer:
+            return
+        data = '\n'.join(self.buffer) + '\n'
+        self.buffer = []
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes and self.stream.tell() and self.stream.tell() + len(data) >= self.maxBytes:
+            self.doRollover()
+        self.stream.write(data)
+        self.stream.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self.write_buffer()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def start_flusher(self):
+        """Daemon thread that writes out a partial batch at least every flush_interval"""
+        def run():
+            while True:
+                os_time.sleep(self.flush_interval)
+                self.flush()
+        os_threading.Thread(target=run, name='log-flusher', daemon=True).start()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener.
+
+    Only the message itself is interpolated on the calling thread, because its arguments
+    may be mutable state that changes before the listener gets to it.
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class OSThreadQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose thread is a real OS thread even after eventlet.monkey_patch()"""
+    def start(self):
+        self._thread = os_threading.Thread(target=self._monitor, name='log-listener', daemon=True)
+        self._thread.start()
+
+
+def setup_logging(log_file, level=logging.INFO, filters=()):
+    """Route the root logger through a queue to the console and a rotating JSON-lines audit file.
+    Returns the running QueueListener, which is stopped (and the file flushed) at exit."""
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    audit = BatchingRotatingFileHandler(log_file)
+    audit.setFormatter(JsonLinesFormatter())
+
+    log_queue = os_queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    for handler in (console, audit, queue_handler):
+        # Taken from both the hub and the listener/flusher threads, so it must be a real lock
+        handler.lock = os_threading.RLock()
+    audit.start_flusher()
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = OSThreadQueueListener(log_queue, console, audit, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
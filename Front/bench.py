@@ -0,0 +1,359 @@
+"""Load and latency benchmark for the Flask/Socket.IO bridge, driven by simulator.py.
+
+Starts app.py on local ports (unless --bridge-url points at a running bridge), connects a
+SimulatedController per station streaming distinct frames, then runs N Socket.IO clients,
+spread across the stations, that each send commands and render telemetry. Reports command
+round trip p50/p99, telemetry end-to-end latency, frames each client never received and
+bridge CPU time per message. With --reconnects N it then cuts the first station's link N times
+and reports how long until a command goes through again.
+
+With --replay FILE it needs no simulator: the bridge plays a link capture (capture.py) into
+its replay station at --speed (0 = as fast as possible) while the clients watch it, and the
+report gives the bridge's message throughput, per-message handling time and delivery to the
+clients. The same capture gives the same load every run.
+
+    python bench.py [--clients 5] [--stations 1] [--duration 20] [--rate 20] [--command-rate 5]
+                    [--telemetry binary|json] [--json]
+    python bench.py --replay captures/station1/capture-....bin [--speed 0] [--clients 5] [--json]
+
+Needs the Socket.IO client extras on the machine running it: pip install "python-socketio[client]"
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+
+import socketio
+
+from simulator import SimulatedController
+
+BENCH_COMMANDS = ('VacNozzleOn', 'VacNozzleOff')
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    """utime + stime of a process from /proc (Linux, which is what the Pi runs)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return json.load(response)
+
+
+class BenchClient:
+    """One simulated operator station: renders telemetry and sends commands at a fixed rate"""
+    def __init__(self, url, controller, device=None):
+        self.url = f"{url}?device={device}" if device else url
+        self.controller = controller
+        self.client = socketio.Client()
+        self.sent_at = deque()
+        self.command_rtts = []
+        self.bridge_rtts = []
+        self.statuses = {}
+        self.telemetry_latencies = []
+        self.frames_received = 0
+        self.replies = queue.SimpleQueue()
+        self.measuring = False
+        self.client.on('state_delta', self.on_state_delta)
+        self.client.on('command_sent', self.on_command_sent)
+
+    def on_state_delta(self, delta):
+        received = time.time()
+        if self.controller is None:
+            # Replay: the bridge stamps every delta, and runs on this machine, so ts is comparable
+            if self.measuring and 'ts' in delta:
+                self.frames_received += 1
+                self.telemetry_latencies.append((received - delta['ts']) * 1000)
+        elif self.measuring and 'temp' in delta:
+            sent = self.controller.frame_times.get(delta['temp'])
+            if sent is not None:
+                self.frames_received += 1
+                self.telemetry_latencies.append((received - sent) * 1000)
+        return True  # Ack, like control.html, so the broadcaster keeps sending
+
+    def on_command_sent(self, data):
+        received = time.time()
+        self.replies.put(data)
+        # command_sent arrives in send order for this client, so the oldest send time is ours
+        if not self.sent_at:
+            return
+        sent = self.sent_at.popleft()
+        if self.measuring:
+            self.command_rtts.append((received - sent) * 1000)
+            if data.get('rtt_ms') is not None:
+                self.bridge_rtts.append(data['rtt_ms'])
+            self.statuses[data.get('status')] = self.statuses.get(data.get('status'), 0) + 1
+
+    def run_commands(self, rate, stop):
+        interval = 1.0 / rate if rate else None
+        index = 0
+        while interval and not stop.is_set():
+            self.sent_at.append(time.time())
+            self.client.emit('send_command', {'command': BENCH_COMMANDS[index % len(BENCH_COMMANDS)]})
+            index += 1
+            stop.wait(interval)
+
+
+def measure_recovery(client, timeout=15.0):
+    """Drop the client's station link and time until a command through the bridge succeeds again"""
+    while not client.replies.empty():
+        client.replies.get()
+    dropped = time.time()
+    client.controller.drop()
+    while time.time() - dropped < timeout:
+        client.sent_at.append(time.time())
+        client.client.emit('send_command', {'command': BENCH_COMMANDS[0]})
+        try:
+            reply = client.replies.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        if reply.get('status') == 'ok':
+            return (time.time() - dropped) * 1000
+        time.sleep(0.02)
+    return None
+
+
+def run_bench(args):
+    bridge = None
+    workdir = tempfile.mkdtemp(prefix='exfoliator-bench-')
+    tcp_port = args.tcp_port
+    url = args.bridge_url
+    # Each simulated station connects from its own loopback address so the bridge keys it separately
+    stations = [(f"station{i + 1}", f"127.0.0.{i + 2}") for i in range(args.stations)]
+    if not url:
+        tcp_port, http_port = free_port(), free_port()
+        devices = ','.join(f"{name}={address}" for name, address in stations)
+        env = dict(os.environ, EXFOLIATOR_TCP_HOST='127.0.0.1', EXFOLIATOR_ASYNC_MODE=args.async_mode,
+                   EXFOLIATOR_DATA_DIR=workdir, EXFOLIATOR_TCP_PORT=str(tcp_port), EXFOLIATOR_HTTP_PORT=str(http_port),
+                   EXFOLIATOR_DEVICES=devices, EXFOLIATOR_TELEMETRY=args.telemetry)
+        app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+        bridge = subprocess.Popen([sys.executable, app_path], cwd=workdir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{http_port}"
+
+    if args.bridge_url:
+        stations = [(None, None)]  # An external bridge: one simulator on its default station
+    controllers = [SimulatedController('127.0.0.1', tcp_port, args.rate, ramp=True, source=address)
+                   for _, address in stations]
+    clients = []
+    stop = threading.Event()
+    try:
+        for controller in controllers:
+            controller.start()
+        deadline = time.time() + 30
+        while True:
+            try:
+                if args.bridge_url:
+                    connected = get_json(f"{url}/status")['connected']
+                else:
+                    connected = all(device['connected'] for device in get_json(f"{url}/devices")['devices'])
+                if connected:
+                    break
+            except OSError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"Bridge at {url} never reported every simulator as connected")
+            time.sleep(0.2)
+
+        for index in range(args.clients):
+            station = index % len(stations)
+            client = BenchClient(url, controllers[station], stations[station][0])
+            client.client.connect(client.url)
+            clients.append(client)
+        time.sleep(1.0)  # Let the initial snapshots settle
+
+        frames_before = {controller: controller.frames_sent for controller in controllers}
+        commands_before = sum(controller.commands_received for controller in controllers)
+        cpu_before = cpu_seconds(bridge.pid) if bridge else None
+        for client in clients:
+            client.measuring = True
+        threads = [threading.Thread(target=client.run_commands, args=(args.command_rate, stop), daemon=True)
+                   for client in clients]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        time.sleep(1.0)  # Drain replies still in flight
+        for client in clients:
+            client.measuring = False
+        cpu_used = cpu_seconds(bridge.pid) - cpu_before if bridge else None
+        station_frames = {controller: controller.frames_sent - frames_before[controller]
+                          for controller in controllers}
+        frames = sum(station_frames.values())
+        commands = sum(controller.commands_received for controller in controllers) - commands_before
+        recoveries = [measure_recovery(clients[0]) for _ in range(args.reconnects)] if clients else []
+    finally:
+        stop.set()
+        for client in clients:
+            try:
+                client.client.disconnect()
+            except Exception:
+                pass
+        for controller in controllers:
+            controller.stop()
+        if bridge:
+            bridge.terminate()
+            bridge.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    command_rtts = [rtt for client in clients for rtt in client.command_rtts]
+    bridge_rtts = [rtt for client in clients for rtt in client.bridge_rtts]
+    latencies = [latency for client in clients for latency in client.telemetry_latencies]
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    received = [client.frames_received for client in clients]
+    expected = [station_frames[client.controller] for client in clients]
+    return {
+        'clients': args.clients,
+        'stations': len(controllers),
+        'telemetry': args.telemetry,
+        'duration_s': args.duration,
+        'controller_frames': frames,
+        'controller_commands': commands,
+        'command_rtt_ms': {'count': len(command_rtts), 'p50': percentile(command_rtts, 0.5),
+                           'p99': percentile(command_rtts, 0.99)},
+        'bridge_to_controller_rtt_ms': {'p50': percentile(bridge_rtts, 0.5), 'p99': percentile(bridge_rtts, 0.99)},
+        'command_status': statuses,
+        'telemetry_latency_ms': {'count': len(latencies), 'p50': percentile(latencies, 0.5),
+                                 'p99': percentile(latencies, 0.99)},
+        # Frames a client never saw; expected when rate exceeds the broadcaster's push rate
+        'frames_dropped_per_client': round((sum(expected) - sum(received)) / len(received), 1) if received else None,
+        'frames_delivered_pct': round(100.0 * sum(received) / sum(expected), 1) if sum(expected) else None,
+        'bridge_cpu_ms_per_message': round(cpu_used * 1000 / (frames + commands), 3)
+        if cpu_used is not None and frames + commands else None,
+        # Links a simulator dropped because the PINGs queued behind a backlog (Main.ino's heartbeat gate)
+        'heartbeat_drops': sum(controller.heartbeat_drops for controller in controllers),
+        'reconnect_to_command_ms': {'count': len(recoveries), 'failed': recoveries.count(None),
+                                    'p50': percentile([r for r in recoveries if r is not None], 0.5),
+                                    'max': percentile([r for r in recoveries if r is not None], 1.0)},
+    }
+
+
+def run_replay_bench(args):
+    """Start a bridge, have it replay args.replay flat out (or at args.speed) to the clients"""
+    workdir = tempfile.mkdtemp(prefix='exfoliator-bench-')
+    capture = f"bench/{os.path.basename(args.replay)}"
+    os.makedirs(os.path.join(workdir, 'captures', 'bench'))
+    shutil.copy(args.replay, os.path.join(workdir, 'captures', capture))
+    tcp_port, http_port = free_port(), free_port()
+    # A station under an address no controller has, so the clients can select it before the replay starts
+    env = dict(os.environ, EXFOLIATOR_TCP_HOST='127.0.0.1', EXFOLIATOR_ASYNC_MODE=args.async_mode,
+               EXFOLIATOR_DATA_DIR=workdir, EXFOLIATOR_TCP_PORT=str(tcp_port), EXFOLIATOR_HTTP_PORT=str(http_port),
+               EXFOLIATOR_DEVICES='replay=replay', EXFOLIATOR_CAPTURE='0')
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    bridge = subprocess.Popen([sys.executable, app_path], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{http_port}"
+    clients = []
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                get_json(f"{url}/devices")
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Bridge at {url} never came up")
+                time.sleep(0.2)
+        for _ in range(args.clients):
+            client = BenchClient(url, None, 'replay')
+            client.client.connect(client.url)
+            client.measuring = True
+            clients.append(client)
+        time.sleep(1.0)  # Let the initial snapshots settle
+
+        cpu_before = cpu_seconds(bridge.pid)
+        request = urllib.request.Request(f"{url}/replay", method='POST',
+                                         data=json.dumps({'capture': capture, 'speed': args.speed}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(request, timeout=5).close()
+        while True:
+            time.sleep(0.5)
+            replay = get_json(f"{url}/replay?device=replay")
+            if replay['status'] in ('finished', 'stopped'):
+                break
+        cpu_used = cpu_seconds(bridge.pid) - cpu_before
+        time.sleep(1.0)  # Drain pushes still in flight
+    finally:
+        for client in clients:
+            try:
+                client.client.disconnect()
+            except Exception:
+                pass
+        bridge.terminate()
+        bridge.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [latency for client in clients for latency in client.telemetry_latencies]
+    received = [client.frames_received for client in clients]
+    return {
+        'clients': args.clients,
+        'capture': args.replay,
+        'speed': args.speed,
+        'replay': replay,
+        'bridge_cpu_ms_per_message': round(cpu_used * 1000 / replay['messages'], 3) if replay['messages'] else None,
+        'pushes_per_client': round(sum(received) / len(received), 1) if received else None,
+        'telemetry_latency_ms': {'count': len(latencies), 'p50': percentile(latencies, 0.5),
+                                 'p99': percentile(latencies, 0.99)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=5, help='simulated Socket.IO clients')
+    parser.add_argument('--stations', type=int, default=1, help='simulated controllers, each its own station')
+    parser.add_argument('--duration', type=float, default=20.0, help='measurement window in seconds')
+    parser.add_argument('--rate', type=float, default=20.0, help='simulated controller status frames per second')
+    parser.add_argument('--command-rate', type=float, default=5.0, help='commands per second per client')
+    parser.add_argument('--telemetry', default='binary', choices=('binary', 'json'),
+                        help='status format the bridge negotiates with the simulators')
+    parser.add_argument('--reconnects', type=int, default=0, help='link drops to time recovery from')
+    parser.add_argument('--replay', help='replay this link capture (capture.py) instead of running simulators')
+    parser.add_argument('--speed', type=float, default=0.0, help='replay speed, 1 = as recorded, 0 = flat out')
+    parser.add_argument('--bridge-url', help='benchmark an already running bridge instead of starting app.py')
+    parser.add_argument('--tcp-port', type=int, default=1053, help='controller port of --bridge-url')
+    parser.add_argument('--async-mode', default='eventlet', choices=('eventlet', 'threading'),
+                        help='Flask-SocketIO async_mode for the bridge')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.replay and args.bridge_url:
+        parser.error('--replay starts its own bridge; it cannot be combined with --bridge-url')
+    report = run_replay_bench(args) if args.replay else run_bench(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:32} {value}")
+
+
+if __name__ == '__main__':
+    main()
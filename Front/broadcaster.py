@@ -0,0 +1,118 @@
+"""Rate-limited fan-out of telemetry from the controller loop to Socket.IO clients"""
+import threading
+import time
+import logging
+
+from metrics import REGISTRY
+
+FLUSH_SECONDS = REGISTRY.histogram('exfoliator_emit_fanout_seconds',
+                                   'Time to emit one broadcaster flush to every Socket.IO client')
+EMITS = REGISTRY.counter('exfoliator_telemetry_emits_total', 'Telemetry payloads emitted to clients')
+
+
+class ClientQueue:
+    """Latest unsent payload per topic for one browser, plus whether it is still busy with the last push"""
+    def __init__(self, device=None):
+        self.device = device  # Station whose telemetry this browser is watching
+        self.pending = {}
+        self.awaiting_acks = 0
+        self.sent_at = 0.0
+        self.dropped = 0  # Frames superseded before this client could take them
+
+    def put(self, topic, payload, merge):
+        current = self.pending.get(topic)
+        if current is None:
+            self.pending[topic] = dict(payload) if merge else payload
+            return
+        self.dropped += 1
+        if merge:
+            current.update(payload)
+        else:
+            self.pending[topic] = payload
+
+    def take(self, now, ack_timeout):
+        """Hand over everything pending, unless the client has not acknowledged the previous push yet"""
+        if not self.pending:
+            return []
+        if self.awaiting_acks and now - self.sent_at < ack_timeout:
+            return []
+        frames = list(self.pending.items())
+        self.pending.clear()
+        self.awaiting_acks = len(frames)
+        self.sent_at = now
+        return frames
+
+
+class TelemetryBroadcaster:
+    """Sits between parse_json_status and Socket.IO so controller I/O never waits on browser I/O.
+
+    publish() only stores the newest payload per topic in each client's queue. A background
+    task pushes those queues at rate_hz, and a client that has not acknowledged its previous
+    push is skipped, so its queue keeps coalescing instead of backing up.
+    """
+    def __init__(self, socketio, rate_hz=20.0, ack_timeout=2.0):
+        self.socketio = socketio
+        self.interval = 1.0 / rate_hz
+        self.ack_timeout = ack_timeout
+        self.lock = threading.Lock()
+        self.clients = {}
+
+    def add_client(self, sid, device=None):
+        with self.lock:
+            self.clients[sid] = ClientQueue(device)
+
+    def set_device(self, sid, device):
+        """Point a client at another station, dropping anything still pending from the old one"""
+        with self.lock:
+            client = self.clients.get(sid)
+            if client:
+                client.device = device
+                client.pending.clear()
+
+    def remove_client(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def publish(self, topic, payload, merge=False, device=None):
+        """Queue a payload for every client watching device (every client if None);
+        merge=True folds dict payloads into the pending one"""
+        with self.lock:
+            for client in self.clients.values():
+                if device is None or client.device == device:
+                    client.put(topic, payload, merge)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.clients),
+                'dropped': sum(client.dropped for client in self.clients.values())
+            }
+
+    def run(self):
+        """Background task: flush client queues at the configured rate"""
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("Telemetry broadcast error: %s", e)
+
+    def flush(self):
+        now = time.time()
+        with self.lock:
+            batches = [(sid, client.take(now, self.ack_timeout)) for sid, client in self.clients.items()]
+        started = time.perf_counter()
+        emitted = 0
+        for sid, frames in batches:
+            for topic, payload in frames:
+                self.socketio.emit(topic, payload, to=sid, callback=lambda *args, sid=sid: self.acked(sid))
+                emitted += 1
+        if emitted:
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+            EMITS.inc(emitted)
+
+    def acked(self, sid):
+        with self.lock:
+            client = self.clients.get(sid)
+            if client and client.awaiting_acks:
+                client.awaiting_acks -= 1
@@ -0,0 +1,192 @@
+"""Raw controller link capture and replay.
+
+Every message read_response() hands to handle_controller_message() (status JSON and binary
+frames, command replies, PONGs, alarms) is appended to a per-connection session file together
+with the time it was read. Replaying a capture feeds the same messages back through
+handle_controller_message() into a station with no controller attached, so the real parse,
+diff, history and Socket.IO fan-out run and the page can watch a past session:
+
+    POST /replay {"capture": "station1/capture-20240501-101500.bin", "speed": 1}
+
+speed 1 keeps the recorded timing, N plays N times faster and 0 as fast as possible, which
+makes a capture a repeatable, hardware-free throughput benchmark of the bridge (see bench.py
+--replay). File layout: a short header, then per message a float64 timestamp, a uint8 kind
+(0 text line, 1 binary status frame), a uint16 length and the message bytes.
+
+    python capture.py list [directory]
+    python capture.py dump <file.bin>
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from recorder import TelemetryRecorder
+
+MAGIC = b'EXFCAP'
+VERSION = 1
+HEADER = struct.Struct('<6sH')  # magic, version
+RECORD = struct.Struct('<dBH')  # timestamp, kind, length; the message bytes follow
+TEXT, FRAME = 0, 1
+YIELD_EVERY = 100  # Messages between sleep(0)s when replaying flat out, so other tasks still run
+
+
+class LinkCapture(TelemetryRecorder):
+    """Appends raw controller messages to capture files from the recorder's writer thread"""
+    prefix = 'capture'
+
+    def header(self):
+        return HEADER.pack(MAGIC, VERSION)
+
+    def encode(self, batch):
+        parts = []
+        for timestamp, message in batch:
+            if isinstance(message, bytes):
+                kind, data = FRAME, message
+            else:
+                kind, data = TEXT, message.encode()
+            parts.append(RECORD.pack(timestamp, kind, len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+
+class CaptureFile:
+    """Read-only, memory-mapped view of one capture; iterating yields (timestamp, message)"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self.map, 0) if len(self.map) >= HEADER.size else (None, None)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} link capture")
+
+    def close(self):
+        self.map.close()
+
+    def __iter__(self):
+        # A partially written trailing message is ignored
+        offset, size = HEADER.size, len(self.map)
+        while offset + RECORD.size <= size:
+            timestamp, kind, length = RECORD.unpack_from(self.map, offset)
+            start = offset + RECORD.size
+            if start + length > size:
+                return
+            data = self.map[start:start + length]
+            yield timestamp, data if kind == FRAME else data.decode(errors='replace')
+            offset = start + length
+
+    def summary(self):
+        count, first, last = 0, None, None
+        for timestamp, _ in self:
+            count += 1
+            first = timestamp if first is None else first
+            last = timestamp
+        return {'messages': count, 'started_at': first, 'span_s': round(last - first, 3) if count else 0.0}
+
+
+def list_captures(directory):
+    """Capture files under directory (one subdirectory per station), relative to it, oldest first"""
+    found = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.startswith(LinkCapture.prefix) and name.endswith('.bin'):
+                path = os.path.join(root, name)
+                found.append((os.path.getmtime(path), os.path.relpath(path, directory)))
+    return [name for _, name in sorted(found)]
+
+
+class CapturePlayback:
+    """Feeds a capture to handler(message) with its recorded timing scaled by 1/speed
+    (speed 0: as fast as possible). sleep must be the server's (socketio.sleep) so a
+    replay cooperates with the other tasks."""
+    def __init__(self, path, handler, speed=1.0, sleep=time.sleep):
+        if speed < 0:
+            raise ValueError("speed must be 0 (as fast as possible) or positive")
+        self.capture = CaptureFile(path)
+        self.handler = handler
+        self.speed = speed
+        self.sleep = sleep
+        self.stopping = False
+        self.done = False  # Set once run() has returned; a playback is never restarted
+        self.stats = {'capture': path, 'speed': speed, 'messages': 0, 'frames': 0, 'lines': 0,
+                      'errors': 0, 'status': 'pending'}
+
+    def stop(self):
+        self.stopping = True
+
+    def run(self):
+        """Replay the whole capture (or until stop()); returns self.stats"""
+        self.stats['status'] = 'running'
+        handler_seconds = []
+        behind = 0.0
+        started = time.perf_counter()
+        first = None
+        try:
+            for timestamp, message in self.capture:
+                if self.stopping:
+                    break
+                if first is None:
+                    first = timestamp
+                if self.speed:
+                    wait = (timestamp - first) / self.speed - (time.perf_counter() - started)
+                    if wait > 0:
+                        self.sleep(wait)
+                    else:
+                        behind = max(behind, -wait)
+                elif self.stats['messages'] % YIELD_EVERY == 0:
+                    self.sleep(0)
+                handled = time.perf_counter()
+                try:
+                    self.handler(message)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logging.error("Replay of %s: handler failed: %s", self.capture.path, e)
+                handler_seconds.append(time.perf_counter() - handled)
+                self.stats['messages'] += 1
+                self.stats['frames' if isinstance(message, bytes) else 'lines'] += 1
+                self.stats['recorded_s'] = round(timestamp - first, 3)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.capture.close()
+            handler_seconds.sort()
+            count = len(handler_seconds)
+            self.stats.update({
+                'status': 'stopped' if self.stopping else 'finished',
+                'elapsed_s': round(elapsed, 3),
+                'messages_per_s': round(count / elapsed, 1) if elapsed > 0 else None,
+                'handler_us': {
+                    'mean': round(sum(handler_seconds) / count * 1e6, 1),
+                    'p50': round(handler_seconds[count // 2] * 1e6, 1),
+                    'p99': round(handler_seconds[min(count - 1, int(count * 0.99))] * 1e6, 1),
+                } if count else None,
+                # How far playback fell behind the recorded timing; large means the bridge can't keep up
+                'max_behind_ms': round(behind * 1000, 1),
+            })
+            self.done = True
+        return self.stats
+
+
+def main(argv):
+    if len(argv) >= 1 and argv[0] == 'list':
+        directory = argv[1] if len(argv) > 1 else 'captures'
+        for name in list_captures(directory):
+            capture = CaptureFile(os.path.join(directory, name))
+            summary = capture.summary()
+            capture.close()
+            print(f"{name}\t{summary['messages']} messages\t{summary['span_s']:.0f}s")
+        return 0
+    if len(argv) >= 2 and argv[0] == 'dump':
+        capture = CaptureFile(argv[1])
+        for timestamp, message in capture:
+            print(f"{timestamp:.3f}\t{message.hex() if isinstance(message, bytes) else message}")
+        capture.close()
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""Typed registry of the controller's commands (processCommand in Main.ino).
+
+Every command the bridge sends is built here: arguments are type- and range-checked on the Pi
+so a bad request never costs a controller round trip, and the wire bytes are produced once.
+Commands without arguments are compiled at import and reused.
+
+    commands.build('MoveX', 120)      # from typed values
+    commands.parse('Tape 50 40 2000')  # from text (custom commands, batches, recipes)
+
+Both raise ValueError saying what is wrong.
+"""
+import math
+
+# Travel the controller clamps moves to (XAxisLimitMM / YAxisLimitMM in MotorControllers.ino)
+AXIS_LIMITS_MM = {'x': (0.0, 220.0), 'y': (0.0, 70.0)}
+MAX_SET_TEMP = 230.0       # Heater.ino caps the setpoint here (material limit)
+TAPE_LIMIT = 100           # tapeMaxSpeed / tapeMaxTorque in MotorControllers.ino
+
+# Controls on the page -> command names
+PNEUMATICS = {
+    'nozzle': {'extend': 'ExtendNozzle', 'retract': 'RetractNozzle'},
+    'stage': {'extend': 'ExtendChipStage', 'retract': 'RetractChipStage'},
+    'stamp': {'extend': 'ExtendStamp', 'retract': 'RetractStamp'}
+}
+VACUUMS = {
+    'vacnozzle': {'on': 'VacNozzleOn', 'off': 'VacNozzleOff'},
+    'chuck': {'on': 'ChuckOn', 'off': 'ChuckOff'}
+}
+
+
+class Param:
+    """One typed command argument with optional inclusive bounds, or a fixed set of words"""
+    def __init__(self, name, kind=float, low=None, high=None, choices=None):
+        self.name = name
+        self.kind = kind
+        self.low = low
+        self.high = high
+        self.choices = choices
+
+    def check(self, value):
+        """Return value as self.kind, or raise ValueError"""
+        if self.choices is not None:
+            if value not in self.choices:
+                raise ValueError(f"{self.name} must be one of {', '.join(self.choices)}")
+            return value
+        if isinstance(value, str):
+            try:
+                value = self.kind(value)
+            except ValueError:
+                raise ValueError(f"{self.name} '{value}' is not {self.description()}") from None
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{self.name} must be {self.description()}")
+        if not math.isfinite(value):
+            raise ValueError(f"{self.name} must be a finite number")
+        if self.kind is int:
+            if value != int(value):
+                raise ValueError(f"{self.name} must be {self.description()}")
+            value = int(value)
+        else:
+            value = float(value)
+        if self.low is not None and value < self.low:
+            raise ValueError(f"{self.name} {format_number(value)} is below {format_number(self.low)}")
+        if self.high is not None and value > self.high:
+            raise ValueError(f"{self.name} {format_number(value)} is above {format_number(self.high)}")
+        return value
+
+    def description(self):
+        return 'an integer' if self.kind is int else 'a number'
+
+
+def format_number(value):
+    """Shortest text the firmware's toFloat()/toInt() reads back to the same value (to 0.001)"""
+    if not isinstance(value, float):
+        return str(value)
+    return f"{value:.3f}".rstrip('0').rstrip('.') or '0'
+
+
+class Command:
+    """A checked command with its wire encoding"""
+    __slots__ = ('name', 'args', 'text', 'encoded')
+
+    def __init__(self, name, args=()):
+        self.name = name
+        self.args = args
+        self.text = ' '.join([name, *(format_number(arg) for arg in args)])
+        self.encoded = f"{self.text}\n".encode()
+
+    def __str__(self):
+        return self.text
+
+
+class CommandSpec:
+    """How one controller command is spelled and what its arguments may be"""
+    def __init__(self, name, *params):
+        self.name = name
+        self.params = params
+        self.constant = None if params else Command(name)
+
+    def build(self, *values):
+        if self.constant:
+            if values:
+                raise ValueError(f"{self.name} takes no arguments")
+            return self.constant
+        if len(values) != len(self.params):
+            raise ValueError(f"{self.name} takes {len(self.params)} argument(s) "
+                             f"({', '.join(param.name for param in self.params)}), got {len(values)}")
+        return Command(self.name, tuple(param.check(value) for param, value in zip(self.params, values)))
+
+
+def _axis_param(axis):
+    low, high = AXIS_LIMITS_MM[axis]
+    return Param('position', float, low, high)
+
+
+SPECS = {spec.name: spec for spec in (
+    CommandSpec('MoveX', _axis_param('x')),
+    CommandSpec('MoveY', _axis_param('y')),
+    CommandSpec('EnableX'),
+    CommandSpec('EnableY'),
+    CommandSpec('DisableX'),
+    CommandSpec('DisableY'),
+    *(CommandSpec(name) for actions in PNEUMATICS.values() for name in actions.values()),
+    *(CommandSpec(name) for actions in VACUUMS.values() for name in actions.values()),
+    CommandSpec('SetTemperature', Param('temperature', float, 0.0, MAX_SET_TEMP)),
+    CommandSpec('Tape', Param('speed', int, -TAPE_LIMIT, TAPE_LIMIT), Param('torque', int, -TAPE_LIMIT, TAPE_LIMIT),
+                Param('duration', int, 0)),
+    CommandSpec('StopTape'),
+    CommandSpec('SetTelemetry', Param('format', choices=('json', 'binary')), Param('interval', int, 0)),
+    CommandSpec('STOP'),
+)}
+
+
+def build(name, *values):
+    """Command from its name and typed argument values"""
+    spec = SPECS.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown command '{name}'")
+    return spec.build(*values)
+
+
+def parse(text):
+    """Command from a line of text such as 'MoveX 120'"""
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("Command must be a non-empty string")
+    name, *args = text.split()
+    return build(name, *args)
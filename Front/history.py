@@ -0,0 +1,119 @@
+"""In-memory telemetry history: a fixed-size ring buffer of timestamped status samples"""
+import threading
+from array import array
+
+import numpy as np
+
+# Every field of the status JSON (Main/ConnectionLayer.txt), flattened to numbers.
+# tape is split into its two values and motor states are stored as MOTOR_STATES indices.
+FIELDS = (
+    'x', 'y', 'stateX', 'stateY', 'tapeSpeed', 'tapeTorque',
+    'nozzle', 'stage', 'stamp', 'vacnozzle', 'chuck',
+    'settemp', 'temp', 'eStopTriggered'
+)
+MOTOR_STATES = ('MOTOR_DISABLED', 'MOTOR_ENABLING', 'MOTOR_READY', 'MOTOR_MOVING', 'MOTOR_FAULTED')
+MOTOR_STATE_CODES = {state: code for code, state in enumerate(MOTOR_STATES)}
+
+
+class TelemetryHistory:
+    """Column-per-field ring buffer backed by preallocated arrays.
+
+    Memory is fixed at construction (8 bytes per timestamp plus 4 per field per sample) and
+    append() just overwrites the oldest slot, so the controller loop pays O(1) per frame.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.columns = [array('f', bytes(4 * capacity)) for _ in FIELDS]
+        self.next = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        """Store one sample; values holds one number per entry of FIELDS, in order"""
+        with self.lock:
+            i = self.next
+            self.times[i] = timestamp
+            for column, value in zip(self.columns, values):
+                column[i] = value
+            self.next = (i + 1) % self.capacity
+            if self.count < self.capacity:
+                self.count += 1
+
+    def last(self, field):
+        """Most recent value of field, or None before the first sample"""
+        with self.lock:
+            if not self.count:
+                return None
+            return self.columns[FIELDS.index(field)][(self.next - 1) % self.capacity]
+
+    def copy_range(self, start, end, fields):
+        """Copy out (times, columns) for samples with start <= t <= end, oldest first"""
+        indexes = [FIELDS.index(field) for field in fields]
+        with self.lock:
+            if not self.count:
+                return [], [[] for _ in indexes]
+            oldest = (self.next - self.count) % self.capacity
+            first = self.search(oldest, start)
+            stop = self.search(oldest, end, right=True)
+            # Physical slices of the ring; a range that wraps comes out in two pieces
+            a, b = oldest + first, oldest + stop
+            if b <= self.capacity:
+                pieces = [(a, b)]
+            elif a >= self.capacity:
+                pieces = [(a - self.capacity, b - self.capacity)]
+            else:
+                pieces = [(a, self.capacity), (0, b - self.capacity)]
+            times = array('d')
+            columns = [array('f') for _ in indexes]
+            for a, b in pieces:
+                times.extend(self.times[a:b])
+                for column, index in zip(columns, indexes):
+                    column.extend(self.columns[index][a:b])
+        return times, columns
+
+    def search(self, oldest, timestamp, right=False):
+        """Binary search the logical (oldest-first) position of timestamp; caller holds lock"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.times[(oldest + mid) % self.capacity]
+            if value < timestamp or (right and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def window(self, start, end, buckets, fields=FIELDS):
+        """Downsample [start, end] into equal buckets with min/max/mean per field.
+        Empty buckets report None."""
+        times, columns = self.copy_range(start, end, fields)
+        width = (end - start) / buckets if end > start else 1.0
+        times = np.asarray(times, dtype=np.float64)
+        # Samples are in time order, so each bucket is one contiguous run that reduceat can fold
+        index = np.minimum(((times - start) / width).astype(np.int64), buckets - 1)
+        counts = np.bincount(index, minlength=buckets)
+        filled = counts > 0
+        firsts = np.searchsorted(index, np.flatnonzero(filled))
+
+        def per_bucket(values):
+            out = np.full(buckets, None, dtype=object)
+            out[filled] = values.tolist()
+            return out.tolist()
+
+        stats = {}
+        for field, column in zip(fields, columns):
+            values = np.asarray(column, dtype=np.float64)
+            stats[field] = {
+                'min': per_bucket(np.minimum.reduceat(values, firsts)),
+                'max': per_bucket(np.maximum.reduceat(values, firsts)),
+                'mean': per_bucket(np.add.reduceat(values, firsts) / counts[filled])
+            }
+        return {
+            'start': start,
+            'end': end,
+            'bucket_seconds': width,
+            'time': [start + width * bucket for bucket in range(buckets)],
+            'count': counts.tolist(),
+            'fields': stats
+        }
@@ -0,0 +1,165 @@
+"""Low-overhead counters, gauges and latency histograms for the bridge's hot paths.
+
+Recording a value is a few integer/float additions with no locking and no allocation;
+everything expensive (formatting, quantile estimates, gauge callbacks) happens only when
+/metrics is scraped or a diagnostics subscriber is listening. render() produces the
+Prometheus text exposition format.
+"""
+import bisect
+import math
+
+# Upper bounds in seconds, from a fast socket write up to a command that nearly timed out
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """Monotonic count, optionally split by the value of one label"""
+    kind = 'counter'
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, amount=1, label_value=None):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def samples(self):
+        if not self.values:
+            return [(self.name, None, 0)]
+        return [(self.name, {self.label: value} if self.label else None, count)
+                for value, count in sorted(self.values.items(), key=lambda item: str(item[0]))]
+
+    def snapshot(self):
+        if self.label:
+            return dict(self.values)
+        return self.values.get(None, 0)
+
+
+class Gauge:
+    """Current value, either set by the caller or read from function() at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+    def samples(self):
+        return [(self.name, None, self.get())]
+
+    def snapshot(self):
+        return self.get()
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Unlocked on purpose: nearly every observation comes from the communication thread,
+        # and a rare lost increment from a concurrent writer is an acceptable price
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """Estimate a quantile by interpolating inside the bucket that contains it"""
+        counts, count = list(self.counts), sum(self.counts)
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[index - 1] if index else 0.0
+                if index == len(self.bounds):
+                    return lower  # Beyond the last bound; report it as a floor
+                return lower + (self.bounds[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += bucket_count
+            samples.append((self.name + '_bucket', {'le': format_value(bound)}, cumulative))
+        samples.append((self.name + '_sum', None, self.sum))
+        samples.append((self.name + '_count', None, cumulative))
+        return samples
+
+    def snapshot(self):
+        """Summary in milliseconds for the live diagnostics channel"""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count * 1000, 3),
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3)
+        }
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together for /metrics and the diagnostics channel"""
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self.register(Counter(name, help, label))
+
+    def gauge(self, name, help, function=None):
+        return self.register(Gauge(name, help, function))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self):
+        """Every metric in the Prometheus text format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    name += '{' + ','.join(f'{key}="{label}"' for key, label in labels.items()) + '}'
+                lines.append(f"{name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,119 @@
+"""Completion tracking for MoveX/MoveY so callers can wait for the axis instead of padding with delays"""
+import itertools
+import threading
+import time
+from collections import deque
+
+import commands
+
+POSITION_TOLERANCE_MM = 0.05
+RECENT_MOVES = 50
+
+_move_ids = itertools.count(1)
+
+
+class Move:
+    """One commanded move, finished once the axis reports MOTOR_READY at the target"""
+    def __init__(self, axis, target, pending):
+        self.id = next(_move_ids)
+        self.axis = axis
+        self.target = target
+        self.pending = pending
+        self.ack_frame = None  # Frame count when the controller accepted the move
+        self.status = 'pending'
+        self.completed_at = None
+        self.done = threading.Event()
+
+    def result(self):
+        started = self.pending.sent_at or self.pending.queued_at
+        return {
+            'id': self.id,
+            'axis': self.axis.upper(),
+            'target': self.target,
+            'status': self.status,
+            'command_id': self.pending.id,
+            'duration_ms': round((self.completed_at - started) * 1000, 1) if self.completed_at else None
+        }
+
+
+class MotionTracker:
+    """Watches motor states from parse_json_status and resolves moves as they finish.
+
+    The controller answers MoveX/MoveY with OK before the motor starts, and the status frame it
+    sends after that reply already reflects the commanded move, so a move is complete on the
+    first frame after the OK that shows MOTOR_READY at the target.
+    """
+    def __init__(self, server, on_complete=None):
+        self.server = server
+        self.on_complete = on_complete
+        self.lock = threading.Lock()
+        self.active = {'x': None, 'y': None}
+        self.moves = {}
+        self.recent = deque(maxlen=RECENT_MOVES)
+
+    def start_move(self, axis, position, sid=None):
+        """Queue a move; raises ValueError (before queueing anything) if position is outside the axis travel"""
+        command = commands.build(f"Move{axis.upper()}", position)
+        axis = axis.lower()
+        pending = self.server.enqueue_command(command, sid)
+        move = Move(axis, command.args[0], pending)
+        with self.lock:
+            superseded = self.active[axis]
+            self.active[axis] = move
+            self.moves[move.id] = move
+            self.recent.append(move)
+            while len(self.moves) > RECENT_MOVES:
+                self.moves.pop(next(iter(self.moves)))
+        if superseded:
+            self.finish(superseded, 'superseded')
+        pending.future.add_done_callback(lambda future: self.acked(move, future.result()))
+        return move
+
+    def acked(self, move, reply):
+        if reply['status'] != 'ok':
+            self.finish(move, 'rejected' if reply['status'] == 'rejected' else reply['status'])
+        else:
+            move.ack_frame = self.server.frame_count
+
+    def on_status(self, state, frame):
+        """Called for every status frame with the flat snapshot and its frame number"""
+        for axis, state_key in (('x', 'stateX'), ('y', 'stateY')):
+            move = self.active[axis]
+            if not move or move.ack_frame is None or frame <= move.ack_frame:
+                continue
+            motor_state = state.get(state_key)
+            if state.get('eStopTriggered'):
+                self.finish(move, 'emergency_stop')
+            elif motor_state == 'MOTOR_FAULTED':
+                self.finish(move, 'faulted')
+            elif motor_state == 'MOTOR_DISABLED':
+                self.finish(move, 'disabled')
+            elif motor_state == 'MOTOR_READY' and abs(state.get(axis, 0) - move.target) <= POSITION_TOLERANCE_MM:
+                self.finish(move, 'completed')
+
+    def finish(self, move, status):
+        with self.lock:
+            if move.done.is_set():
+                return
+            move.status = status
+            move.completed_at = time.time()
+            if self.active[move.axis] is move:
+                self.active[move.axis] = None
+            move.done.set()
+        if self.on_complete:
+            self.on_complete(move)
+
+    def get(self, move_id):
+        return self.moves.get(move_id)
+
+    def wait(self, move, timeout):
+        """Block until the move finishes; returns its result, with status 'waiting' on timeout"""
+        if not move.done.wait(timeout):
+            result = move.result()
+            result['status'] = 'waiting'
+            return result
+        return move.result()
+
+    def recent_results(self):
+        with self.lock:
+            return [move.result() for move in self.recent]
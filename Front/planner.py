@@ -0,0 +1,351 @@
+"""Scan-path planning and streaming for 2D sample maps.
+
+A scan visits a grid or a list of XY points, optionally running commands and dwelling at each:
+
+    {"grid": {"x": [10, 200, 20], "y": [5, 65, 7]}}            # [first, last, count] per axis
+    {"points": [[12.5, 30], [80, 4.2], ...], "order": "shortest"}
+    options: "order" serpentine (grids) | shortest (point lists) | given,
+             "at_point": ["ExtendStamp", "RetractStamp"], "dwell": 0.5, "merge": true
+
+Travel between points is costed in time, not distance: MoveX and MoveY run concurrently, so a
+hop costs the slower axis's trapezoidal move plus the command/telemetry round trip. Grids are
+ordered as a serpentine raster along the axis with more points per row, starting from the corner
+nearest the stage; point lists by nearest neighbour from the stage, improved by 2-opt until no
+swap helps or TWO_OPT_SECONDS is spent. With nothing to do at the points (no at_point, no dwell)
+runs of points along one axis in one direction collapse into a single move.
+
+ScanRunner streams the path: only the axes that change are commanded, both axes of a hop go out
+back to back, and the next hop is released as soon as MotionTracker sees MOTOR_READY at the
+target. The result compares the planned cycle time with the measured one and fits the axis
+speed and per-move overhead from this run, to tune AXIS_SPEED_MM_S and MOVE_OVERHEAD_S with.
+"""
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+
+import commands
+
+AXIS_SPEED_MM_S = 50.0      # Cruise speed the ClearPath motors reach (their own tuning; Main.ino leaves VelMax open)
+AXIS_ACCEL_MM_S2 = 500.0    # and their acceleration
+MOVE_OVERHEAD_S = 0.15      # Per hop: command round trip plus the status frame that shows MOTOR_READY
+COMMAND_OVERHEAD_S = 0.05   # Per at_point command
+MAX_SCAN_POINTS = 2000      # Keeps a plan (nearest neighbour + 2-opt) well inside the 1 s heartbeat
+TWO_OPT_SECONDS = 0.3       # Time budget for improving a nearest-neighbour tour
+MIN_MOVE_TIMEOUT = 10.0     # A hop that takes this long, or 3x its estimate, has failed
+COMMAND_REPLY_TIMEOUT = 10.0
+PROGRESS_INTERVAL = 0.25    # Seconds between scan_progress events
+ORDERS = ('serpentine', 'shortest', 'given')
+
+
+def axis_time(distance, speed=AXIS_SPEED_MM_S, accel=AXIS_ACCEL_MM_S2):
+    """Seconds for a trapezoidal (or, if too short to reach speed, triangular) move; works on arrays"""
+    distance = np.abs(distance)
+    ramp = speed * speed / accel  # Distance spent accelerating and braking at full speed
+    return np.where(distance >= ramp, distance / speed + speed / accel, 2 * np.sqrt(distance / accel))
+
+
+def hop_time(dx, dy):
+    """Seconds to move by (dx, dy) with both axes running at once, plus the per-move overhead"""
+    moving = (np.abs(dx) > 0) | (np.abs(dy) > 0)
+    return np.where(moving, np.maximum(axis_time(dx), axis_time(dy)) + MOVE_OVERHEAD_S, 0.0)
+
+
+def grid_points(grid):
+    """Rows of points for {"x": [first, last, count], "y": [...]}, as an (ny, nx, 2) array"""
+    axes = []
+    for axis in ('x', 'y'):
+        spec = grid.get(axis) if isinstance(grid, dict) else None
+        if not isinstance(spec, (list, tuple)) or len(spec) != 3:
+            raise ValueError(f"grid.{axis} must be [first, last, count]")
+        first, last, count = spec
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            raise ValueError(f"grid.{axis} count must be a positive integer")
+        if not all(isinstance(end, (int, float)) and not isinstance(end, bool) for end in (first, last)):
+            raise ValueError(f"grid.{axis} first and last must be numbers")
+        axes.append(np.linspace(float(first), float(last), count))
+    xs, ys = axes
+    if len(xs) * len(ys) > MAX_SCAN_POINTS:
+        raise ValueError(f"A scan may have at most {MAX_SCAN_POINTS} points")
+    return np.stack(np.meshgrid(xs, ys), axis=-1)
+
+
+def serpentine(grid, start):
+    """Boustrophedon order of an (ny, nx, 2) grid: rows along the axis with more points, alternating
+    direction, beginning at the corner nearest start"""
+    if grid.shape[1] < grid.shape[0]:
+        grid = grid.transpose(1, 0, 2)  # Rows along Y instead
+    corners = [(row_flip, col_flip) for row_flip in (False, True) for col_flip in (False, True)]
+
+    def corner(flips):
+        rows = grid[::-1] if flips[0] else grid
+        return rows[0, -1] if flips[1] else rows[0, 0]
+    row_flip, col_flip = min(corners, key=lambda flips: float(hop_time(*(corner(flips) - start))))
+    rows = grid[::-1] if row_flip else grid
+    path = [row[::-1] if (index % 2 == 1) != col_flip else row for index, row in enumerate(rows)]
+    return np.concatenate(path)
+
+
+def nearest_neighbour(points, start):
+    """Greedy tour: from start, always hop to the quickest unvisited point"""
+    remaining = np.ones(len(points), dtype=bool)
+    order = np.empty(len(points), dtype=np.int64)
+    position = start
+    for step in range(len(points)):
+        cost = hop_time(points[:, 0] - position[0], points[:, 1] - position[1])
+        cost[~remaining] = np.inf
+        nearest = int(np.argmin(cost))
+        order[step] = nearest
+        remaining[nearest] = False
+        position = points[nearest]
+    return order
+
+
+def two_opt(path, start, budget=TWO_OPT_SECONDS):
+    """Improve an open path from start by reversing segments while that saves time.
+    Returns the improved (n, 2) path."""
+    path = np.vstack([start, path])  # Node 0 is the fixed start
+    deadline = time.monotonic() + budget
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(len(path) - 2):
+            # Replace edges (i, i+1) and (j, j+1) by (i, j) and (i+1, j+1) for every j > i+1 at once
+            a, b = path[i], path[i + 1]
+            c, d = path[i + 2:], np.vstack([path[i + 3:], [np.nan, np.nan]])
+            before = float(hop_time(*(b - a))) + hop_time(d[:, 0] - c[:, 0], d[:, 1] - c[:, 1])
+            after = hop_time(c[:, 0] - a[0], c[:, 1] - a[1]) + hop_time(d[:, 0] - b[0], d[:, 1] - b[1])
+            # The open end has no (j+1): reversing the tail only trades the (i, i+1) edge
+            before[-1] = float(hop_time(*(b - a)))
+            after[-1] = float(hop_time(*(c[-1] - a)))
+            gain = before - after
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-9:
+                j += i + 2
+                path[i + 1:j + 1] = path[i + 1:j + 1][::-1].copy()
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return path[1:]
+
+
+def merge_collinear(path, start):
+    """Drop points that lie inside a run of moves along one axis in one direction"""
+    keep = []
+    previous = start
+    for index, point in enumerate(path):
+        if index + 1 < len(path):
+            following = path[index + 1]
+            into, out = point - previous, following - point
+            same_axis = (into[1] == 0 and out[1] == 0) or (into[0] == 0 and out[0] == 0)
+            if same_axis and np.dot(into, out) > 0:
+                previous = point
+                continue  # Passed through on the way to following
+        keep.append(point)
+        previous = point
+    return np.array(keep).reshape(-1, 2)
+
+
+def plan_scan(spec, start):
+    """Validate a scan request and plan it from start (x, y). Returns a ScanPlan; raises ValueError."""
+    if not isinstance(spec, dict) or ('grid' in spec) == ('points' in spec):
+        raise ValueError("A scan needs exactly one of 'grid' or 'points'")
+    start = np.asarray(start, dtype=np.float64)
+    if 'grid' in spec:
+        grid = grid_points(spec['grid'])
+        order = spec.get('order', 'serpentine')
+        points = grid.reshape(-1, 2)
+    else:
+        try:
+            points = np.asarray(spec['points'], dtype=np.float64)
+        except (TypeError, ValueError):
+            points = None
+        if points is None or points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError("points must be a list of [x, y] pairs")
+        if not len(points) or len(points) > MAX_SCAN_POINTS:
+            raise ValueError(f"A scan needs 1 to {MAX_SCAN_POINTS} points")
+        order = spec.get('order', 'shortest')
+    if order not in ORDERS or (order == 'serpentine' and 'grid' not in spec):
+        raise ValueError(f"order must be one of {', '.join(ORDERS)} (serpentine needs a grid)")
+    for x, y in points:
+        # Same range checks as a MoveX/MoveY sent by hand, before anything moves
+        commands.build('MoveX', float(x))
+        commands.build('MoveY', float(y))
+    if not isinstance(spec.get('at_point', []), list):
+        raise ValueError("at_point must be a list of commands")
+    at_point = [commands.parse(text) for text in spec.get('at_point', [])]
+    for command in at_point:
+        # The planner owns the axes while it runs, and an emergency stop has its own button
+        if command.name in ('MoveX', 'MoveY', 'STOP'):
+            raise ValueError(f"{command.name} is not allowed in at_point")
+    dwell = spec.get('dwell', 0)
+    if not isinstance(dwell, (int, float)) or isinstance(dwell, bool) or not 0 <= dwell < math.inf:
+        raise ValueError("dwell must be a non-negative number of seconds")
+
+    if order == 'serpentine':
+        path = serpentine(grid, start)
+    elif order == 'shortest':
+        path = two_opt(points[nearest_neighbour(points, start)], start)
+    else:
+        path = points
+    stops = len(path)
+    if spec.get('merge', True) and not at_point and not dwell:
+        path = merge_collinear(path, start)
+    return ScanPlan(path, start, at_point, float(dwell), order, stops)
+
+
+class ScanPlan:
+    """An ordered path with what to do at each point and its estimated cycle time"""
+    def __init__(self, path, start, at_point, dwell, order, points):
+        self.path = path
+        self.at_point = at_point
+        self.dwell = dwell
+        self.order = order
+        self.points = points  # Points requested; path may be shorter after merging
+        hops = np.diff(np.vstack([start, path]), axis=0)
+        self.hop_estimates = hop_time(hops[:, 0], hops[:, 1])
+        self.travel_mm = float(np.hypot(hops[:, 0], hops[:, 1]).sum())
+        per_point = dwell + COMMAND_OVERHEAD_S * len(at_point)
+        self.estimated_s = float(self.hop_estimates.sum()) + per_point * len(path)
+
+    def summary(self):
+        return {
+            'order': self.order,
+            'points': self.points,
+            'moves': len(self.path),
+            'travel_mm': round(self.travel_mm, 1),
+            'estimated_s': round(self.estimated_s, 1),
+            'at_point': [command.text for command in self.at_point],
+            'dwell': self.dwell,
+        }
+
+
+def fit_moves(distances, durations):
+    """Least-squares overhead + distance / speed over measured hops; None if they can't tell"""
+    distances, durations = np.asarray(distances), np.asarray(durations)
+    if len(distances) < 3 or np.ptp(distances) < 1.0:
+        return None
+    slope, intercept = np.polyfit(distances, durations, 1)
+    if slope <= 0:
+        return None
+    return {'speed_mm_s': round(float(1.0 / slope), 1), 'overhead_s': round(float(intercept), 3)}
+
+
+class ScanRunner:
+    """Streams one planned scan at a time to a station, gating each hop on MotionTracker"""
+    def __init__(self, server, emit):
+        self.server = server
+        self.emit = emit
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_reason = None
+        self.stop_requested = threading.Event()
+        self.current = None
+        self.last_result = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, plan):
+        """Run a plan in the background; returns False if a scan is already running"""
+        with self.lock:
+            if self.running():
+                return False
+            self.stop_requested.clear()
+            self.stop_reason = None
+            self.current = dict(plan.summary(), index=0, started_at=time.time())
+            self.thread = threading.Thread(target=self.run, args=(plan,), daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self, reason='stopped'):
+        if self.running():
+            self.stop_reason = reason
+            self.stop_requested.set()
+
+    def status(self):
+        return {'running': self.running(), 'current': self.current if self.running() else None,
+                'last_result': self.last_result}
+
+    def run(self, plan):
+        started = time.time()
+        status = 'completed'
+        distances, durations = [], []
+        position = (self.server.position['x'], self.server.position['y'])
+        last_progress = 0.0
+        logging.info("Scan started: %s moves, estimated %.1f s", len(plan.path), plan.estimated_s)
+        for index, (x, y) in enumerate(plan.path):
+            self.current['index'] = index
+            hop_started = time.time()
+            status = self.move_to(float(x), float(y), position, float(plan.hop_estimates[index]))
+            if status != 'completed':
+                break
+            distances.append(float(max(abs(x - position[0]), abs(y - position[1]))))
+            durations.append(time.time() - hop_started)
+            position = (x, y)
+            status = self.at_point(plan)
+            if status != 'completed':
+                break
+            now = time.time()
+            if now - last_progress >= PROGRESS_INTERVAL or index + 1 == len(plan.path):
+                last_progress = now
+                elapsed = now - started
+                self.emit('scan_progress', {'index': index, 'moves': len(plan.path), 'elapsed_s': round(elapsed, 1),
+                                            'estimated_s': round(plan.estimated_s, 1)})
+        actual = time.time() - started
+        self.last_result = dict(
+            plan.summary(),
+            status=status,
+            completed_moves=len(durations),
+            started_at=started,
+            actual_s=round(actual, 1),
+            # How far the motion model is off; tune AXIS_SPEED_MM_S / MOVE_OVERHEAD_S from 'fitted'
+            actual_vs_estimate=round(actual / plan.estimated_s, 3) if plan.estimated_s and status == 'completed' else None,
+            fitted=fit_moves(distances, durations)
+        )
+        self.emit('scan_finished', self.last_result)
+        logging.info("Scan %s after %s of %s moves in %.1f s (estimated %.1f s)", status, len(durations),
+                     len(plan.path), actual, plan.estimated_s)
+
+    def move_to(self, x, y, position, estimate):
+        """Command the axes that change and wait for both; returns 'completed' or why not"""
+        if self.stop_requested.is_set():
+            return self.stop_reason
+        if not self.server.connected:
+            return 'not_connected'
+        moves = []
+        try:
+            for axis, target, current in (('x', x, position[0]), ('y', y, position[1])):
+                if target != current:
+                    moves.append(self.server.motion.start_move(axis, target))
+        except ValueError as e:
+            logging.error("Scan move to (%s, %s) refused: %s", x, y, e)
+            return 'invalid'
+        deadline = time.time() + max(MIN_MOVE_TIMEOUT, 3 * estimate)
+        for move in moves:
+            # Wake up regularly so a stop request doesn't wait for the axis
+            while not move.done.wait(0.1):
+                if self.stop_requested.is_set():
+                    return self.stop_reason
+                if time.time() > deadline:
+                    return 'timeout'
+            if move.status != 'completed':
+                return move.status
+        return 'completed'
+
+    def at_point(self, plan):
+        for command in plan.at_point:
+            if self.stop_requested.is_set():
+                return self.stop_reason
+            pending = self.server.enqueue_command(command)
+            try:
+                reply = pending.future.result(timeout=COMMAND_REPLY_TIMEOUT)
+            except Exception:
+                return 'timeout'
+            if reply['status'] != 'ok':
+                return 'command_failed'
+        if plan.dwell and self.stop_requested.wait(plan.dwell):
+            return self.stop_reason
+        return 'completed'
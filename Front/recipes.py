@@ -0,0 +1,249 @@
+"""Server-side macro (recipe) engine: runs stored controller command sequences without the browser.
+
+A recipe is a JSON file in the recipes directory:
+
+    {"steps": [
+        {"command": "SetTemperature 60"},
+        {"heater_ready": {"lead": 5}, "timeout": 600},
+        {"command": "MoveX 120"},
+        {"wait": {"field": "stateX", "equals": "MOTOR_READY"}, "timeout": 30},
+        {"delay": 0.5}
+    ]}
+
+command steps wait for the controller's reply and abort the recipe if it is not OK. wait steps
+hold until a status frame received after the step started satisfies every condition; fields
+use the status JSON names and near/above/below may compare against another field.
+heater_ready steps hold until the stage has settled at its setpoint or, by the heater model in
+thermal.py, will be within tolerance in at most lead seconds without overshooting past it, so
+a recipe can start the next move while the last degree is still coming in.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import commands
+
+RECIPE_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+DEFAULT_WAIT_TIMEOUT = 60.0
+COMMAND_REPLY_TIMEOUT = 10.0
+CONDITION_TESTS = ('equals', 'near', 'above', 'below')
+STEP_KINDS = ('command', 'wait', 'delay', 'heater_ready')
+
+
+def is_duration(value):
+    """A non-negative number of seconds (bools are not numbers here)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value < float('inf')
+
+
+def validate_recipe(recipe):
+    """Raise ValueError describing the first problem with a recipe"""
+    if not isinstance(recipe, dict) or not isinstance(recipe.get('steps'), list) or not recipe['steps']:
+        raise ValueError("A recipe needs a non-empty 'steps' list")
+    for index, step in enumerate(recipe['steps']):
+        kinds = [kind for kind in STEP_KINDS if kind in step] if isinstance(step, dict) else []
+        if len(kinds) != 1:
+            raise ValueError(f"Step {index} must have exactly one of {', '.join(STEP_KINDS)}")
+        if 'command' in step:
+            try:
+                commands.parse(step['command'])
+            except ValueError as e:
+                raise ValueError(f"Step {index}: {e}") from None
+        if 'delay' in step and not is_duration(step['delay']):
+            raise ValueError(f"Step {index}: delay must be a non-negative number of seconds")
+        if 'timeout' in step and not is_duration(step['timeout']):
+            raise ValueError(f"Step {index}: timeout must be a non-negative number of seconds")
+        if 'wait' in step:
+            conditions = step['wait'] if isinstance(step['wait'], list) else [step['wait']]
+            for condition in conditions:
+                if not isinstance(condition, dict) or 'field' not in condition or \
+                        sum(test in condition for test in CONDITION_TESTS) != 1:
+                    raise ValueError(f"Step {index}: each wait condition needs a field and one of {', '.join(CONDITION_TESTS)}")
+                if 'tolerance' in condition and not is_duration(condition['tolerance']):
+                    raise ValueError(f"Step {index}: tolerance must be a non-negative number")
+        if 'heater_ready' in step:
+            options = step['heater_ready']
+            lead = options.get('lead', 0) if isinstance(options, dict) else None
+            if not is_duration(lead):
+                raise ValueError(f"Step {index}: heater_ready needs a non-negative 'lead' in seconds")
+
+
+def describe_step(step):
+    if 'command' in step:
+        return step['command']
+    if 'delay' in step:
+        return f"delay {step['delay']}s"
+    if 'heater_ready' in step:
+        return f"heater ready (lead {step['heater_ready'].get('lead', 0)}s)"
+    conditions = step['wait'] if isinstance(step['wait'], list) else [step['wait']]
+    return 'wait ' + ' and '.join(
+        f"{c['field']} {test} {c[test]}" + (f" ±{c.get('tolerance', 0)}" if test == 'near' else '')
+        for c in conditions for test in CONDITION_TESTS if test in c)
+
+
+def heater_ready(estimate, lead):
+    """True once a thermal.ThermalModel estimate has settled, or predicts the tolerance band
+    within lead seconds without overshooting past it"""
+    if estimate['state'] == 'settled':
+        return True
+    ready_at = estimate.get('ready_at')
+    return ready_at is not None and ready_at - lead <= time.time() and \
+        estimate['overshoot'] <= estimate['tolerance']
+
+
+def condition_met(condition, state):
+    value = state.get(condition['field'])
+    if 'equals' in condition:
+        return value == condition['equals']
+    if not isinstance(value, (int, float)):
+        return False
+    for test in ('near', 'above', 'below'):
+        if test in condition:
+            reference = condition[test]
+            reference = state.get(reference) if isinstance(reference, str) else reference
+            if not isinstance(reference, (int, float)):
+                return False
+            if test == 'near':
+                return abs(value - reference) <= condition.get('tolerance', 0)
+            return value > reference if test == 'above' else value < reference
+    return False
+
+
+class RecipeStore:
+    """Recipe files on disk, one JSON document per name"""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        if not RECIPE_NAME.match(name or ''):
+            raise ValueError("Recipe names may only contain letters, digits, '-' and '_'")
+        return os.path.join(self.directory, f"{name}.json")
+
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def load(self, name):
+        with open(self.path(name)) as f:
+            recipe = json.load(f)
+        validate_recipe(recipe)
+        return recipe
+
+    def save(self, name, recipe):
+        validate_recipe(recipe)
+        path = self.path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(recipe, f, indent=2)
+
+    def delete(self, name):
+        os.remove(self.path(name))
+
+
+class RecipeEngine:
+    """Runs one recipe at a time on its own thread and reports per-step timing through emit()"""
+    def __init__(self, server, emit):
+        self.server = server
+        self.emit = emit
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_reason = None
+        self.stop_requested = threading.Event()
+        self.current = None
+        self.last_result = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, name, recipe):
+        """Start a recipe in the background; returns False if one is already running"""
+        validate_recipe(recipe)
+        with self.lock:
+            if self.running():
+                return False
+            self.stop_requested.clear()
+            self.stop_reason = None
+            self.current = {'name': name, 'step': 0, 'steps': len(recipe['steps']), 'started_at': time.time()}
+            self.thread = threading.Thread(target=self.run, args=(name, recipe), daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self, reason='stopped'):
+        if self.running():
+            self.stop_reason = reason
+            self.stop_requested.set()
+            self.server.wake_state_waiters()
+
+    def status(self):
+        return {'running': self.running(), 'current': self.current if self.running() else None,
+                'last_result': self.last_result}
+
+    def run(self, name, recipe):
+        started = time.time()
+        results = []
+        status = 'completed'
+        logging.info("Recipe '%s' started (%s steps)", name, len(recipe['steps']))
+        try:
+            for index, step in enumerate(recipe['steps']):
+                self.current['step'] = index
+                step_started = time.time()
+                step_status, detail = self.run_step(step)
+                result = {
+                    'index': index,
+                    'step': describe_step(step),
+                    'status': step_status,
+                    'detail': detail,
+                    'duration_ms': round((time.time() - step_started) * 1000, 1)
+                }
+                results.append(result)
+                self.emit('recipe_progress', dict(result, name=name, steps=len(recipe['steps'])))
+                if step_status != 'ok':
+                    status = step_status
+                    break
+        except Exception as e:
+            # Whatever went wrong, the recipe has stopped part way and the operator must see it
+            status = 'error'
+            logging.error("Recipe '%s' failed at step %s: %s", name, self.current['step'], e)
+        total_ms = round((time.time() - started) * 1000, 1)
+        self.last_result = {'name': name, 'status': status, 'total_ms': total_ms, 'steps': results,
+                            'started_at': started}
+        self.emit('recipe_finished', self.last_result)
+        logging.info("Recipe '%s' %s in %s ms", name, status, total_ms)
+
+    def run_step(self, step):
+        if self.stop_requested.is_set():
+            return self.stop_reason, None
+        if 'delay' in step:
+            if self.stop_requested.wait(step['delay']):
+                return self.stop_reason, None
+            return 'ok', None
+        if 'command' in step:
+            if not self.server.connected:
+                return 'not_connected', None
+            pending = self.server.enqueue_command(step['command'])
+            try:
+                reply = pending.future.result(timeout=COMMAND_REPLY_TIMEOUT)
+            except Exception:
+                return 'timeout', None
+            return ('ok' if reply['status'] == 'ok' else 'command_failed'), reply
+        if 'heater_ready' in step:
+            lead = step['heater_ready'].get('lead', 0)
+            ready = lambda state: heater_ready(self.server.thermal.latest(), lead)
+        else:
+            conditions = step['wait'] if isinstance(step['wait'], list) else [step['wait']]
+            ready = lambda state: all(condition_met(condition, state) for condition in conditions)
+        met = self.server.wait_for_state(
+            lambda state: self.stop_requested.is_set() or state.get('eStopTriggered') or ready(state),
+            timeout=step.get('timeout', DEFAULT_WAIT_TIMEOUT),
+            after_frame=self.server.frame_count
+        )
+        if self.stop_requested.is_set():
+            return self.stop_reason, None
+        if not met:
+            return 'timeout', None
+        if self.server.estop_triggered:
+            return 'emergency_stop', None
+        return 'ok', None
@@ -0,0 +1,219 @@
+"""Persistent telemetry recording in a compact fixed-width binary format.
+
+Each session file is a short header followed by 64-byte records: a float64 timestamp and one
+float32 per history.FIELDS entry. The writer batches records on its own OS thread (a real one
+even under eventlet's monkey patching) so the communication loop never waits on the SD card;
+the reader memory-maps files for range queries and CSV export.
+
+    python recorder.py list [directory]
+    python recorder.py export <file.bin> [out.csv] [--start EPOCH] [--end EPOCH]
+"""
+import csv
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+from history import FIELDS, MOTOR_STATES
+
+try:
+    from eventlet.patcher import original
+    # Unpatched modules: the writer blocks in file I/O and queue.get(), which a green thread would
+    # do on the hub
+    os_threading, os_queue = original('threading'), original('queue')
+except ImportError:
+    os_threading, os_queue = threading, queue
+
+MAGIC = b'EXFREC'
+VERSION = 1
+HEADER = struct.Struct('<6sHH')  # magic, version, field count
+RECORD = struct.Struct('<d' + 'f' * len(FIELDS))
+_NEW_SESSION = object()
+_STOP = object()
+
+
+class TelemetryRecorder:
+    """Appends status samples to per-session files from a background writer thread.
+    Subclasses change the file layout through prefix, header() and encode()."""
+    prefix = 'telemetry'
+
+    def __init__(self, directory, batch_size=256, flush_interval=5.0):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = os_queue.SimpleQueue()
+        self.file = None
+        self.path = None
+        self.thread = None
+        self.written = 0
+
+    def start(self):
+        self.thread = os_threading.Thread(target=self.run, name=f"{self.prefix}-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, timestamp, values):
+        """Queue one sample; safe to call from the communication thread, never blocks"""
+        self.queue.put((timestamp, values))
+
+    def new_session(self):
+        """Close the current file and start a new one with the next sample"""
+        self.queue.put(_NEW_SESSION)
+
+    def stop(self, timeout=None):
+        """Write out everything queued so far, close the file and end the writer thread"""
+        if self.thread and self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except os_queue.Empty:
+                item = None
+            if item is _NEW_SESSION or item is _STOP:
+                self.write(batch)
+                batch = []
+                self.close()
+                if item is _STOP:
+                    return
+            elif item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self.write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def write(self, batch):
+        if not batch:
+            return
+        try:
+            if not self.file:
+                self.open()
+            self.file.write(self.encode(batch))
+            self.file.flush()
+            self.written += len(batch)
+        except Exception as e:
+            logging.error("Failed to write %s recording %s: %s", self.prefix, self.path, e)
+            self.close()
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, time.strftime(f'{self.prefix}-%Y%m%d-%H%M%S'))
+        self.path, suffix = f"{base}.bin", 1
+        while os.path.exists(self.path):
+            self.path, suffix = f"{base}-{suffix}.bin", suffix + 1
+        self.file = open(self.path, 'wb')
+        self.file.write(self.header())
+        logging.info("Recording %s to %s", self.prefix, self.path)
+
+    def header(self):
+        return HEADER.pack(MAGIC, VERSION, len(FIELDS))
+
+    def encode(self, batch):
+        return b''.join(RECORD.pack(timestamp, *values) for timestamp, values in batch)
+
+    def close(self):
+        if self.file:
+            try:
+                self.file.close()
+            except Exception:
+                pass
+            self.file = None
+
+
+class TelemetryRecording:
+    """Read-only, memory-mapped view of one recorded session"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, field_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or field_count != len(FIELDS):
+            raise ValueError(f"{path} is not a version {VERSION} telemetry recording")
+        # A partially written trailing record is ignored
+        self.count = (len(self.map) - HEADER.size) // RECORD.size
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def timestamp(self, index):
+        return struct.unpack_from('<d', self.map, HEADER.size + index * RECORD.size)[0]
+
+    def search(self, timestamp):
+        """Index of the first record at or after timestamp"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def records(self, start=None, end=None):
+        """Iterate (timestamp, *values) tuples with start <= timestamp <= end"""
+        first = self.search(start) if start is not None else 0
+        stop = self.search(end + 1e-9) if end is not None else self.count
+        offset = HEADER.size + first * RECORD.size
+        return RECORD.iter_unpack(self.map[offset:HEADER.size + stop * RECORD.size])
+
+    def to_csv(self, out, start=None, end=None):
+        """Write records as CSV with motor states spelled out; returns the row count"""
+        writer = csv.writer(out)
+        writer.writerow(('time',) + FIELDS)
+        state_columns = [i + 1 for i, field in enumerate(FIELDS) if field in ('stateX', 'stateY')]
+        rows = 0
+        for record in self.records(start, end):
+            row = list(record)
+            for column in state_columns:
+                code = int(row[column])
+                row[column] = MOTOR_STATES[code] if 0 <= code < len(MOTOR_STATES) else code
+            writer.writerow(row)
+            rows += 1
+        return rows
+
+
+def main(argv):
+    if len(argv) >= 1 and argv[0] == 'list':
+        directory = argv[1] if len(argv) > 1 else 'recordings'
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.bin'):
+                recording = TelemetryRecording(os.path.join(directory, name))
+                span = (recording.timestamp(len(recording) - 1) - recording.timestamp(0)) if len(recording) else 0
+                print(f"{name}\t{len(recording)} records\t{span:.0f}s")
+                recording.close()
+        return 0
+    if len(argv) >= 2 and argv[0] == 'export':
+        options = {'--start': None, '--end': None}
+        positional = []
+        args = iter(argv[1:])
+        for arg in args:
+            if arg in options:
+                options[arg] = float(next(args))
+            else:
+                positional.append(arg)
+        recording = TelemetryRecording(positional[0])
+        if len(positional) > 1:
+            with open(positional[1], 'w', newline='') as out:
+                rows = recording.to_csv(out, options['--start'], options['--end'])
+            print(f"Exported {rows} records to {positional[1]}")
+        else:
+            recording.to_csv(sys.stdout, options['--start'], options['--end'])
+        recording.close()
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
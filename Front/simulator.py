@@ -0,0 +1,282 @@
+"""Stand-in for the ClearCore controller, for running and benchmarking the bridge without hardware.
+
+Connects to the bridge's TCP port like Main.ino does, streams status JSON in the
+Main/ConnectionLayer.txt format (or binary frames once the bridge sends SetTelemetry binary)
+and answers commands with the firmware's reply strings after a realistic processing delay.
+
+    python simulator.py [--host 127.0.0.1] [--port 1053] [--rate 2] [--ramp] [--no-pong] [--json-only]
+                        [--source 127.0.0.2] [--legacy-link]
+
+Like Main.ino it only reads while the heartbeat is fresh and reconnects once HEARTBEAT_INTERVAL
+passes without one. --legacy-link models firmware from before the heartbeat fix: one line per
+loop pass and only PING refreshes the heartbeat, so a deep backlog drops the link.
+
+The bridge tells stations apart by controller address, so run several simulators against one
+bridge with distinct --source addresses (any of 127.0.0.0/8 works on Linux).
+"""
+import argparse
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+import statusframe
+from commands import AXIS_LIMITS_MM, MAX_SET_TEMP
+
+LOOP_DELAY = 0.025       # Main.ino loop() delay
+MAX_LINES_PER_PASS = 16  # Main.ino: commands handled per loop() pass
+HEARTBEAT_INTERVAL = 1.0  # Main.ino HEARTBEAT_INTERVAL
+RECONNECT_INTERVAL = 0.25  # Main.ino RECONNECT_INTERVAL
+AXIS_SPEED_MM_S = 50.0   # Simulated travel speed
+HEATER_TIME_CONSTANT = 30.0
+AMBIENT_TEMP = 22.0
+
+PNEUMATIC_REPLIES = {
+    'ExtendNozzle': ('nozzle', True, 'Nozzle Extended'),
+    'RetractNozzle': ('nozzle', False, 'Nozzle Retracted'),
+    'ExtendChipStage': ('stage', True, 'Chip Stage Extended'),
+    'RetractChipStage': ('stage', False, 'Chip Stage Retracted'),
+    'ExtendStamp': ('stamp', True, 'Stamp Extended'),
+    'RetractStamp': ('stamp', False, 'Stamp Retracted'),
+    'VacNozzleOn': ('vacnozzle', True, 'Nozzle Vacuum On'),
+    'VacNozzleOff': ('vacnozzle', False, 'Nozzle Vacuum Off'),
+    'ChuckOn': ('chuck', True, 'Chuck Vacuum On'),
+    'ChuckOff': ('chuck', False, 'Chuck Vacuum Off'),
+}
+
+
+class SimulatedController:
+    """Protocol-level model of Main.ino: one TCP client, status frames at rate_hz, one reply per command.
+
+    With ramp=True the reported temperature steps 0.25 °C every frame so each frame is distinct;
+    bench.py uses frame_times to measure telemetry latency end to end. SetTelemetry switches the
+    frame format like the firmware, but rate_hz keeps setting the pace so benchmarks of the two
+    formats stay comparable; binary=False answers it like firmware that predates it, and legacy=True
+    reads like firmware that predates the heartbeat fix (see the module docstring).
+    """
+    def __init__(self, host='127.0.0.1', port=1053, rate_hz=2.0, ramp=False, pong=True, source=None,
+                 binary=True, legacy=False):
+        self.host = host
+        self.port = port
+        self.source = source  # Local address to connect from
+        self.interval = 1.0 / rate_hz
+        self.ramp = ramp
+        self.pong = pong
+        self.binary = binary       # Understands SetTelemetry
+        self.legacy = legacy       # One line per pass, heartbeat refreshed by PING only
+        self.last_heartbeat = 0.0
+        self.heartbeat_drops = 0
+        self.send_binary = False   # Currently sending binary frames
+        self.sock = None
+        self.running = False
+        self.frames_sent = 0
+        self.commands_received = 0
+        self.frame_times = {}  # ramp temp -> send time of the latest frame carrying it
+        self.state = {
+            'x': 0.0, 'y': 0.0,
+            'stateX': 'MOTOR_READY', 'stateY': 'MOTOR_READY',
+            'tape': [0, 0],
+            'nozzle': False, 'stage': False, 'stamp': False,
+            'vacnozzle': False, 'chuck': False,
+            'settemp': 0.0, 'temp': AMBIENT_TEMP,
+            'eStopTriggered': False
+        }
+        self.moves = {}       # axis -> time the move finishes
+        self.tape_until = 0.0
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.running = False
+
+    def connect(self):
+        while self.running:
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=2.0,
+                                                     source_address=(self.source, 0) if self.source else None)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.sock.settimeout(min(LOOP_DELAY, self.interval / 2))
+                self.send_binary = False  # Main.ino restarts every connection in JSON
+                self.last_heartbeat = time.time()
+                logging.info("Simulator connected to %s:%s from %s", self.host, self.port, self.sock.getsockname()[0])
+                return True
+            except OSError:
+                time.sleep(RECONNECT_INTERVAL)
+        return False
+
+    def drop(self):
+        """Cut the link as a cable pull or controller reset would; run() reconnects like Main.ino"""
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self):
+        while self.running:
+            if not self.connect():
+                return
+            buffer = b''
+            next_frame = time.time()
+            try:
+                while self.running:
+                    now = time.time()
+                    if now - self.last_heartbeat > HEARTBEAT_INTERVAL:
+                        # Main.ino stops reading and sending, and reconnects
+                        self.heartbeat_drops += 1
+                        logging.warning("Simulator heartbeat expired with %s bytes unread, reconnecting",
+                                        len(buffer))
+                        break
+                    try:
+                        data = self.sock.recv(4096)
+                        if not data:
+                            break
+                        buffer += data
+                    except socket.timeout:
+                        pass
+                    lines = 0
+                    while b'\n' in buffer and lines < (1 if self.legacy else MAX_LINES_PER_PASS):
+                        if not self.legacy:
+                            self.last_heartbeat = time.time()
+                        lines += 1
+                        line, buffer = buffer.split(b'\n', 1)
+                        command = line.decode(errors='replace').strip()
+                        try:
+                            self.handle(command)
+                        except ValueError:
+                            self.send('Unknown command')
+                        if self.state['eStopTriggered']:
+                            break
+                    if lines:
+                        time.sleep(LOOP_DELAY)
+                    now = time.time()
+                    self.step(now)
+                    if now >= next_frame:
+                        self.send_status(now)
+                        next_frame = max(next_frame + self.interval, now)
+            except OSError as e:
+                logging.warning("Simulator link error: %s", e)
+            self.sock.close()
+            self.sock = None
+            logging.info("Simulator disconnected, reconnecting")
+
+    def send(self, line):
+        self.sock.sendall(f"{line}\n".encode())
+
+    def send_status(self, now):
+        if self.ramp:
+            self.state['temp'] = AMBIENT_TEMP + (self.frames_sent % 400) * 0.25
+            self.frame_times[self.state['temp']] = now
+        if self.send_binary:
+            self.sock.sendall(statusframe.encode(self.state, self.frames_sent))
+        else:
+            self.send(json.dumps(self.state, separators=(',', ':')))
+        self.frames_sent += 1
+
+    def step(self, now):
+        """Advance moves, heater and tape timers"""
+        for axis, finish in list(self.moves.items()):
+            if now >= finish:
+                self.state['state' + axis.upper()] = 'MOTOR_READY'
+                del self.moves[axis]
+        if self.tape_until and now >= self.tape_until:
+            self.state['tape'] = [0, 0]
+            self.tape_until = 0.0
+        if not self.ramp:
+            goal = self.state['settemp'] or AMBIENT_TEMP
+            self.state['temp'] += (goal - self.state['temp']) * min(1.0, LOOP_DELAY / HEATER_TIME_CONSTANT)
+            self.state['temp'] = round(self.state['temp'] + random.uniform(-0.05, 0.05), 2)
+
+    def handle(self, command):
+        self.commands_received += 1
+        if command == 'PING':
+            self.last_heartbeat = time.time()
+            if self.pong:
+                self.send('PONG')
+            return
+        if self.state['eStopTriggered']:
+            return  # Main.ino only listens for PING once latched
+        parts = command.split()
+        name = parts[0] if parts else ''
+        if name in ('MoveX', 'MoveY') and len(parts) == 2:
+            if self.state['nozzle']:
+                self.send('!!!WARNING!!! Nozzle Extended Will Not Move')
+                return
+            axis = name[-1].lower()
+            low, high = AXIS_LIMITS_MM[axis]
+            target = min(max(float(parts[1]), low), high)
+            now = time.time()
+            # Main.ino reports the commanded position straight away; only the state lags
+            self.moves[axis] = now + abs(target - self.state[axis]) / AXIS_SPEED_MM_S
+            self.state[axis] = target
+            self.state['state' + axis.upper()] = 'MOTOR_MOVING'
+            self.send('OK')
+        elif name in ('EnableX', 'EnableY'):
+            self.state['state' + name[-1]] = 'MOTOR_READY'
+            self.send(f"Homing {name[-1]} axis")
+        elif name in ('DisableX', 'DisableY'):
+            self.state['state' + name[-1]] = 'MOTOR_DISABLED'
+            self.send(f"{name[-1]} Motor Disabled")
+        elif name in PNEUMATIC_REPLIES:
+            key, value, reply = PNEUMATIC_REPLIES[name]
+            if name == 'ExtendNozzle' and 'MOTOR_MOVING' in (self.state['stateX'], self.state['stateY']):
+                self.send('Motor Moving Will Not Extend Nozzle')
+                return
+            self.state[key] = value
+            self.send(reply)
+        elif name == 'SetTemperature' and len(parts) == 2:
+            self.state['settemp'] = min(float(parts[1]), MAX_SET_TEMP)
+            self.send('Temperature set')
+        elif name == 'Tape':
+            if len(parts) != 4:
+                self.send('Invalid tape command format')
+                return
+            speed, torque, duration = (int(float(part)) for part in parts[1:])
+            self.state['tape'] = [speed, torque]
+            self.tape_until = time.time() + duration / 1000.0
+            self.send('Tape motor operation started')
+        elif name == 'StopTape':
+            self.state['tape'] = [0, 0]
+            self.tape_until = 0.0
+            self.send('Tape motor stopped')
+        elif name == 'SetTelemetry' and self.binary and len(parts) in (2, 3) and parts[1] in ('json', 'binary'):
+            self.send_binary = parts[1] == 'binary'
+            self.send(f"Telemetry {parts[1]} {round(self.interval * 1000)}")
+        elif name == 'STOP':
+            self.state['eStopTriggered'] = True
+            self.state['stateX'] = self.state['stateY'] = 'MOTOR_DISABLED'
+            self.send('EMERGENCY STOP ACTIVATED')
+        else:
+            self.send('Unknown command')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1053)
+    parser.add_argument('--rate', type=float, default=1000.0 / 500, help='status frames per second')
+    parser.add_argument('--ramp', action='store_true', help='make every frame distinct (for latency probes)')
+    parser.add_argument('--no-pong', action='store_true', help="don't answer PING")
+    parser.add_argument('--source', help='local address to connect from, one per simulated station')
+    parser.add_argument('--json-only', action='store_true', help='reject SetTelemetry like older firmware')
+    parser.add_argument('--legacy-link', action='store_true',
+                        help='one command per loop pass, heartbeat refreshed by PING only (pre-fix firmware)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    controller = SimulatedController(args.host, args.port, args.rate, args.ramp, not args.no_pong, args.source,
+                                     not args.json_only, args.legacy_link)
+    try:
+        controller.start().join()
+    except KeyboardInterrupt:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Fixed-layout binary status frame, the compact alternative to the controller's status JSON.
+
+Carries the same fields as Main/ConnectionLayer.txt in 30 little-endian bytes:
+
+    offset  type     field
+    0       2 bytes  magic A5 5A (never valid in the text protocol, so frames and lines can share the stream)
+    2       uint8    layout version
+    3       uint8    flags: bit 0 nozzle, 1 stage, 2 stamp, 3 vacnozzle, 4 chuck, 5 eStopTriggered
+    4       float32  x
+    8       float32  y
+    12      uint8    stateX, index into history.MOTOR_STATES
+    13      uint8    stateY
+    14      int16    tape speed
+    16      int16    tape torque
+    18      float32  settemp
+    22      float32  temp
+    26      uint16   sequence number, wraps; a gap means frames were lost
+    28      uint16   CRC-16/CCITT-FALSE of bytes 0-27
+
+The bridge asks for it with 'SetTelemetry binary <interval ms>' after every connect; firmware
+that answers 'Unknown command' keeps sending JSON, and Main.ino drops back to JSON whenever it
+reconnects.
+"""
+import binascii
+import struct
+
+from history import MOTOR_STATE_CODES
+
+MAGIC = b'\xa5\x5a'
+VERSION = 1
+FRAME = struct.Struct('<2sBBffBBhhffHH')
+SIZE = FRAME.size
+FLAGS = ('nozzle', 'stage', 'stamp', 'vacnozzle', 'chuck', 'eStopTriggered')  # Bit 0 first
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), as computed by Main.ino"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def valid(frame):
+    """True if a SIZE-byte frame has a layout version we understand and an intact CRC"""
+    return frame[2] == VERSION and crc16(frame[:-2]) == int.from_bytes(frame[-2:], 'little')
+
+
+def encode(state, seq):
+    """Frame for a status dict in the JSON layout (simulator.py's side of the link)"""
+    flags = 0
+    for bit, key in enumerate(FLAGS):
+        if state[key]:
+            flags |= 1 << bit
+    body = FRAME.pack(MAGIC, VERSION, flags, state['x'], state['y'],
+                      MOTOR_STATE_CODES.get(state['stateX'], 0), MOTOR_STATE_CODES.get(state['stateY'], 0),
+                      state['tape'][0], state['tape'][1], state['settemp'], state['temp'],
+                      seq & 0xFFFF, 0)[:-2]
+    return body + crc16(body).to_bytes(2, 'little')
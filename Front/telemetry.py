@@ -0,0 +1,38 @@
+"""Change detection for controller telemetry so only fields that moved are pushed to browsers"""
+
+# Changes smaller than this are treated as noise and not re-sent (same units as the status JSON)
+DEFAULT_DEADBANDS = {
+    'x': 0.01,      # mm
+    'y': 0.01,      # mm
+    'temp': 0.1,    # °C
+}
+
+_MISSING = object()
+
+
+class TelemetryDiffer:
+    """Remembers the last value sent for each status field and reports only what changed"""
+    def __init__(self, deadbands=None):
+        self.deadbands = dict(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+        self.sent = {}
+
+    def diff(self, values):
+        """Return the subset of values that differs from what clients last saw, and remember it"""
+        delta = {}
+        for key, value in values.items():
+            last = self.sent.get(key, _MISSING)
+            if last is _MISSING or self.changed(key, last, value):
+                delta[key] = value
+        self.sent.update(delta)
+        return delta
+
+    def changed(self, key, last, value):
+        deadband = self.deadbands.get(key)
+        if deadband and isinstance(value, (int, float)) and isinstance(last, (int, float)):
+            # Compare against the last value sent, so slow drift still gets through eventually
+            return abs(value - last) >= deadband
+        return value != last
+
+    def reset(self):
+        """Forget what was sent so the next diff reports every field"""
+        self.sent.clear()
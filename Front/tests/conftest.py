@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+from collections import deque
+
+import pytest
+
+# The bridge's modules import each other as siblings of Front/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing app.py must not monkey-patch the test process or write next to the code
+os.environ.setdefault('EXFOLIATOR_ASYNC_MODE', 'threading')
+os.environ.setdefault('EXFOLIATOR_CAPTURE', '0')
+os.environ.setdefault('EXFOLIATOR_DATA_DIR', os.path.join(tempfile.gettempdir(), 'exfoliator-tests'))
+
+
+class FakeSocket:
+    """Controller end of a link: recv() hands out queued chunks, sendall() records what was written"""
+    def __init__(self):
+        self.chunks = deque()
+        self.sent = []
+
+    def recv(self, size):
+        if not self.chunks:
+            raise BlockingIOError(11, 'Resource temporarily unavailable')
+        return self.chunks.popleft()
+
+    def sendall(self, data):
+        self.sent.append(bytes(data))
+
+    def close(self):
+        pass
+
+    def lines(self):
+        """Every line written so far"""
+        return b''.join(self.sent).decode().splitlines()
+
+
+class FakeHub:
+    def wake(self):
+        pass
+
+    def unregister(self, sock):
+        pass
+
+
+@pytest.fixture
+def station():
+    """A connected app.ArduinoTCPServer on a FakeSocket, outside the communication loop"""
+    import app
+    server = app.ArduinoTCPServer('test', FakeHub())
+    server.client_socket = FakeSocket()
+    server.connected = True
+    return server
+
+
+def read_all(server, chunks):
+    """Feed chunks to the station one recv() at a time; returns every message read_response() produced"""
+    messages = []
+    for chunk in chunks:
+        server.client_socket.chunks.append(chunk)
+        messages.extend(server.read_response())
+    return messages
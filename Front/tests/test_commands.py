@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+import commands
+
+
+@pytest.mark.parametrize('position', [0, 0.0, 110.5, 220, '220'])
+def test_move_within_travel(position):
+    command = commands.build('MoveX', position)
+    assert command.args == (float(position),)
+
+
+@pytest.mark.parametrize('name, position', [('MoveX', -0.001), ('MoveX', 220.001), ('MoveY', 70.5)])
+def test_move_outside_travel(name, position):
+    with pytest.raises(ValueError, match='position'):
+        commands.build(name, position)
+
+
+@pytest.mark.parametrize('value', [math.nan, math.inf, 'nan', True, None, [1]])
+def test_non_numbers_rejected(value):
+    with pytest.raises(ValueError):
+        commands.build('SetTemperature', value)
+
+
+def test_integer_params():
+    assert commands.parse('Tape 50 -40 2000').args == (50, -40, 2000)
+    assert commands.build('Tape', 50.0, 40, 0).args == (50, 40, 0)
+    for args in [(50.5, 40, 10), (101, 40, 10), (50, -101, 10), (50, 40, -1)]:
+        with pytest.raises(ValueError):
+            commands.build('Tape', *args)
+
+
+def test_argument_count():
+    with pytest.raises(ValueError, match='takes 3 argument'):
+        commands.parse('Tape 50 40')
+    with pytest.raises(ValueError, match='takes no arguments'):
+        commands.parse('StopTape now')
+
+
+def test_choices():
+    assert commands.parse('SetTelemetry binary 100').args == ('binary', 100)
+    with pytest.raises(ValueError, match='format must be one of'):
+        commands.parse('SetTelemetry xml 100')
+
+
+@pytest.mark.parametrize('text', ['', '   ', 'Bogus', 'movex 10'])
+def test_unknown_or_empty(text):
+    with pytest.raises(ValueError):
+        commands.parse(text)
+
+
+def test_wire_encoding():
+    assert commands.build('MoveX', 120).encoded == b'MoveX 120\n'
+    assert commands.build('MoveY', 12.34567).text == 'MoveY 12.346'
+    assert commands.build('SetTemperature', 0.0001).text == 'SetTemperature 0'
+    # Argument-free commands are compiled once and shared
+    assert commands.parse('STOP') is commands.build('STOP')
@@ -0,0 +1,80 @@
+import random
+import struct
+
+import app
+import statusframe
+from conftest import FakeHub, FakeSocket, read_all
+
+
+def test_lines_split_across_reads(station):
+    assert read_all(station, [b'Nozzle Ext', b'ended\nO', b'K\r\n', b'\n  \n', b'PONG\n']) == \
+        ['Nozzle Extended', 'OK', 'PONG']
+    assert station.recv_buffer == b''
+
+
+def test_several_lines_in_one_read(station):
+    assert read_all(station, [b'OK\nTemperature set\n{"x":1}\nUnknown co']) == \
+        ['OK', 'Temperature set', '{"x":1}']
+    assert station.recv_buffer == b'Unknown co'
+
+
+def test_overlong_partial_line_dropped(station):
+    assert read_all(station, [b'x' * (app.MAX_LINE_LENGTH + 1)]) == []
+    assert station.recv_buffer == b''
+    assert read_all(station, [b'OK\n']) == ['OK']
+
+
+def test_closed_connection(station):
+    assert read_all(station, [b'']) == []
+    assert not station.connected
+
+
+# Binary status frames sharing the stream with text lines (statusframe.py)
+STATE = {
+    'x': 10.5, 'y': 20.25, 'stateX': 'MOTOR_READY', 'stateY': 'MOTOR_MOVING', 'tape': [0, 0],
+    'nozzle': False, 'stage': True, 'stamp': False, 'vacnozzle': False, 'chuck': True,
+    'settemp': 60.0, 'temp': 41.5, 'eStopTriggered': False
+}
+
+
+def test_frames_between_lines(station):
+    first, second = statusframe.encode(STATE, 1), statusframe.encode(STATE, 2)
+    stream = b'OK\n' + first + b'PONG\n' + second + second[:5]
+    assert read_all(station, [stream]) == ['OK', first, 'PONG', second]
+    assert station.recv_buffer == second[:5]
+    assert read_all(station, [second[5:]]) == [second]
+
+
+def test_frame_containing_newline_bytes(station):
+    # The CRC and payload may hold 0x0A; a frame is cut by length, never at a newline
+    state = dict(STATE, x=struct.unpack('<f', b'\n\n\n\n')[0])
+    frame = statusframe.encode(state, 0x0A0A)
+    assert b'\n' in frame
+    assert read_all(station, [frame[:7], frame[7:] + b'OK\n']) == [frame, 'OK']
+
+
+def test_corrupt_frame_dropped_whole(station):
+    frame = bytearray(statusframe.encode(STATE, 3))
+    frame[10] ^= 0xFF
+    good = statusframe.encode(STATE, 4)
+    assert read_all(station, [b'OK\n' + bytes(frame) + b'PONG\n' + good]) == ['OK', 'PONG', good]
+
+
+def test_debris_before_frame_skipped(station):
+    frame = statusframe.encode(STATE, 5)
+    assert read_all(station, [b'garb', b'age' + frame + b'OK\n']) == [frame, 'OK']
+
+
+def test_random_splits():
+    rng = random.Random(16)
+    texts = ['OK', 'PONG', 'Temperature set', '{"x":1.5,"y":2}', 'Nozzle Extended']
+    for case in range(300):
+        messages = [statusframe.encode(dict(STATE, temp=rng.uniform(0, 200)), seq) if rng.random() < 0.5
+                    else rng.choice(texts) for seq in range(rng.randint(1, 12))]
+        stream = b''.join(m if isinstance(m, bytes) else m.encode() + b'\n' for m in messages)
+        cuts = sorted(rng.sample(range(1, len(stream)), min(len(stream) - 1, rng.randint(0, 8))))
+        chunks = [stream[a:b] for a, b in zip([0] + cuts, cuts + [len(stream)])]
+        station = app.ArduinoTCPServer('fuzz', FakeHub())
+        station.client_socket, station.connected = FakeSocket(), True
+        assert read_all(station, chunks) == messages, f"case {case}, cuts {cuts}"
+        assert station.recv_buffer == b''
@@ -0,0 +1,55 @@
+from history import FIELDS, TelemetryHistory
+
+
+def filled(capacity, samples):
+    """History where sample t has timestamp t and every field equal to t"""
+    history = TelemetryHistory(capacity)
+    for t in range(samples):
+        history.append(float(t), [float(t)] * len(FIELDS))
+    return history
+
+
+def test_range_before_wrap():
+    times, (x,) = filled(10, 6).copy_range(1, 4, ('x',))
+    assert list(times) == [1, 2, 3, 4]
+    assert list(x) == [1, 2, 3, 4]
+
+
+def test_range_across_wrap():
+    # 25 samples in 10 slots: 15..19 sit at the end of the arrays, 20..24 at the start
+    history = filled(10, 25)
+    times, (x, temp) = history.copy_range(17, 22, ('x', 'temp'))
+    assert list(times) == [17, 18, 19, 20, 21, 22]
+    assert list(x) == list(temp) == [17, 18, 19, 20, 21, 22]
+
+
+def test_range_clipped_to_retained():
+    times, _ = filled(10, 25).copy_range(0, 100, ('x',))
+    assert list(times) == list(range(15, 25))
+    times, _ = filled(10, 25).copy_range(30, 40, ('x',))
+    assert list(times) == []
+
+
+def test_range_after_wrap_only():
+    times, _ = filled(10, 25).copy_range(21, 23, ('x',))
+    assert list(times) == [21, 22, 23]
+
+
+def test_last():
+    assert TelemetryHistory(4).last('x') is None
+    assert filled(10, 25).last('settemp') == 24
+
+
+def test_window_across_wrap():
+    window = filled(10, 25).window(15, 25, 5, ('x',))
+    assert window['count'] == [2, 2, 2, 2, 2]
+    stats = window['fields']['x']
+    assert stats['min'] == [15, 17, 19, 21, 23]
+    assert stats['max'] == [16, 18, 20, 22, 24]
+    assert stats['mean'] == [15.5, 17.5, 19.5, 21.5, 23.5]
+
+
+def test_window_empty_buckets():
+    stats = filled(10, 25).window(0, 20, 4, ('x',))
+    assert stats['count'] == [0, 0, 0, 6]  # 15..20, end inclusive
+    assert stats['fields']['x']['mean'][:3] == [None, None, None]
@@ -0,0 +1,107 @@
+import app
+import commands
+
+
+def enqueue(station, count, name='StopTape'):
+    return [station.enqueue_command(commands.build(name)) for _ in range(count)]
+
+
+def reply(station, text='Tape motor stopped', times=1):
+    for _ in range(times):
+        app.handle_controller_message(station, text)
+
+
+def test_in_flight_capped(station):
+    pending = enqueue(station, 20)
+    station.dispatch_queued()
+    assert len(station.client_socket.lines()) == app.MAX_IN_FLIGHT
+    assert list(station.in_flight) == pending[:app.MAX_IN_FLIGHT]
+    station.dispatch_queued()  # Nothing more until replies come back
+    assert len(station.client_socket.lines()) == app.MAX_IN_FLIGHT
+
+
+def test_replies_release_more_in_order(station):
+    pending = enqueue(station, 20)
+    station.dispatch_queued()
+    reply(station, times=3)
+    assert [p.future.result()['status'] for p in pending[:3]] == ['ok'] * 3
+    assert not pending[3].future.done()
+    station.dispatch_queued()
+    assert len(station.client_socket.lines()) == app.MAX_IN_FLIGHT + 3
+    assert list(station.in_flight) == pending[3:app.MAX_IN_FLIGHT + 3]
+    for _ in range(20):
+        reply(station)
+        station.dispatch_queued()
+    assert all(p.future.result()['status'] == 'ok' for p in pending)
+    assert len(station.client_socket.lines()) == 20
+
+
+def test_reply_matching(station):
+    moves = [station.enqueue_command(commands.build('MoveX', 10)), station.enqueue_command('ExtendNozzle')]
+    station.dispatch_queued()
+    reply(station, 'Thermal Runaway')  # Unsolicited alarm, not an answer
+    assert not moves[0].future.done()
+    reply(station, 'OK')
+    reply(station, 'Motor Moving Will Not Extend Nozzle')
+    assert moves[0].future.result()['status'] == 'ok'
+    assert moves[1].future.result()['status'] == 'rejected'
+    assert moves[1].future.result()['response'] == 'Motor Moving Will Not Extend Nozzle'
+    reply(station, 'Stray')  # Nothing in flight: not matched to anything
+    assert not station.in_flight
+
+
+def test_batch_not_interleaved(station):
+    batch = station.enqueue_batch([commands.build('MoveX', float(i)) for i in range(12)])
+    single = station.enqueue_command('StopTape')
+    station.dispatch_queued()
+    assert station.client_socket.lines() == [f"MoveX {i}" for i in range(app.MAX_IN_FLIGHT)]
+    reply(station, 'OK', times=app.MAX_IN_FLIGHT)
+    station.dispatch_queued()
+    reply(station, 'OK', times=4)
+    station.dispatch_queued()
+    assert station.client_socket.lines() == [f"MoveX {i}" for i in range(12)] + ['StopTape']
+    assert all(p.future.result()['status'] == 'ok' for p in batch)
+    assert list(station.in_flight) == [single]
+
+
+def test_unanswered_commands_expire(station):
+    pending = enqueue(station, 3)
+    station.dispatch_queued()
+    reply(station)
+    # Each command's clock starts once everything ahead of it is answered
+    station.last_reply_at -= app.COMMAND_TIMEOUT + 1
+    for p in pending[1:]:
+        p.sent_at -= app.COMMAND_TIMEOUT + 1
+    station.expire_commands()
+    assert [p.future.result()['status'] for p in pending] == ['ok', 'timeout', 'timeout']
+    assert not station.in_flight
+
+
+def test_send_failure(station):
+    pending = enqueue(station, 2)
+    station.connected = False
+    assert station.dispatch_queued() is False
+    assert pending[0].future.result()['status'] == 'send_failed'
+
+
+def test_stop_flushes_queue(station):
+    pending = enqueue(station, app.MAX_IN_FLIGHT)
+    station.dispatch_queued()
+    batch = station.enqueue_batch([commands.build('MoveX', float(i)) for i in range(12)])
+    reply(station, times=2)
+    station.dispatch_queued()  # Two of the batch go out, the rest waits in batch_remainder
+    queued = enqueue(station, 3)
+    stop = station.enqueue_command('STOP')
+    assert [p.future.result()['status'] for p in batch[2:] + queued] == ['flushed'] * 13
+    assert not station.batch_remainder and station.command_queue.empty()
+    # STOP goes out at once, without waiting for a free slot in the window
+    assert station.client_socket.lines()[-1] == 'STOP'
+    assert len(station.client_socket.lines()) == app.MAX_IN_FLIGHT + 3
+    assert list(station.in_flight) == pending[2:] + batch[:2] + [stop]
+    station.dispatch_queued()
+    assert station.client_socket.lines()[-1] == 'STOP'
+
+
+def test_stop_send_failure(station):
+    station.connected = False
+    assert station.enqueue_command('STOP').future.result()['status'] == 'send_failed'
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import planner
+
+
+def test_axis_time_profiles():
+    ramp = planner.AXIS_SPEED_MM_S ** 2 / planner.AXIS_ACCEL_MM_S2
+    # Trapezoid: cruise plus the time lost accelerating and braking
+    assert planner.axis_time(100.0) == pytest.approx(100 / planner.AXIS_SPEED_MM_S +
+                                                     planner.AXIS_SPEED_MM_S / planner.AXIS_ACCEL_MM_S2)
+    # Triangle and trapezoid meet where the axis just reaches speed
+    assert planner.axis_time(ramp) == pytest.approx(2 * np.sqrt(ramp / planner.AXIS_ACCEL_MM_S2))
+    assert planner.axis_time(-30.0) == planner.axis_time(30.0)
+
+
+def test_hop_time_runs_axes_together():
+    assert planner.hop_time(0.0, 0.0) == 0.0
+    assert planner.hop_time(100.0, 10.0) == pytest.approx(planner.axis_time(100.0) + planner.MOVE_OVERHEAD_S)
+    assert planner.hop_time(10.0, -100.0) == planner.hop_time(100.0, 10.0)
+
+
+def test_serpentine_from_nearest_corner():
+    grid = planner.grid_points({'x': [0, 30, 4], 'y': [0, 10, 2]})
+    path = planner.serpentine(grid, np.array([30.0, 10.0]))
+    assert path.tolist() == [[30, 10], [20, 10], [10, 10], [0, 10], [0, 0], [10, 0], [20, 0], [30, 0]]
+
+
+def test_serpentine_rows_along_longer_axis():
+    grid = planner.grid_points({'x': [0, 10, 2], 'y': [0, 30, 4]})
+    path = planner.serpentine(grid, np.zeros(2))
+    assert path[:4, 0].tolist() == [0, 0, 0, 0]
+    assert path[:4, 1].tolist() == [0, 10, 20, 30]
+
+
+def path_time(path, start):
+    hops = np.diff(np.vstack([start, path]), axis=0)
+    return float(planner.hop_time(hops[:, 0], hops[:, 1]).sum())
+
+
+def test_two_opt_never_worse_than_nearest_neighbour():
+    rng = np.random.default_rng(3)
+    points = np.column_stack([rng.uniform(0, 220, 200), rng.uniform(0, 70, 200)])
+    start = np.zeros(2)
+    greedy = points[planner.nearest_neighbour(points, start)]
+    improved = planner.two_opt(greedy.copy(), start)
+    assert sorted(map(tuple, improved)) == sorted(map(tuple, points))
+    assert path_time(improved, start) <= path_time(greedy, start)
+
+
+def test_two_opt_removes_backtracking():
+    start = np.zeros(2)
+    doubled_back = np.array([[200.0, 0.0], [10.0, 0.0], [210.0, 0.0]])
+    assert planner.two_opt(doubled_back, start).tolist() == [[10, 0], [200, 0], [210, 0]]
+
+
+def test_merge_collinear():
+    start = np.zeros(2)
+    path = np.array([[10.0, 0], [20, 0], [30, 0], [30, 10], [20, 10], [20, 20]])
+    assert planner.merge_collinear(path, start).tolist() == [[30, 0], [30, 10], [20, 10], [20, 20]]
+
+
+def test_plan_merges_only_without_actions():
+    spec = {'grid': {'x': [0, 30, 4], 'y': [0, 10, 2]}}
+    # (0, 0) is where the stage already is, then the two rows collapse to their ends
+    assert planner.plan_scan(spec, (0, 0)).path.tolist() == [[0, 0], [30, 0], [30, 10], [0, 10]]
+    plan = planner.plan_scan(dict(spec, dwell=0.5), (0, 0))
+    assert plan.summary()['moves'] == 8
+    assert plan.estimated_s == pytest.approx(float(plan.hop_estimates.sum()) + 8 * 0.5)
+
+
+@pytest.mark.parametrize('spec', [
+    {},
+    {'grid': {'x': [0, 10, 2], 'y': [0, 10, 2]}, 'points': [[1, 1]]},
+    {'points': [[300, 5]]},
+    {'points': [[1, 2, 3]]},
+    {'points': [[1, 2]], 'order': 'serpentine'},
+    {'points': [[1, 2]], 'at_point': ['MoveX 10']},
+    {'points': [[1, 2]], 'dwell': -1},
+    {'grid': {'x': [0, 10, 0], 'y': [0, 10, 2]}},
+    {'grid': {'x': [0, 200, 100], 'y': [0, 60, 100]}},
+])
+def test_plan_rejects(spec):
+    with pytest.raises(ValueError):
+        planner.plan_scan(spec, (0, 0))
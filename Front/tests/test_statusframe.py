@@ -0,0 +1,42 @@
+import pytest
+
+import statusframe
+
+STATE = {
+    'x': 12.5, 'y': 60.25, 'stateX': 'MOTOR_MOVING', 'stateY': 'MOTOR_READY',
+    'tape': [-30, 45], 'nozzle': True, 'stage': False, 'stamp': True,
+    'vacnozzle': False, 'chuck': True, 'settemp': 120.0, 'temp': 87.75, 'eStopTriggered': False
+}
+
+
+def test_round_trip():
+    frame = statusframe.encode(STATE, 0x1_0003)
+    assert len(frame) == statusframe.SIZE
+    assert statusframe.valid(frame)
+    (magic, version, flags, x, y, state_x, state_y, speed, torque,
+     set_temp, temp, seq, _) = statusframe.FRAME.unpack(frame)
+    assert (magic, version) == (statusframe.MAGIC, statusframe.VERSION)
+    assert (x, y, set_temp, temp) == (12.5, 60.25, 120.0, 87.75)
+    assert (state_x, state_y) == (3, 2)
+    assert (speed, torque) == (-30, 45)
+    assert flags == 0b10101
+    assert seq == 3  # Wraps at 16 bits
+
+
+def test_crc_matches_ccitt_false():
+    # Standard check value for CRC-16/CCITT-FALSE
+    assert statusframe.crc16(b'123456789') == 0x29B1
+
+
+@pytest.mark.parametrize('offset', range(statusframe.SIZE))
+def test_corruption_detected(offset):
+    frame = bytearray(statusframe.encode(STATE, 7))
+    frame[offset] ^= 0x01
+    assert not statusframe.valid(bytes(frame))
+
+
+def test_unknown_version_rejected():
+    frame = bytearray(statusframe.encode(STATE, 7))
+    frame[2] = statusframe.VERSION + 1
+    body = bytes(frame[:-2])
+    assert not statusframe.valid(body + statusframe.crc16(body).to_bytes(2, 'little'))
@@ -0,0 +1,87 @@
+import math
+import time
+
+import numpy as np
+
+import thermal
+from history import FIELDS, TelemetryHistory
+
+SETTEMP, TEMP = FIELDS.index('settemp'), FIELDS.index('temp')
+DEAD_TIME, TIME_CONSTANT, RATE_HZ = 5.0, 60.0, 10
+
+
+def sample(settemp, temp):
+    values = [0.0] * len(FIELDS)
+    values[SETTEMP], values[TEMP] = settemp, temp
+    return values
+
+
+def step_history(start, elapsed, old=40.0, new=80.0, plateau=80.0):
+    """Settled at old for a minute, then a step to new at start responding as first order plus dead time"""
+    history = TelemetryHistory(20000)
+    for i in range(60 * RATE_HZ):
+        history.append(start - 60 + i / RATE_HZ, sample(old, old))
+    for i in range(int(elapsed * RATE_HZ) + 1):
+        t = i / RATE_HZ
+        rise = 0.0 if t < DEAD_TIME else 1 - math.exp(-(t - DEAD_TIME) / TIME_CONSTANT)
+        history.append(start + t, sample(new, old + (plateau - old) * rise))
+    return history
+
+
+def test_fit_first_order_recovers_curve():
+    t = np.arange(0, 120, 0.1)
+    y = 80 - 35 * np.exp(-t / 45.0)
+    plateau, time_constant, rmse = thermal.fit_first_order(t, y)
+    assert abs(plateau - 80) < 0.5
+    assert abs(time_constant - 45) / 45 < 0.05  # Candidates are ~3.4% apart
+    assert rmse < 0.2
+
+
+def test_estimate_after_setpoint_change():
+    start = 1_000_000.0
+    model = thermal.ThermalModel(step_history(start, 90))
+    estimate = model.estimate(start + 90)
+    assert estimate['state'] == 'heating'
+    assert estimate['setpoint'] == 80
+    assert estimate['step_started'] == start
+    # Dead time runs until the stage has clearly moved (DEAD_TIME_FRACTION of the 40 degree step)
+    threshold = max(thermal.DEAD_TIME_RISE, thermal.DEAD_TIME_FRACTION * 40)
+    detected = DEAD_TIME - TIME_CONSTANT * math.log(1 - threshold / 40)
+    assert abs(estimate['dead_time_s'] - detected) <= 0.2
+    assert abs(estimate['time_constant_s'] - TIME_CONSTANT) / TIME_CONSTANT < 0.1
+    assert abs(estimate['plateau'] - 80) < 1.0
+    # The plateau is the setpoint itself, so the band is reached at tau * ln((80 - temp) / 1)
+    expected_eta = TIME_CONSTANT * math.log(80 - estimate['temperature'])
+    assert abs(estimate['eta_s'] - expected_eta) < 0.15 * expected_eta
+    assert estimate['overshoot'] < 0.5
+
+
+def test_estimate_predicts_overshoot():
+    start = 1_000_000.0
+    estimate = thermal.ThermalModel(step_history(start, 90, plateau=90.0)).estimate(start + 90)
+    assert estimate['plateau'] > 85
+    assert estimate['overshoot'] > 0
+
+
+def test_estimate_states():
+    start = 1_000_000.0
+    history = step_history(start, 2)
+    assert thermal.ThermalModel(history).estimate(start + 2)['state'] == 'dead_time'
+    assert thermal.ThermalModel(TelemetryHistory(10)).estimate(start)['state'] == 'no_data'
+    history = TelemetryHistory(1000)
+    for i in range(100):
+        history.append(start + i / RATE_HZ, sample(60, 60.2))
+    assert thermal.ThermalModel(history).estimate(start + 10)['state'] == 'settled'
+
+
+def test_latest_refits_on_setpoint_change():
+    now = time.time()
+    history = TelemetryHistory(1000)
+    for i in range(100):
+        history.append(now - 10 + i / RATE_HZ, sample(40, 40))
+    model = thermal.ThermalModel(history)
+    assert model.latest()['state'] == 'settled'
+    history.append(time.time(), sample(60, 40))
+    estimate = model.latest()
+    assert estimate['setpoint'] == 60
+    assert estimate['state'] != 'settled'
@@ -0,0 +1,144 @@
+"""Heater settling predictor: a first-order-plus-dead-time fit of the current setpoint step.
+
+Heater.ino closes the loop on the controller; the bridge only sees temp and settemp. After each
+setpoint change the stage response is fitted as
+
+    temp(t) = plateau - (plateau - temp0) * exp(-(t - dead_time) / time_constant),  t >= dead_time
+
+from the telemetry history. Dead time is read straight off the samples (the first clear move
+after the step). The time constant is found by scoring a log-spaced grid of candidates in one
+vectorised pass, each with its own closed-form least-squares plateau, so a fit costs a few
+milliseconds of NumPy and never iterates.
+
+From the fit come the time until temp is within tolerance of the setpoint and an overshoot
+estimate. A plateau past the setpoint means the heater is driving harder than it needs to. Its
+controller can only cut the heat once the setpoint is crossed, and the stage keeps going for
+roughly the dead time at the rate it was climbing.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+MIN_FIT_SAMPLES = 20            # Samples after the dead time needed before predicting
+MAX_FIT_POINTS = 400            # Longer steps are strided down to this many samples
+MAX_STEP_SECONDS = 3600.0       # How far back to look for the start of the current step
+DEAD_TIME_RISE = 0.5            # °C the stage must move to count as responding...
+DEAD_TIME_FRACTION = 0.02       # ...or this fraction of the step, whichever is larger
+SETTLED_SECONDS = 5.0           # Time within tolerance before the stage counts as settled
+TIME_CONSTANTS = np.geomspace(1.0, 3000.0, 240)  # Candidate time constants, seconds
+
+
+class ThermalModel:
+    """Fits the current setpoint step of one station from its TelemetryHistory"""
+    def __init__(self, history, tolerance=1.0):
+        self.history = history
+        self.tolerance = tolerance
+        self.lock = threading.Lock()
+        self.cached = None
+        self.cached_at = 0.0
+        self.cached_setpoint = None
+
+    def latest(self, max_age=1.0):
+        """estimate(), refitting at most once per max_age seconds and whenever the setpoint changes"""
+        with self.lock:
+            now = time.time()
+            setpoint = self.history.last('settemp')
+            if self.cached is None or now - self.cached_at >= max_age or setpoint != self.cached_setpoint:
+                self.cached = self.estimate(now)
+                self.cached_at = now
+                self.cached_setpoint = setpoint
+            return self.cached
+
+    def estimate(self, now=None):
+        """Prediction for the current setpoint step as a JSON-ready dict"""
+        now = time.time() if now is None else now
+        times, (setpoints, temps) = self.history.copy_range(now - MAX_STEP_SECONDS, now, ('settemp', 'temp'))
+        if not len(times):
+            return {'state': 'no_data'}
+        times = np.frombuffer(times, dtype=np.float64)
+        setpoints = np.frombuffer(setpoints, dtype=np.float32).astype(np.float64)
+        temps = np.frombuffer(temps, dtype=np.float32).astype(np.float64)
+        setpoint, temp = float(setpoints[-1]), float(temps[-1])
+        result = {'setpoint': round(setpoint, 2), 'temperature': round(temp, 2), 'tolerance': self.tolerance}
+        if setpoint <= 0:
+            return dict(result, state='off')
+
+        changes = np.flatnonzero(setpoints != setpoint)
+        start = changes[-1] + 1 if len(changes) else 0
+        times, temps = times[start:], temps[start:]
+        step_started, temp0 = float(times[0]), float(temps[0])
+        result['step_started'] = step_started
+        outside = np.flatnonzero(np.abs(temps - setpoint) > self.tolerance)
+        if not len(outside):
+            settled_since = step_started
+        elif outside[-1] + 1 < len(times):
+            settled_since = float(times[outside[-1] + 1])
+        else:
+            settled_since = None
+        if settled_since is not None and now - settled_since >= SETTLED_SECONDS:
+            return dict(result, state='settled', eta_s=0.0, settled_since=settled_since)
+
+        # Dead time: until the stage has clearly started moving towards the new setpoint
+        direction = 1.0 if setpoint >= temp0 else -1.0
+        threshold = max(DEAD_TIME_RISE, DEAD_TIME_FRACTION * abs(setpoint - temp0))
+        moved = np.flatnonzero(direction * (temps - temp0) >= threshold)
+        if not len(moved):
+            return dict(result, state='dead_time', elapsed_s=round(now - step_started, 1))
+        responding = moved[0]
+        dead_time = float(times[responding]) - step_started
+        if len(times) - responding < MIN_FIT_SAMPLES:
+            return dict(result, state='fitting', dead_time_s=round(dead_time, 1))
+
+        fit = fit_first_order(times[responding:] - times[responding], temps[responding:])
+        if fit is None:
+            return dict(result, state='fitting', dead_time_s=round(dead_time, 1))
+        plateau, time_constant, rmse = fit
+
+        # Time until the fitted curve enters the tolerance band (or None if its plateau falls short)
+        band_edge = setpoint - direction * self.tolerance
+        if direction * (temp - band_edge) >= 0:
+            eta = 0.0
+        elif direction * (plateau - band_edge) <= 0:
+            eta = None
+        else:
+            eta = time_constant * math.log((plateau - temp) / (plateau - band_edge))
+        excess = direction * (plateau - setpoint)
+        overshoot = max(0.0, excess) * min(1.0, dead_time / time_constant)
+
+        return dict(
+            result,
+            state='heating' if direction > 0 else 'cooling',
+            dead_time_s=round(dead_time, 1),
+            time_constant_s=round(time_constant, 1),
+            plateau=round(plateau, 2),
+            gain=round((plateau - temp0) / (setpoint - temp0), 3) if setpoint != temp0 else None,
+            eta_s=round(eta, 1) if eta is not None else None,
+            ready_at=now + eta if eta is not None else None,
+            overshoot=round(overshoot, 2),
+            fit_rmse=round(rmse, 3)
+        )
+
+
+def fit_first_order(t, y):
+    """Least-squares fit of y = plateau - b * exp(-t / time_constant) over TIME_CONSTANTS.
+    Returns (plateau, time_constant, rmse), or None if the data cannot constrain it."""
+    if len(t) > MAX_FIT_POINTS:
+        stride = math.ceil(len(t) / MAX_FIT_POINTS)
+        t, y = t[::stride], y[::stride]
+    # One row per candidate: regress y on exp(-t/tau); the slope is -b, the intercept the plateau
+    basis = np.exp(-t[np.newaxis, :] / TIME_CONSTANTS[:, np.newaxis])
+    basis_mean = basis.mean(axis=1, keepdims=True)
+    centred = basis - basis_mean
+    variance = (centred * centred).sum(axis=1)
+    y_centred = y - y.mean()
+    valid = variance > 1e-12
+    if not valid.any():
+        return None
+    slope = np.where(valid, (centred * y_centred).sum(axis=1) / np.where(valid, variance, 1.0), 0.0)
+    intercept = y.mean() - slope * basis_mean[:, 0]
+    residual = y[np.newaxis, :] - (intercept[:, np.newaxis] + slope[:, np.newaxis] * basis)
+    sse = np.where(valid, (residual * residual).sum(axis=1), np.inf)
+    best = int(np.argmin(sse))
+    return float(intercept[best]), float(TIME_CONSTANTS[best]), math.sqrt(sse[best] / len(t))
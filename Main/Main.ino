@@ -13,13 +13,20 @@ IPAddress serverIp(192, 168, 4, 120);     // Python server IP
 EthernetClient client;
 char incomingData[300]; // Buffer for receiving commands
 char outgoingJson[512]; // Buffer for sending JSON
+uint8_t statusFrame[30]; // Binary status frame, layout in ConnectionLayer.txt
 char buffer[100];
 
 
 unsigned long lastJsonSend = 0;
 unsigned long lastHeartbeat = 0;
 const unsigned long JSON_SEND_INTERVAL = 500; 
-const unsigned long HEARTBEAT_INTERVAL = 7000;
+const unsigned long MIN_STATUS_INTERVAL = 50;   // Fastest status rate SetTelemetry accepts
+unsigned long statusInterval = JSON_SEND_INTERVAL;
+bool binaryTelemetry = false;   // Set by SetTelemetry; every new connection starts in JSON
+uint16_t statusSequence = 0;
+const unsigned long HEARTBEAT_INTERVAL = 1000;  // The bridge PINGs every 250 ms
+const unsigned long RECONNECT_INTERVAL = 250;   // Minimum time between connection attempts
+const int MAX_LINES_PER_PASS = 16;              // Commands handled per loop() pass before heater/tape get a turn
 volatile bool eStopTriggered = false;
 bool eStopLedState = false;
 
@@ -76,38 +83,48 @@ void loop() {
     
     if (eStopTriggered || !EStopButton.State()) {
         emergencyStop();
-        // Send emergency stop status in JSON
-        sendStatusJson();
+        // Send emergency stop status
+        sendStatus();
         client.println("EMERGENCY STOPPED. Restart required.");
         
         while (true) {
             Serial.println("EMERGENCY STOPPED. Restart required.");
-            if (client.available()) {
+            // Drain everything that arrived during the delay so PINGs cannot pile up
+            while (client.available()) {
                 size_t len = client.readBytesUntil('\n', incomingData, sizeof(incomingData) - 1);
                 incomingData[len] = '\0';
-                if (String(incomingData) == "PING")
+                if (String(incomingData) == "PING") {
                     lastHeartbeat = millis();
+                    client.println("PONG");
+                }
             }
-            if (millis() - lastHeartbeat > HEARTBEAT_INTERVAL && checkTimer(lastConnectionAttempt, 5000)) {
+            if ((!client.connected() || millis() - lastHeartbeat > HEARTBEAT_INTERVAL) &&
+                checkTimer(lastConnectionAttempt, RECONNECT_INTERVAL)) {
                 connectToServer();
             }
-            sendStatusJson();
+            sendStatus();
             digitalWrite(EStopLed, eStopLedState);
             eStopLedState = !eStopLedState;
             delay(500);
         }
     }
     
-    // Check if heartbeat has expired (indicates disconnect)
-    if (millis() - lastHeartbeat > HEARTBEAT_INTERVAL && checkTimer(lastConnectionAttempt, 5000)) {
-        Serial.println("Heartbeat expired, attempting reconnection...");
+    // Reconnect as soon as the socket closes or the heartbeat expires (indicates a silent disconnect)
+    if ((!client.connected() || millis() - lastHeartbeat > HEARTBEAT_INTERVAL) &&
+        checkTimer(lastConnectionAttempt, RECONNECT_INTERVAL)) {
+        Serial.println("Link lost, attempting reconnection...");
         connectToServer();
     }
 
     // Only process data and send commands if heartbeat is recent (connected)
     if (millis() - lastHeartbeat <= HEARTBEAT_INTERVAL) {
-        // Read incoming commands
-        if (client.available()) {
+        // Read incoming commands: everything that has arrived (up to MAX_LINES_PER_PASS), not one line
+        // per 25 ms pass, so a backlog can't hold the PINGs past HEARTBEAT_INTERVAL. Any data at all
+        // shows the link is alive. A STOP ends the pass; the emergency loop takes over from there.
+        int lines = 0;
+        while (client.available() && lines < MAX_LINES_PER_PASS && !eStopTriggered) {
+            lastHeartbeat = millis();
+            lines++;
             size_t len = client.readBytesUntil('\n', incomingData, sizeof(incomingData) - 1);
             incomingData[len] = '\0';
             String cmd = String(incomingData);
@@ -119,9 +136,9 @@ void loop() {
             processCommand(cmd);
         }
 
-        // Send JSON status periodically
-        if (checkTimer(lastJsonSend, JSON_SEND_INTERVAL)) {
-            sendStatusJson();
+        // Send status periodically
+        if (checkTimer(lastJsonSend, statusInterval)) {
+            sendStatus();
         }
     }
 
@@ -145,7 +162,7 @@ void processCommand(String cmd) {
             client.println("OK");
         }
         else 
-            client.print("!!!WARNING!!! Nozzle Extended Will Not Move");
+            client.println("!!!WARNING!!! Nozzle Extended Will Not Move");
         
     }
     else if (cmd.startsWith("MoveY ")) {
@@ -157,7 +174,7 @@ void processCommand(String cmd) {
             client.println("OK");
         }
         else 
-            client.print("!!!WARNING!!! Nozzle Extended Will Not Move");
+            client.println("!!!WARNING!!! Nozzle Extended Will Not Move");
     }
     
     // Homing commands
@@ -168,7 +185,7 @@ void processCommand(String cmd) {
             client.println("Homing X axis");
         }
         else 
-            client.print("!!!WARNING!!! Nozzle Extended Will Not Move");
+            client.println("!!!WARNING!!! Nozzle Extended Will Not Move");
     }
     else if (cmd == "EnableY") {
         if (!getNozzleExtended()) {
@@ -177,7 +194,7 @@ void processCommand(String cmd) {
             client.println("Homing Y axis");
         }
         else 
-            client.print("!!!WARNING!!! Nozzle Extended Will Not Move");
+            client.println("!!!WARNING!!! Nozzle Extended Will Not Move");
     }
     
     // Motor disable commands
@@ -282,8 +299,28 @@ void processCommand(String cmd) {
         }
     }
 
+    // Status format: SetTelemetry {json|binary} [interval ms]
+    else if (cmd.startsWith("SetTelemetry ")) {
+        String args = cmd.substring(13);
+        int space = args.indexOf(' ');
+        String format = space > 0 ? args.substring(0, space) : args;
+        long interval = space > 0 ? args.substring(space + 1).toInt() : (long)JSON_SEND_INTERVAL;
+
+        if (format == "json" || format == "binary") {
+            binaryTelemetry = format == "binary";
+            statusInterval = interval > (long)MIN_STATUS_INTERVAL ? interval : MIN_STATUS_INTERVAL;
+            client.print("Telemetry ");
+            client.print(format);
+            client.print(" ");
+            client.println(statusInterval);
+        } else {
+            client.println("Invalid telemetry format");
+        }
+    }
+
     else if (cmd == "PING") {
           lastHeartbeat = millis();
+          client.println("PONG");
     }
     // Emergency stop
     else if (cmd == "STOP") {
@@ -366,6 +403,76 @@ void sendStatusJson() {
     Serial.println(outgoingJson);
 }
 
+void sendStatus() {
+    if (binaryTelemetry) {
+        sendStatusBinary();
+    } else {
+        sendStatusJson();
+    }
+}
+
+uint8_t motorStateCode(String state) {
+    // Index into the bridge's history.MOTOR_STATES
+    if (state == "MOTOR_ENABLING") return 1;
+    if (state == "MOTOR_READY") return 2;
+    if (state == "MOTOR_MOVING") return 3;
+    if (state == "MOTOR_FAULTED") return 4;
+    return 0;
+}
+
+uint16_t crc16(const uint8_t *data, size_t length) {
+    // CRC-16/CCITT-FALSE, matching binascii.crc_hqx(data, 0xFFFF) on the bridge
+    uint16_t crc = 0xFFFF;
+    for (size_t i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (int bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+void sendStatusBinary() {
+    if (!client.connected()) {
+        return;
+    }
+
+    uint8_t flags = 0;
+    if (getNozzleExtended()) flags |= 1;
+    if (getStageRetracted()) flags |= 2;
+    if (getStampExtended()) flags |= 4;
+    if (getNozzleVacuum()) flags |= 8;
+    if (getChuckVacuum()) flags |= 16;
+    if (eStopTriggered) flags |= 32;
+
+    float x = getXPosition();
+    float y = getYPosition();
+    int16_t tapeSpeed = getCurrentTapeSpeed();
+    int16_t tapeTorque = getCurrentTapeTorque();
+    float setTemp = getTargetTemperature();
+    float currentTemp = getThermistor();
+
+    // Little-endian like the Cortex-M4 itself, so fields are copied as they sit in memory
+    statusFrame[0] = 0xA5;
+    statusFrame[1] = 0x5A;
+    statusFrame[2] = 1;  // Layout version
+    statusFrame[3] = flags;
+    memcpy(&statusFrame[4], &x, 4);
+    memcpy(&statusFrame[8], &y, 4);
+    statusFrame[12] = motorStateCode(getMotorXStateString());
+    statusFrame[13] = motorStateCode(getMotorYStateString());
+    memcpy(&statusFrame[14], &tapeSpeed, 2);
+    memcpy(&statusFrame[16], &tapeTorque, 2);
+    memcpy(&statusFrame[18], &setTemp, 4);
+    memcpy(&statusFrame[22], &currentTemp, 4);
+    memcpy(&statusFrame[26], &statusSequence, 2);
+    uint16_t crc = crc16(statusFrame, 28);
+    memcpy(&statusFrame[28], &crc, 2);
+    statusSequence++;
+
+    client.write(statusFrame, sizeof(statusFrame));
+}
+
 bool checkTimer(unsigned long &lastTime, unsigned long duration) {
     if (millis() - lastTime >= duration) {
         lastTime = millis();
@@ -381,6 +488,9 @@ bool connectToServer() {
     if (client.connect(serverIp, SERVER_PORT)) {
         Serial.println("Connected to server!");
         lastHeartbeat = millis(); // Reset heartbeat on successful connection
+        binaryTelemetry = false;  // The bridge may not speak binary; it asks again if it does
+        statusInterval = JSON_SEND_INTERVAL;
+        sendStatusJson();         // Let the bridge re-sync without waiting for the next interval
         return true;
     } else {
         Serial.println("Connection failed. Will retry...");